@@ -1,82 +1,62 @@
 from final_utils import *
 import time
 import numpy as np
+from rolling_stats import RollingStats
+from multi_leg import MultiLegExecutor
+from position_book import PositionBook, LONG_RITC, SHORT_RITC
+from nav_engine import current_nav
 
 class StatArbTrader:
     def __init__(self):
-        # self.positions = []
-        self.positions = None
+        # Many small concurrent positions, marked together each tick
+        self.positions = PositionBook()
+        self.max_positions = 5
+        self.profit_threshold = 10  # CAD per position
         self.dev_window = 30
-        self.recent_devs = []
+        # Short/long spreads tracked together: O(1) per tick for every window
+        self.stat_windows = (self.dev_window, 120, 600)
+        self.stat_spans = (20, 100)
+        self.spread_stats = RollingStats(self.stat_windows, self.stat_spans, width=2)
+        self.entry_z = None         # e.g. 2.0 to enter on z-score instead of fixed spread
+        self.z_window = self.dev_window
         self.max_size = 1000
         self.max_hold_time = 300    # 5 minutes
         self.pnl = 0.0
         self.closed_trades = []
+        self.executor = MultiLegExecutor("StatArb")
 
     def get_market_data(self):
-        """Get current prices and calculate two log-ratio spreads (short and long)"""
-        bull_bid, bull_ask, _, _ = best_bid_ask(BULL)
-        bear_bid, bear_ask, _, _ = best_bid_ask(BEAR)
-        ritc_bid, ritc_ask, _, _ = best_bid_ask(RITC)
-        usd_bid, usd_ask, _, _ = best_bid_ask(USD)
-
-        if not all([bull_bid > 0, bear_bid > 0, ritc_bid > 0, usd_bid > 0]):
+        """Current NAV view: touch prices plus the short and long spreads
+        (short: ETF at ask vs basket at bid; long: ETF at bid vs basket at ask)"""
+        data = current_nav()
+        if not data['valid']:
             return None
-
-        # Short spread: short ETF (pay ask), long basket (buy at bid)
-        etf_cad_short = ritc_ask * usd_ask
-        basket_cad_short = bull_bid + bear_bid
-        spread_short = etf_cad_short - basket_cad_short
-
-        # Long spread: long ETF (sell at bid), short basket (sell at ask)
-        etf_cad_long = ritc_bid * usd_bid
-        basket_cad_long = bull_ask + bear_ask
-        spread_long = etf_cad_long - basket_cad_long
-
-        return {
-            'spread_short': spread_short,
-            'spread_long': spread_long,
-            'bull_bid': bull_bid, 'bull_ask': bull_ask,
-            'bear_bid': bear_bid, 'bear_ask': bear_ask,
-            'ritc_bid': ritc_bid, 'ritc_ask': ritc_ask,
-            'usd_bid': usd_bid, 'usd_ask': usd_ask
-        }
+        return data
 
     def update_spread_history(self, spread_short, spread_long):
-        self.recent_devs.append((spread_short, spread_long))
-        if len(self.recent_devs) > self.dev_window:
-            self.recent_devs.pop(0)
+        self.spread_stats.update((spread_short, spread_long))
 
-    def calc_mean_std(self):
-        # if len(self.recent_devs) < 20:
-        #     return None, None, None, None
-        arr = np.array(self.recent_devs)
-        mean_short = np.mean(arr[:,0])
-        std_short = np.std(arr[:,0])
-        mean_long = np.mean(arr[:,1])
-        std_long = np.std(arr[:,1])
+    def calc_mean_std(self, window=None, span=None):
+        # Defaults to the dev_window rolling window; pass span= for an EWMA
+        window = self.dev_window if window is None and span is None else window
+        mean_short, mean_long = self.spread_stats.mean(window, span)
+        std_short, std_long = self.spread_stats.std(window, span)
         return mean_short, std_short, mean_long, std_long
 
-    def enter_position(self, size, direction):
-        entry_trades = {}
+    def spread_zscores(self, window=None, span=None):
+        z_short, z_long = self.spread_stats.zscore(window=window, span=span)
+        return z_short, z_long
+
+    def enter_position(self, size, direction, data=None):
+        # All four legs go out concurrently; on a failed leg the executor
+        # unwinds the filled ones and returns None.
+        data = data or self.get_market_data()
+        if not data:
+            return False
         try:
-            if direction == "SHORT":
-                etf = place_mkt(RITC, "SELL", size)
-                if not etf: return False
-                usd = place_mkt(USD, "SELL", etf['vwap'] * size)
-                bull = place_mkt(BULL, "BUY", size)
-                bear = place_mkt(BEAR, "BUY", size)
-                if not (usd and bull and bear): return False
-                entry_trades = {'etf': etf, 'usd': usd, 'bull': bull, 'bear': bear}
-            else:
-                bull = place_mkt(BULL, "SELL", size)
-                bear = place_mkt(BEAR, "SELL", size)
-                if not (bull and bear): return False
-                etf = place_mkt(RITC, "BUY", size)
-                if not etf: return False
-                usd = place_mkt(USD, "BUY", etf['vwap'] * size)
-                if not usd: return False
-                entry_trades = {'etf': etf, 'usd': usd, 'bull': bull, 'bear': bear}
+            ritc_action = "SELL" if direction == "SHORT" else "BUY"
+            entry_trades = self.executor.execute_etf_arb(ritc_action, size, data, names=('etf', 'usd', 'bull', 'bear'))
+            if not entry_trades: return False
             position = {
                 'direction': direction,
                 'size': size,
@@ -85,8 +65,12 @@ class StatArbTrader:
             }
             print(entry_trades)
 
-            self.positions = position
+            self.positions.add(SHORT_RITC if direction == "SHORT" else LONG_RITC, size, entry_trades,
+                               entry_time=position['entry_time'], meta=position,
+                               names=('etf', 'usd', 'bull', 'bear'))
             print(f"StatArb: {direction} {size} shares")
+            record_event('decision', {'strategy': 'stat_arb', 'direction': direction, 'size': size,
+                                      'spread_short': data['spread_short'], 'spread_long': data['spread_long']})
             return True
         except Exception as e:
             print(f"Entry error: {e}")
@@ -112,81 +96,28 @@ class StatArbTrader:
 
     #     return False, None
     
-    def should_exit(self, pos, data, mean_short, std_short, mean_long, std_long):
-        holding_time = time.time() - pos['entry_time']
-        profit_threshold = 10  # Set your profit threshold here
-
-        # Calculate current market exit prices (simulate closing the position now)
-        size = pos['size']
-        direction = pos['direction']
-        entry = pos['entry_trades']
-
-        if direction == "SHORT":
-            # Simulate closing SHORT: buy ETF at ask, buy USD at ask, sell BULL/Bear at bid
-            etf_exit_price = data['ritc_ask']
-            usd_exit_price = data['usd_ask']
-            bull_exit_price = data['bull_bid']
-            bear_exit_price = data['bear_bid']
-
-            etf_pnl = (entry['etf']['vwap'] - etf_exit_price) * size * entry['usd']['vwap']
-            bull_pnl = (bull_exit_price - entry['bull']['vwap']) * size
-            bear_pnl = (bear_exit_price - entry['bear']['vwap']) * size
-        else:
-            # Simulate closing LONG: sell ETF at bid, sell USD at bid, buy BULL/Bear at ask
-            etf_exit_price = data['ritc_bid']
-            usd_exit_price = data['usd_bid']
-            bull_exit_price = data['bull_ask']
-            bear_exit_price = data['bear_ask']
-
-            etf_pnl = (etf_exit_price - entry['etf']['vwap']) * size * entry['usd']['vwap']
-            bull_pnl = (entry['bull']['vwap'] - bull_exit_price) * size
-            bear_pnl = (entry['bear']['vwap'] - bear_exit_price) * size
-
-        total_pnl = etf_pnl + bull_pnl + bear_pnl
-        total_pnl -= size * 0.06  # fees
-
-        print(total_pnl)
-        if total_pnl > profit_threshold:
-            print(f"[EXIT PROFIT] {direction} PnL: {total_pnl:.2f} > {profit_threshold}")
-            return True, "profit"
-
-        # Existing mean reversion logic
-        # if direction == "SHORT":
-        #     current_spread = data['spread_short']
-        #     if current_spread <= mean_short + std_short:
-        #         print(f"[SELLING SHORT] {mean_short} {std_short}", current_spread)
-        #         return True, "mean_reversion"
-        # else:
-        #     current_spread = data['spread_long']
-        #     if current_spread >= mean_long - std_long:
-        #         print(f"[SELLING long] {mean_long} {std_long}", current_spread)
-        #         return True, "mean_reversion"
-
-        if holding_time > self.max_hold_time:
-            return True, 'time'
-        
-        return False, None
-
-    def exit_position(self, pos, direction):
+    def check_exits(self, data):
+        """Mark every open position against this tick's prices in one pass and
+        return [(slot, reason)] for those hitting profit / time exits."""
+        marks = self.positions.mark(data)
+        slots, reasons = self.positions.exit_signals(marks, profit_target=self.profit_threshold,
+                                                     max_hold_time=self.max_hold_time)
+        for slot, reason in zip(slots, reasons):
+            if reason == 'profit':
+                print(f"[EXIT PROFIT] slot {slot} PnL: {marks[slot]:.2f} > {self.profit_threshold}")
+        # Mean reversion exits (disabled) would compare data['spread_short'] /
+        # data['spread_long'] against calc_mean_std() here.
+        return list(zip(slots, reasons))
+
+    def exit_position(self, pos, direction, data=None):
         size = pos['size']
-        exit_trades = {}
+        data = data or self.get_market_data()
+        if not data:
+            return False
         try:
-            if direction == "SHORT":
-                etf = place_mkt(RITC, "BUY", size)
-                if not etf: return False
-                usd = place_mkt(USD, "BUY", etf['vwap'] * size)
-                bull = place_mkt(BULL, "SELL", size)
-                bear = place_mkt(BEAR, "SELL", size)
-                if not (usd and bull and bear): return False
-                exit_trades = {'etf': etf, 'usd': usd, 'bull': bull, 'bear': bear}
-            else:
-                etf = place_mkt(RITC, "SELL", size)
-                if not etf: return False
-                usd = place_mkt(USD, "SELL", etf['vwap'] * size)
-                bull = place_mkt(BULL, "BUY", size)
-                bear = place_mkt(BEAR, "BUY", size)
-                if not (usd and bull and bear): return False
-                exit_trades = {'etf': etf, 'usd': usd, 'bull': bull, 'bear': bear}
+            ritc_action = "BUY" if direction == "SHORT" else "SELL"
+            exit_trades = self.executor.execute_etf_arb(ritc_action, size, data, names=('etf', 'usd', 'bull', 'bear'))
+            if not exit_trades: return False
             
             print(exit_trades)
             pos['exit_trades'] = exit_trades
@@ -216,10 +147,9 @@ class StatArbTrader:
             return
 
         data = self.get_market_data()
-        print(data['spread_short'], data['spread_long'])
-
         if not data:
             return
+        print(data['spread_short'], data['spread_long'])
 
         self.update_spread_history(data['spread_short'], data['spread_long'])
         mean_short, std_short, mean_long, std_long = self.calc_mean_std()
@@ -227,31 +157,34 @@ class StatArbTrader:
         #     return
 
         # Manage existing positions
-        # for pos in self.positions[:]:
-        if self.positions:
-            pos = self.positions
-            should_exit, reason = self.should_exit(pos, data, mean_short, std_short, mean_long, std_long)
-            if should_exit:
-                direction = pos['direction']
-                if self.exit_position(pos, direction):
-                    holding_time = int(time.time() - pos['entry_time'])
-                    pnl = self.calculate_pnl(pos)
-                    self.pnl += pnl
-                    self.closed_trades.append({'pnl': pnl, 'reason': reason, 'hold': holding_time})
-                    print(f"StatArb: CLOSED {direction} after {holding_time}s ({reason}) | PnL: {pnl:.2f} | Total: {self.pnl:.2f}")
-                    self.positions = None
-
-        # Enter new position if none active
-        # if len(self.positions) == 0:
-
-        if not self.positions:
-            size = 5000  # or self.max_size
+        for slot, reason in self.check_exits(data):
+            pos = self.positions.meta[slot]
+            direction = pos['direction']
+            if self.exit_position(pos, direction, data):
+                holding_time = int(time.time() - pos['entry_time'])
+                pnl = self.calculate_pnl(pos)
+                self.pnl += pnl
+                self.closed_trades.append({'pnl': pnl, 'reason': reason, 'hold': holding_time})
+                print(f"StatArb: CLOSED {direction} after {holding_time}s ({reason}) | PnL: {pnl:.2f} | Total: {self.pnl:.2f}")
+                self.positions.close(slot)
+
+        # Enter a new position while below the concurrent position cap
+        if len(self.positions) < self.max_positions:
+            size = self.max_size
+
+            if self.entry_z is not None and self.spread_stats.ready(self.z_window):
+                z_short, z_long = self.spread_zscores(window=self.z_window)
+                enter_short = z_short >= self.entry_z
+                enter_long = z_long <= -self.entry_z
+            else:
+                enter_short = data['spread_short'] >= 0.5
+                enter_long = data['spread_long'] <= -0.5
             
             # if data['spread_short'] >= mean_short + 2 * std_short:
-            if data['spread_short'] >= 0.5:
+            if enter_short:
                 # print(f"[SHORT] sprea{mean_short} {std_short}", data['spread_short'])
-                self.enter_position(size, "SHORT")
+                self.enter_position(size, "SHORT", data)
             # elif data['spread_long'] <= mean_long - 2 * std_long:
-            elif data['spread_long'] <= -0.5:
+            elif enter_long:
                 # print(f"[LONG] {mean_long} {std_long}", data['spread_short'])
-                self.enter_position(size, "LONG")
+                self.enter_position(size, "LONG", data)
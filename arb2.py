@@ -2,11 +2,15 @@
 from final_utils import *
 import time
 import numpy as np
+from multi_leg import MultiLegExecutor
+from position_book import PositionBook, LONG_RITC, SHORT_RITC
+from sizing import size_etf_arbitrage, current_books
+from nav_engine import current_nav
 
 class ETFArbitrageTrader:
     def __init__(self):
-        # Position tracking
-        self.positions = []
+        # Position tracking (column-wise book, marked in one vectorized pass)
+        self.positions = PositionBook()
         self.pnl = 0.0
         self.total_trades = 0
         self.successful_arbs = 0
@@ -20,121 +24,65 @@ class ETFArbitrageTrader:
         
         # Risk management
         self.max_hold_time = 240          # 4 minutes max hold
-        self.stop_loss_pct = 0.02         # 2% stop loss
+        self.stop_loss_pct = 0.02         # 2% of the position's notional
         
         # Tender offer tracking
         self.last_tender_check = 0
         self.tender_check_interval = 5    # Check every 5 seconds
+
+        # Concurrent four-leg execution with unwind + slippage reporting
+        self.executor = MultiLegExecutor("ETFArb")
         
     def get_current_prices(self):
-        """Get current bid/ask prices for all securities"""
+        """Current NAV view: touch prices for all securities plus fair value and edges"""
         try:
-            bull_bid, bull_ask, _, _ = best_bid_ask(BULL)
-            bear_bid, bear_ask, _, _ = best_bid_ask(BEAR) 
-            ritc_bid, ritc_ask, _, _ = best_bid_ask(RITC)
-            usd_bid, usd_ask, _, _ = best_bid_ask(USD)
-            
-            # Validate all prices are positive
-            if not all(p > 0 for p in [bull_bid, bull_ask, bear_bid, bear_ask, 
-                                      ritc_bid, ritc_ask, usd_bid, usd_ask]):
-                return None
-                
-            return {
-                'bull_bid': bull_bid, 'bull_ask': bull_ask,
-                'bear_bid': bear_bid, 'bear_ask': bear_ask,
-                'ritc_bid': ritc_bid, 'ritc_ask': ritc_ask,
-                'usd_bid': usd_bid, 'usd_ask': usd_ask
-            }
+            prices = current_nav()
+            # Validate all prices are present
+            return prices if prices['valid'] else None
         except Exception as e:
             print(f"Error getting prices: {e}")
             return None
     
     def calculate_arbitrage_opportunity(self, prices):
         """Calculate potential arbitrage opportunities"""
-        # Fair value of RITC = (BULL + BEAR) / USD_rate
-        
         # Scenario 1: Buy RITC, Sell BULL+BEAR (RITC undervalued)
-        # Cost: RITC_ask * USD_ask + transaction fees
-        # Revenue: BULL_bid + BEAR_bid - transaction fees
-        ritc_cost_cad = prices['ritc_ask'] * prices['usd_ask']
-        basket_revenue_cad = prices['bull_bid'] + prices['bear_bid']
-        buy_ritc_profit = basket_revenue_cad - ritc_cost_cad - (3 * self.transaction_fee)
-        
-        # Scenario 2: Sell RITC, Buy BULL+BEAR (RITC overvalued)  
-        # Revenue: RITC_bid * USD_bid - transaction fees
-        # Cost: BULL_ask + BEAR_ask + transaction fees
-        ritc_revenue_cad = prices['ritc_bid'] * prices['usd_bid']
-        basket_cost_cad = prices['bull_ask'] + prices['bear_ask']
-        sell_ritc_profit = ritc_revenue_cad - basket_cost_cad - (3 * self.transaction_fee)
-        
+        # Scenario 2: Sell RITC, Buy BULL+BEAR (RITC overvalued)
+        # Both are executable top-of-book edges net of 3 legs of fees (NAV engine)
         return {
-            'buy_ritc_profit': buy_ritc_profit,
-            'sell_ritc_profit': sell_ritc_profit,
-            'ritc_fair_value': (prices['bull_bid'] + prices['bull_ask'] + 
-                               prices['bear_bid'] + prices['bear_ask']) / (4 * prices['usd_ask']),
-            'ritc_mid': (prices['ritc_bid'] + prices['ritc_ask']) / 2
+            'buy_ritc_profit': prices['buy_ritc_edge'],
+            'sell_ritc_profit': prices['sell_ritc_edge'],
+            'ritc_fair_value': prices['ritc_fair_usd'],
+            'ritc_mid': prices['micro']['ritc']
         }
     
-    def check_position_limits(self, trade_size):
-        """Check if trade would exceed position limits"""
+    def size_trade(self, direction):
+        """Quantity maximizing total net profit across the full depth of all
+        four books (one vectorized pass), capped by max_position_size"""
+        best = size_etf_arbitrage(current_books(), direction, positions_map(),
+                                  max_qty=self.max_position_size)
+        print(f"Sizing {direction}: {best['quantity']} shares, expected {best['profit']:.2f} CAD")
+        return best['quantity'] if best['profit'] > 0 else 0
+    
+    def check_position_limits(self, trade_size, direction='BUY_RITC'):
+        """Check if trade would exceed position limits (the installed risk
+        engine: current positions, resting orders and RITC counted double,
+        O(1); positions from the snapshot / API until it is synced)"""
         try:
-            # Get current positions
-            bull_pos = get_position(BULL)
-            bear_pos = get_position(BEAR)  
-            ritc_pos = get_position(RITC)
-            
-            # RITC positions count double toward limits
-            effective_ritc_pos = ritc_pos * 2
-            
-            # Calculate gross and net limits after proposed trade
-            current_gross = abs(bull_pos) + abs(bear_pos) + abs(effective_ritc_pos)
-            current_net = bull_pos + bear_pos + effective_ritc_pos
-            
-            # Check if adding trade_size would exceed limits
-            new_gross = current_gross + (trade_size * 3)  # 3 securities involved
-            new_net = abs(current_net + trade_size * 2)   # Net impact
-            
+            sign = 1 if direction == 'BUY_RITC' else -1
             # Use buffer to stay within limits
-            return (new_gross < get_gross_limit() * self.position_limit_buffer and
-                    new_net < get_net_limit() * self.position_limit_buffer)
-        except:
+            return get_position_limits_impact(sign * trade_size, -sign * trade_size, -sign * trade_size,
+                                              buffer=self.position_limit_buffer)
+        except Exception as e:
+            print(f"Error checking limits: {e}")
             return False
     
     def execute_buy_ritc_arbitrage(self, trade_size, prices):
-        """Execute arbitrage: Buy RITC, Sell BULL+BEAR"""
-        trades = {}
+        """Execute arbitrage: Buy RITC (+USD), Sell BULL+BEAR, all legs concurrently"""
         try:
             print(f"Executing BUY RITC arbitrage for {trade_size} shares")
-            
-            # Step 1: Buy RITC
-            ritc_order = place_mkt(RITC, "BUY", trade_size)
-            if not ritc_order:
-                print("Failed to buy RITC")
-                return None
-            trades['ritc'] = ritc_order
-            
-            # Step 2: Buy USD for RITC purchase
-            usd_needed = ritc_order['vwap'] * trade_size
-            usd_order = place_mkt(USD, "BUY", usd_needed)
-            if not usd_order:
-                print("Failed to buy USD")
-                return None
-            trades['usd'] = usd_order
-            
-            # Step 3: Sell BULL
-            bull_order = place_mkt(BULL, "SELL", trade_size)
-            if not bull_order:
-                print("Failed to sell BULL")
-                return None
-            trades['bull'] = bull_order
-            
-            # Step 4: Sell BEAR
-            bear_order = place_mkt(BEAR, "SELL", trade_size)
-            if not bear_order:
-                print("Failed to sell BEAR") 
-                return None
-            trades['bear'] = bear_order
-            
+            trades = self.executor.execute_etf_arb("BUY", trade_size, prices)
+            if not trades:
+                print("BUY RITC arbitrage failed, filled legs unwound")
             return trades
             
         except Exception as e:
@@ -142,40 +90,12 @@ class ETFArbitrageTrader:
             return None
     
     def execute_sell_ritc_arbitrage(self, trade_size, prices):
-        """Execute arbitrage: Sell RITC, Buy BULL+BEAR"""
-        trades = {}
+        """Execute arbitrage: Sell RITC (+USD), Buy BULL+BEAR, all legs concurrently"""
         try:
             print(f"Executing SELL RITC arbitrage for {trade_size} shares")
-            
-            # Step 1: Sell RITC
-            ritc_order = place_mkt(RITC, "SELL", trade_size)
-            if not ritc_order:
-                print("Failed to sell RITC")
-                return None
-            trades['ritc'] = ritc_order
-            
-            # Step 2: Sell USD from RITC sale
-            usd_received = ritc_order['vwap'] * trade_size
-            usd_order = place_mkt(USD, "SELL", usd_received)
-            if not usd_order:
-                print("Failed to sell USD")
-                return None
-            trades['usd'] = usd_order
-            
-            # Step 3: Buy BULL
-            bull_order = place_mkt(BULL, "BUY", trade_size)
-            if not bull_order:
-                print("Failed to buy BULL")
-                return None
-            trades['bull'] = bull_order
-            
-            # Step 4: Buy BEAR
-            bear_order = place_mkt(BEAR, "BUY", trade_size)
-            if not bear_order:
-                print("Failed to buy BEAR")
-                return None
-            trades['bear'] = bear_order
-            
+            trades = self.executor.execute_etf_arb("SELL", trade_size, prices)
+            if not trades:
+                print("SELL RITC arbitrage failed, filled legs unwound")
             return trades
             
         except Exception as e:
@@ -290,76 +210,41 @@ class ETFArbitrageTrader:
         except Exception as e:
             print(f"Error accepting tender: {e}")
     
-    def manage_existing_positions(self):
-        """Manage and potentially close existing positions"""
-        for position in self.positions[:]:  # Use slice to avoid modification during iteration
-            hold_time = time.time() - position['entry_time']
-            
-            # Time-based exit
-            if hold_time > self.max_hold_time:
-                self.close_position(position, "time_limit")
-                continue
-                
-            # P&L based exit (if position can be marked to market)
-            try:
-                current_pnl = self.estimate_current_pnl(position)
-                if current_pnl < -position['size'] * self.stop_loss_pct:
-                    self.close_position(position, "stop_loss")
-                    continue
-            except:
-                pass
+    def manage_existing_positions(self, prices=None):
+        """Mark every open position against one price snapshot in a single
+        vectorized pass and close those hitting time / stop-loss exits"""
+        if not len(self.positions):
+            return
+        prices = prices or self.get_current_prices()
+        if not prices:
+            return
+
+        # Stop on the move since entry; the closing cost is paid either way
+        marks = self.positions.mark(prices, exit_costs=False)
+        slots, reasons = self.positions.exit_signals(marks, stop_loss_pct=self.stop_loss_pct,
+                                                     max_hold_time=self.max_hold_time)
+        for slot, reason in zip(slots, reasons):
+            self.close_position(slot, 'time_limit' if reason == 'time' else reason, prices)
     
-    def estimate_current_pnl(self, position):
-        """Estimate current mark-to-market P&L of position"""
-        try:
-            prices = self.get_current_prices()
-            if not prices:
-                return 0.0
-                
-            size = position['size']
-            direction = position['direction']
-            entry_trades = position['trades']
-            
-            if direction == "BUY_RITC":
-                # Current value of BULL+BEAR we sold
-                current_basket_value = (prices['bull_bid'] + prices['bear_bid']) * size
-                # Current cost to buy back RITC 
-                current_ritc_cost = prices['ritc_ask'] * prices['usd_ask'] * size
-                # Original cost we paid for RITC
-                original_ritc_cost = entry_trades['ritc']['vwap'] * entry_trades['usd']['vwap'] * size
-                # Original revenue from selling BULL+BEAR
-                original_basket_revenue = (entry_trades['bull']['vwap'] + entry_trades['bear']['vwap']) * size
-                
-                # P&L = (current_basket_value - original_basket_revenue) - (current_ritc_cost - original_ritc_cost)
-                unrealized_pnl = (current_basket_value - original_basket_revenue) - (current_ritc_cost - original_ritc_cost)
-                
-            else:  # SELL_RITC
-                # Current value of RITC we sold
-                current_ritc_value = prices['ritc_bid'] * prices['usd_bid'] * size
-                # Current cost to buy back BULL+BEAR
-                current_basket_cost = (prices['bull_ask'] + prices['bear_ask']) * size
-                # Original revenue from selling RITC
-                original_ritc_revenue = entry_trades['ritc']['vwap'] * entry_trades['usd']['vwap'] * size
-                # Original cost we paid for BULL+BEAR
-                original_basket_cost = (entry_trades['bull']['vwap'] + entry_trades['bear']['vwap']) * size
-                
-                # P&L = (original_ritc_revenue - current_ritc_value) - (current_basket_cost - original_basket_cost)
-                unrealized_pnl = (original_ritc_revenue - current_ritc_value) - (current_basket_cost - original_basket_cost)
-            
-            return unrealized_pnl
-            
-        except Exception as e:
-            print(f"Error estimating P&L: {e}")
-            return 0.0
+    def estimate_current_pnl(self, prices):
+        """Mark-to-market P&L of every open position (array indexed by slot)"""
+        return self.positions.mark(prices)
     
-    def close_position(self, position, reason):
-        """Close an existing position"""
+    def close_position(self, slot, reason, prices):
+        """Close an open position by reversing all four legs"""
         try:
-            # This would reverse the original trades
-            # Implementation depends on position tracking structure
-            pnl = self.calculate_position_pnl(position)
+            position = self.positions.meta[slot]
+            ritc_action = "SELL" if position['direction'] == 'BUY_RITC' else "BUY"
+            exit_trades = self.executor.execute_etf_arb(ritc_action, position['size'], prices)
+            if not exit_trades:
+                print(f"Failed to close position ({reason}), will retry")
+                return
+            # Realized P&L: mark the slot at the actual exit fills
+            fills = {f"{name}_{side}": exit_trades[name]['vwap']
+                     for name in ('ritc', 'usd', 'bull', 'bear') for side in ('bid', 'ask')}
+            pnl = self.positions.mark(fills)[slot]
             self.pnl += pnl
-            self.positions.remove(position)
+            self.positions.close(slot)
             print(f"Closed position: {reason}, P&L: {pnl:.2f}")
         except Exception as e:
             print(f"Error closing position: {e}")
@@ -377,7 +262,7 @@ class ETFArbitrageTrader:
                 return
             
             # Manage existing positions
-            self.manage_existing_positions()
+            self.manage_existing_positions(prices)
             
             # Check for tender offers
             self.check_tender_offers()
@@ -385,12 +270,10 @@ class ETFArbitrageTrader:
             # Look for new arbitrage opportunities
             arb_opps = self.calculate_arbitrage_opportunity(prices)
             
-            # Determine trade size (start smaller, can increase based on performance)
-            base_trade_size = min(1000, self.max_position_size)
-            
-            # Execute arbitrage if profitable
+            # Execute arbitrage if profitable; size from full depth, not top-of-book
             if arb_opps['buy_ritc_profit'] > self.min_profit_threshold:
-                if self.check_position_limits(base_trade_size):
+                base_trade_size = self.size_trade('BUY_RITC')
+                if base_trade_size > 0 and self.check_position_limits(base_trade_size):
                     trades = self.execute_buy_ritc_arbitrage(base_trade_size, prices)
                     if trades:
                         position = {
@@ -399,12 +282,16 @@ class ETFArbitrageTrader:
                             'entry_time': time.time(),
                             'trades': trades
                         }
-                        self.positions.append(position)
+                        self.positions.add(LONG_RITC, base_trade_size, trades,
+                                           entry_time=position['entry_time'], meta=position)
                         self.successful_arbs += 1
                         print(f"Opened BUY_RITC position, expected profit: {arb_opps['buy_ritc_profit']:.2f}")
+                        record_event('decision', {'strategy': 'etf_arb', 'direction': 'BUY_RITC', 'size': base_trade_size,
+                                                  'edge': arb_opps['buy_ritc_profit']})
                         
             elif arb_opps['sell_ritc_profit'] > self.min_profit_threshold:
-                if self.check_position_limits(base_trade_size):
+                base_trade_size = self.size_trade('SELL_RITC')
+                if base_trade_size > 0 and self.check_position_limits(base_trade_size, 'SELL_RITC'):
                     trades = self.execute_sell_ritc_arbitrage(base_trade_size, prices)
                     if trades:
                         position = {
@@ -413,9 +300,12 @@ class ETFArbitrageTrader:
                             'entry_time': time.time(),
                             'trades': trades
                         }
-                        self.positions.append(position)
+                        self.positions.add(SHORT_RITC, base_trade_size, trades,
+                                           entry_time=position['entry_time'], meta=position)
                         self.successful_arbs += 1
                         print(f"Opened SELL_RITC position, expected profit: {arb_opps['sell_ritc_profit']:.2f}")
+                        record_event('decision', {'strategy': 'etf_arb', 'direction': 'SELL_RITC', 'size': base_trade_size,
+                                                  'edge': arb_opps['sell_ritc_profit']})
             
             # Print status occasionally
             self.total_trades += 1
@@ -0,0 +1,216 @@
+# PARALLEL TENDER BACKTESTER
+# Every distinct tender in every recorded session is priced with
+# EvaluateTendersNew.evaluate_tender_profit() against the books it arrived
+# with, then accepted on a PaperBroker and unwound through the following
+# recorded books with the evaluator's tunables: each snapshot takes up to
+# MIN_CHUNK RITC within SLIPPAGE_TOLERANCE of the tender price, then up to
+# MIN_CHUNK more through BULL / BEAR and the converter when their touch beats
+# the tender price by REQUIRED_PROFIT_MARGIN after fees (the two legs of the
+# live unwind loop). A chunk crosses at market after PATIENCE_WINDOW_SECONDS
+# ticks without progress, and whatever is left after UNWIND_HORIZON_TICKS
+# (or at the end of the session / period) crosses too. Simulated PnL is the paper account marked at the final mids.
+# Sessions are split into shards and run on a process pool; every row is a
+# pure function of (session, tender), rows come back sorted and the digest
+# covers everything but the timings, so two runs compare line for line.
+
+import hashlib
+import functools
+import contextlib
+import multiprocessing as mp
+from final_utils import *
+from replay import snapshot_paths, load_snapshots, in_time_order, with_flow, as_live, PaperBroker
+from recorder import recorded_snapshots
+import tender_eval
+from tender_eval import EvaluateTendersNew
+
+BACKTEST_SESSIONS = ("output/*.pkl",)   # Glob per session: *.pkl recordings or recorder *.rec segments
+BACKTEST_WORKERS = None      # Pool size; None = every core
+UNWIND_HORIZON_TICKS = 30    # Ticks of patience before the remainder crosses at market
+RESULT_COLUMNS = ('session', 'tender_id', 'tick', 'action', 'quantity', 'price', 'predicted', 'accept',
+                  'simulated', 'right', 'unwound_at_limit', 'converted', 'unwind_ticks')
+TIMING_COLUMNS = ('eval_ms', 'unwind_ms')
+
+
+def session_snapshots(source):
+    """A recorded session as time-ordered snapshots with implied flow."""
+    snaps = recorded_snapshots(source) if source.endswith('.rec') else load_snapshots(snapshot_paths(source))
+    return list(with_flow(in_time_order(snaps)))
+
+
+@functools.lru_cache(maxsize=4)
+def cached_session(source):
+    """session_snapshots() kept per worker process, so repeated tasks over
+    the same session (parameter sweeps) load it once. Treat as read-only."""
+    return session_snapshots(source)
+
+
+def session_tenders(snaps):
+    """(snapshot number, tender) for each distinct RITC tender, by arrival."""
+    seen, out = set(), []
+    for n, snap in enumerate(snaps):
+        tender = snap.get('tender') or {}
+        if tender.get('ticker') == RITC and tender['tender_id'] not in seen:
+            seen.add(tender['tender_id'])
+            out.append((n, tender))
+    return out
+
+
+def predict(snap, evaluator):
+    """evaluate_tender_profit() on the arrival books (installed as the live snapshot)."""
+    set_snapshot(as_live(snap, {}))
+    try:
+        return evaluator.evaluate_tender_profit()
+    finally:
+        clear_snapshot()
+
+
+def _convert_step(broker, side, qty, tender, margin):
+    """Unwind up to qty RITC through the stock legs and a converter lease if
+    the touch beats the tender price by `margin` after fees; returns shares
+    converted."""
+    ex = broker.exchange
+    usd_bid, usd_ask = ex._touch(USD)
+    bull_bid, bull_ask = ex._touch(BULL)
+    bear_bid, bear_ask = ex._touch(BEAR)
+    per_share_fee = CONVERTER_COST / CONVERTER_BATCH * (usd_ask or 1.0)
+    if side == 'BUY':   # Short RITC: buy both stocks, create RITC
+        ok = bull_ask and bear_ask and bull_ask + bear_ask + 2 * FEE_MKT + per_share_fee + margin <= tender['price'] * usd_ask
+        book = 'asks'
+    else:               # Long RITC: sell both stocks, redeem RITC
+        ok = bull_bid and bear_bid and bull_bid + bear_bid - 2 * FEE_MKT - per_share_fee - margin >= tender['price'] * usd_bid
+        book = 'bids'
+    if not ok:
+        return 0
+    qty = int(min([qty] + [ex.books[t][book][0]['quantity'] - ex.books[t][book][0]['quantity_filled']
+                           for t in (BULL, BEAR)]))
+    if qty <= 0:
+        return 0
+    bull = broker.place_mkt(BULL, side, qty).get('quantity_filled', 0)
+    bear = broker.place_mkt(BEAR, side, qty).get('quantity_filled', 0)
+    qty = int(min(bull, bear))
+    if qty <= 0:
+        return 0
+    lease = ex.post_lease({'ticker': 'ETF-Creation' if side == 'BUY' else 'ETF-Redemption'})
+    fee = int(CONVERTER_COST * qty // CONVERTER_BATCH)
+    legs = {'from1': BULL, 'quantity1': qty, 'from2': BEAR, 'quantity2': qty} if side == 'BUY' else \
+        {'from1': RITC, 'quantity1': qty}
+    ex.use_lease(dict(legs, from3=USD, quantity3=fee), lease['id'])
+    return qty
+
+
+def simulate_unwind(snaps, n, evaluator, chunk=None, horizon=None):
+    """Accept the evaluator's tender at snapshot n on a fresh paper account
+    and unwind the RITC with its tunables; returns (PnL in CAD, shares
+    unwound directly within the slippage tolerance, shares converted, ticks
+    taken). Chunk and horizon default to the current module settings."""
+    tender = evaluator.tender
+    chunk = chunk or tender_eval.MIN_CHUNK
+    horizon = UNWIND_HORIZON_TICKS if horizon is None else horizon
+    broker = PaperBroker()
+    ex = broker.exchange
+    broker.load(snaps[n])
+    params = {} if tender['is_fixed_bid'] else {'price': tender['price']}
+    if not ex.post_tender(params, tender['tender_id'])['success']:
+        return 0.0, 0, 0, 0
+    side = 'BUY' if tender['action'] == 'SELL' else 'SELL'
+    slip = evaluator.SLIPPAGE_TOLERANCE
+    limit = tender['price'] + slip if side == 'BUY' else tender['price'] - slip
+    start_tick = last = progress_tick = snaps[n]['tick']
+    at_limit = converted = 0
+    for snap in snaps[n:]:
+        if snap['tick'] < last or snap['tick'] - start_tick > horizon:
+            break   # Next period or out of patience
+        if snap is not snaps[n]:
+            broker.load(snap)
+        last = snap['tick']
+        final = snap
+        remaining = abs(ex.positions[RITC])
+        if remaining < 1:
+            break
+        order = broker.place_limit(RITC, side, min(chunk, remaining, MAX_SIZE_EQUITY), round(limit, 2))
+        if order:
+            at_limit += order['quantity_filled']
+            if order['status'] == 'OPEN':
+                broker.cancel_order(order['order_id'])   # Immediate-or-cancel
+        remaining_after = abs(ex.positions[RITC])
+        if remaining_after >= 1:
+            converted += _convert_step(broker, side, min(chunk, remaining_after), tender,
+                                       evaluator.REQUIRED_PROFIT_MARGIN)
+        if abs(ex.positions[RITC]) < remaining:
+            progress_tick = snap['tick']
+        elif snap['tick'] - progress_tick >= evaluator.PATIENCE_WINDOW_SECONDS:
+            # Patience used up: cross one chunk like the slice loop does
+            broker.place_mkt(RITC, side, min(chunk, abs(ex.positions[RITC]), MAX_SIZE_EQUITY))
+            progress_tick = snap['tick']
+    # Stock legs the converter could not pair up are flattened too
+    for ticker in (RITC, BULL, BEAR):
+        while abs(ex.positions[ticker]) >= 1:
+            action = side if ticker == RITC else ('SELL' if ex.positions[ticker] > 0 else 'BUY')
+            order = broker.place_mkt(ticker, action, min(abs(ex.positions[ticker]), MAX_SIZE_EQUITY))
+            if not order.get('quantity_filled'):
+                break   # Book exhausted; the rest is marked at the mid
+    return broker.mark_to_market(final), int(at_limit), converted, last - start_tick
+
+
+def backtest_shard(task):
+    """Pool task: the tenders of one session with index % shards == shard,
+    evaluated with `overrides` of the EvaluateTendersNew tunables."""
+    source, shard, shards, overrides = task
+    snaps = cached_session(source)
+    rows = []
+    with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+        for n, tender in session_tenders(snaps)[shard::shards]:
+            evaluator = EvaluateTendersNew(tender, None)
+            for name, value in overrides.items():
+                setattr(evaluator, name, value)
+            t0 = time.perf_counter()
+            predicted = predict(snaps[n], evaluator)
+            t1 = time.perf_counter()
+            simulated, at_limit, converted, ticks = simulate_unwind(snaps, n, evaluator)
+            t2 = time.perf_counter()
+            rows.append({'session': source, 'tender_id': tender['tender_id'], 'tick': snaps[n]['tick'],
+                         'action': tender['action'], 'quantity': tender['quantity'], 'price': tender['price'],
+                         'predicted': round(predicted, 2), 'accept': predicted > 0,
+                         'simulated': round(simulated, 2), 'right': (predicted > 0) == (simulated > 0),
+                         'unwound_at_limit': at_limit, 'converted': converted, 'unwind_ticks': ticks,
+                         'eval_ms': (t1 - t0) * 1000, 'unwind_ms': (t2 - t1) * 1000})
+    return rows
+
+
+def results_digest(rows):
+    """Hash of every deterministic column, for comparing runs."""
+    text = "\n".join(repr(tuple(r[c] for c in RESULT_COLUMNS)) for r in rows)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def run_backtest(sessions=BACKTEST_SESSIONS, workers=BACKTEST_WORKERS, overrides=None):
+    """Backtest every session on a pool; rows sorted by (session, tender_id)."""
+    workers = workers or os.cpu_count() or 1
+    shards = max(1, -(-workers // len(sessions)))   # Enough shards to keep every worker busy
+    tasks = [(source, shard, shards, overrides or {}) for source in sessions for shard in range(shards)]
+    st_time = time.perf_counter()
+    if workers == 1:
+        parts = [backtest_shard(task) for task in tasks]
+    else:
+        with mp.Pool(min(workers, len(tasks))) as pool:
+            parts = pool.map(backtest_shard, tasks, chunksize=1)
+    rows = sorted((r for part in parts for r in part), key=lambda r: (r['session'], r['tender_id']))
+    return rows, time.perf_counter() - st_time
+
+
+def print_backtest(rows, wall_seconds):
+    table = [[r['session'], r['tender_id'], r['action'], int(r['quantity']), r['price'], f"{r['predicted']:.0f}",
+              'accept' if r['accept'] else 'reject', f"{r['simulated']:.0f}", 'yes' if r['right'] else 'no',
+              r['unwound_at_limit'], r['converted'], r['unwind_ticks'], f"{r['eval_ms']:.2f}", f"{r['unwind_ms']:.1f}"]
+             for r in rows]
+    print(tabulate(table, headers=['session', 'tender', 'action', 'qty', 'price', 'predicted', 'decision',
+                                   'simulated', 'right', 'at limit', 'converted', 'ticks', 'eval ms', 'unwind ms']))
+    right = sum(r['right'] for r in rows)
+    accepted = [r for r in rows if r['accept']]
+    print(f"Backtest: {len(rows)} tenders in {wall_seconds:.2f}s, decisions right {right}/{len(rows)}, "
+          f"accepted PnL predicted {sum(r['predicted'] for r in accepted):.0f} vs simulated "
+          f"{sum(r['simulated'] for r in accepted):.0f} CAD, digest {results_digest(rows)}")
+
+
+if __name__ == "__main__":
+    print_backtest(*run_backtest())
@@ -0,0 +1,230 @@
+# RIT GATEWAY CIRCUIT BREAKERS
+# Per-endpoint circuit breakers, one global retry budget and thread-local
+# deadlines for every HTTP call to the RIT API. An endpoint that keeps
+# failing is short-circuited (fails in microseconds) until a cool-off probe
+# succeeds; retries anywhere in the process draw on one shared budget; and
+# a caller's deadline caps the timeout of every request made under it.
+
+import re
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+
+DEFAULT_TIMEOUT = 2.0        # Seconds; requests otherwise waits forever
+FAILURE_THRESHOLD = 5        # Consecutive failures that open a breaker
+RESET_TIMEOUT = 2.0          # Seconds a breaker stays open before a probe
+RETRY_RATIO = 0.1            # Retries earned per request sent
+RETRY_BURST = 10             # Retry tokens banked at most
+FAILURE_STATUS = (429, 500, 502, 503, 504)
+
+CLOSED, OPEN, HALF_OPEN = 'CLOSED', 'OPEN', 'HALF_OPEN'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised instead of calling the API once the caller's deadline passed."""
+
+
+class CircuitBreaker():
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.calls = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+        self.last_error = None
+        self.latency_total = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True   # One probe at a time
+                return True
+            self.short_circuited += 1
+            return False
+
+    def is_open(self):
+        """Open and still cooling off. Past reset_timeout the breaker only
+        moves to HALF_OPEN on the next allow(), so it must not count as open
+        here or callers that wait for it to close never send that probe."""
+        with self._lock:
+            return self.state == OPEN and time.time() - self.opened_at < self.reset_timeout
+
+    def record_success(self, latency):
+        with self._lock:
+            self.calls += 1
+            self.latency_total += latency
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            self.probe_in_flight = False
+
+    def record_failure(self, error, latency=0.0):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.latency_total += latency
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:200]
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    print(f"[BREAKER] {self.name} OPEN after {self.consecutive_failures} failures: {self.last_error}")
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.probe_in_flight = False
+
+    def metrics(self):
+        return {'state': self.state, 'calls': self.calls, 'failures': self.failures,
+                'short_circuited': self.short_circuited, 'times_opened': self.times_opened,
+                'mean_ms': self.latency_total / self.calls * 1000 if self.calls else 0.0,
+                'last_error': self.last_error}
+
+
+class RetryBudget():
+    """Token bucket shared by every retry loop: each request earns
+    RETRY_RATIO of a retry, so retries can never multiply load when the
+    API is struggling."""
+    def __init__(self, ratio=RETRY_RATIO, burst=RETRY_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+        self.granted = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.granted += 1
+                return True
+            self.denied += 1
+            return False
+
+
+# ---- deadlines ----
+_local = threading.local()
+
+
+@contextmanager
+def deadline(seconds):
+    """Every API call made by this thread inside the block finishes (or
+    fails) within `seconds`; nested deadlines keep the earliest."""
+    prev = getattr(_local, 'deadline', None)
+    new = time.time() + seconds
+    _local.deadline = new if prev is None else min(prev, new)
+    try:
+        yield
+    finally:
+        _local.deadline = prev
+
+
+@contextmanager
+def no_deadline():
+    """Lift this thread's deadline inside the block: once a trade has legs
+    on the wire, finishing (or unwinding) it must not fail fast."""
+    prev = getattr(_local, 'deadline', None)
+    _local.deadline = None
+    try:
+        yield
+    finally:
+        _local.deadline = prev
+
+
+def time_remaining():
+    """Seconds left on this thread's deadline, or None without one."""
+    d = getattr(_local, 'deadline', None)
+    return None if d is None else d - time.time()
+
+
+def retry_allowed(backoff=0.0):
+    """Whether a retry (after sleeping `backoff`) fits both the global
+    budget and this thread's deadline."""
+    left = time_remaining()
+    if left is not None and left <= backoff:
+        return False
+    return retry_budget.try_acquire()
+
+
+# ---- registry ----
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+breakers = {}
+_breakers_lock = threading.Lock()
+retry_budget = RetryBudget()
+
+
+def endpoint_key(method, url):
+    """'POST http://host/v1/orders/123' -> 'POST /orders/{id}'."""
+    path = urlsplit(url).path
+    if path.startswith('/v1/'):
+        path = path[3:]
+    return f"{method.upper()} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def breaker_for(key):
+    with _breakers_lock:
+        if key not in breakers:
+            breakers[key] = CircuitBreaker(key)
+        return breakers[key]
+
+
+def open_breakers():
+    """Endpoints still cooling off; those due a probe (or probing) are left out."""
+    return [key for key, b in breakers.items() if b.is_open()]
+
+
+def breaker_metrics():
+    out = {key: b.metrics() for key, b in breakers.items()}
+    out['retry_budget'] = {'tokens': retry_budget.tokens, 'granted': retry_budget.granted,
+                           'denied': retry_budget.denied}
+    return out
+
+
+class GuardedSession(requests.Session):
+    """requests.Session whose every call goes through its endpoint's breaker,
+    the retry budget's accounting and the caller's deadline."""
+    def request(self, method, url, **kwargs):
+        key = endpoint_key(method, url)
+        breaker = breaker_for(key)
+        left = time_remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"{key}: deadline passed")
+        if not breaker.allow():
+            raise CircuitOpenError(f"{key}: circuit open")
+
+        timeout = kwargs.pop('timeout', None) or DEFAULT_TIMEOUT
+        if left is not None:
+            timeout = min(timeout, left)
+        retry_budget.on_request()
+        t0 = time.perf_counter()
+        try:
+            resp = super().request(method, url, timeout=timeout, **kwargs)
+        except Exception as e:
+            breaker.record_failure(e, time.perf_counter() - t0)
+            raise
+        if resp.status_code in FAILURE_STATUS:
+            breaker.record_failure(f"HTTP {resp.status_code}", time.perf_counter() - t0)
+        else:
+            breaker.record_success(time.perf_counter() - t0)
+        return resp
@@ -0,0 +1,217 @@
+# DELTA-ENCODED BOOK STORAGE
+# Consecutive snapshots share almost every resting order, so after a full
+# keyframe each snapshot is stored as per-order adds / modifications /
+# removals keyed by order_id, plus whichever non-book fields changed. A
+# keyframe every KEYFRAME_EVERY snapshots bounds reconstruction to that many
+# deltas. The recorder encodes its snapshot records this way; DeltaWriter /
+# DeltaReader keep standalone files with an offset index for random access.
+
+import glob
+from final_utils import *
+from rit_sim import snapshot_tick
+
+KEYFRAME_EVERY = 100         # Snapshots between full keyframes
+BOOK_KEYS = tuple(t.lower() for t in SNAPSHOT_TICKERS)
+SIDES = ('bids', 'asks')
+KEY, DELTA = 'key', 'delta'
+INDEX_DTYPE = np.dtype([('offset', np.int64), ('key', np.bool_), ('tick', np.int32), ('ts', np.float64)])
+
+
+def _side_delta(prev, cur, descending):
+    """Delta turning one book side `prev` into `cur`, or None if unchanged.
+    Sides without order ids (aggregated books) are stored whole."""
+    if any('order_id' not in o for o in cur) or any('order_id' not in o for o in prev):
+        return None if prev == cur else {'full': cur}
+    before = {o['order_id']: o for o in prev}
+    now = {o['order_id']: o for o in cur}
+    add = [o for o in cur if o['order_id'] not in before]
+    rem = [i for i in before if i not in now]
+    mod = {}
+    for i, o in now.items():
+        old = before.get(i)
+        if old is not None and old != o:
+            mod[i] = {k: v for k, v in o.items() if old.get(k) != v}
+    if not add and not rem and not mod:
+        return None
+    delta = {}
+    if add:
+        delta['add'] = add
+    if rem:
+        delta['rem'] = rem
+    if mod:
+        delta['mod'] = mod
+    # Reconstruction keeps survivors in order, appends adds and stable-sorts
+    # by price; spell the sequence out only when that would be wrong
+    if [o['order_id'] for o in _apply_side(prev, delta, descending)] != [o['order_id'] for o in cur]:
+        delta['seq'] = [o['order_id'] for o in cur]
+    return delta
+
+
+def _apply_side(prev, delta, descending):
+    if 'full' in delta:
+        return delta['full']
+    rem = set(delta.get('rem', ()))
+    mod = delta.get('mod', {})
+    orders = [dict(o, **mod[o['order_id']]) if o['order_id'] in mod else o
+              for o in prev if o['order_id'] not in rem]
+    orders.extend(delta.get('add', ()))
+    if 'seq' in delta:
+        by_id = {o['order_id']: o for o in orders}
+        return [by_id[i] for i in delta['seq']]
+    orders.sort(key=(lambda o: -o['price']) if descending else (lambda o: o['price']))
+    return orders
+
+
+class DeltaEncoder():
+    def __init__(self, keyframe_every=KEYFRAME_EVERY):
+        self.keyframe_every = keyframe_every
+        self.prev = None
+        self.since_key = 0
+
+    def reset(self):
+        """Force the next snapshot to be a keyframe (e.g. a new file)."""
+        self.prev = None
+
+    def encode(self, snap):
+        """(KEY, snapshot) or (DELTA, changes against the previous snapshot)."""
+        prev = self.prev
+        self.prev = snap
+        if prev is None or self.since_key + 1 >= self.keyframe_every:
+            self.since_key = 0
+            return KEY, snap
+        self.since_key += 1
+        books = {}
+        for key in BOOK_KEYS:
+            if key not in snap:
+                continue
+            sides = {}
+            for side in SIDES:
+                d = _side_delta(prev[key][side], snap[key][side], side == 'bids')
+                if d is not None:
+                    sides[side] = d
+            if sides:
+                books[key] = sides
+        changed = {k: v for k, v in snap.items() if k not in BOOK_KEYS and (k not in prev or prev[k] != v)}
+        removed = [k for k in prev if k not in snap]
+        delta = {'books': books, 'set': changed}
+        if removed:
+            delta['unset'] = removed
+        return DELTA, delta
+
+
+class DeltaDecoder():
+    """Rebuilds snapshots from encoded records. Unchanged orders are shared
+    between consecutive snapshots, so treat the results as read-only."""
+    def __init__(self):
+        self.cur = None
+
+    def decode(self, kind, payload):
+        if kind == KEY:
+            self.cur = payload
+            return payload
+        if self.cur is None:
+            raise ValueError("Delta record before any keyframe")
+        snap = {k: v for k, v in self.cur.items() if k not in payload.get('unset', ())}
+        snap.update(payload['set'])
+        for key, sides in payload['books'].items():
+            book = dict(snap[key])
+            for side, delta in sides.items():
+                book[side] = _apply_side(book[side], delta, side == 'bids')
+            snap[key] = book
+        self.cur = snap
+        return snap
+
+
+# ---- standalone files ----
+class DeltaWriter():
+    """Appends encoded snapshots to `path` and, on close, an offset index
+    (path + '.idx.npy': file offset, keyframe flag, tick, ts per snapshot)."""
+    def __init__(self, path, keyframe_every=KEYFRAME_EVERY):
+        self.path = path
+        self.encoder = DeltaEncoder(keyframe_every)
+        self.file = open(path, 'wb')
+        self.index = []
+        self.bytes_key = 0
+        self.bytes_delta = 0
+
+    def append(self, snap):
+        kind, payload = self.encoder.encode(snap)
+        data = pickle.dumps((kind, payload), protocol=pickle.HIGHEST_PROTOCOL)
+        ts = snap.get('ts') or datetime.datetime.fromisoformat(snap['timestamp']).timestamp()
+        self.index.append((self.file.tell(), kind == KEY, snap.get('tick') or snapshot_tick(snap), ts))
+        self.file.write(data)
+        if kind == KEY:
+            self.bytes_key += len(data)
+        else:
+            self.bytes_delta += len(data)
+
+    def close(self):
+        self.file.close()
+        np.save(self.path + ".idx.npy", np.array(self.index, dtype=INDEX_DTYPE))
+
+
+class DeltaReader():
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.index = np.load(path + ".idx.npy")
+        self.keys = np.flatnonzero(self.index['key'])
+        self.decoder = DeltaDecoder()
+        self.pos = None       # Snapshot number the decoder currently holds
+
+    def __len__(self):
+        return len(self.index)
+
+    def _read(self):
+        return pickle.load(self.file)
+
+    def snapshot(self, n):
+        """Snapshot n: from the nearest keyframe at or before it, or straight
+        on from the current position when that is closer."""
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        if self.pos == n:
+            return self.decoder.cur
+        key = int(self.keys[np.searchsorted(self.keys, n, side='right') - 1])
+        if self.pos is not None and key <= self.pos < n:
+            start = self.pos + 1
+        else:
+            start = key
+        self.file.seek(int(self.index['offset'][start]))
+        for _ in range(start, n + 1):
+            self.decoder.decode(*self._read())
+        self.pos = n
+        return self.decoder.cur
+
+    def __iter__(self):
+        self.file.seek(0)
+        decoder = DeltaDecoder()
+        for _ in range(len(self)):
+            yield decoder.decode(*self._read())
+
+    def close(self):
+        self.file.close()
+
+
+def encode_pickles(pattern="output/*.pkl", path="output/session.delta", keyframe_every=KEYFRAME_EVERY):
+    """Delta-encode the recorded pickles into one file; prints the saving."""
+    writer = DeltaWriter(path, keyframe_every)
+    raw = 0
+    for file in sorted(glob.glob(pattern)):
+        try:
+            with open(file, 'rb') as f:
+                snap = pickle.load(f)
+        except Exception:
+            continue
+        raw += len(pickle.dumps(snap, protocol=pickle.HIGHEST_PROTOCOL))
+        writer.append(snap)
+    writer.close()
+    total = writer.bytes_key + writer.bytes_delta
+    deltas = len(writer.index) - int(sum(1 for i in writer.index if i[1]))
+    print(f"Delta store: {len(writer.index)} snapshots, {raw / 1e3:.0f} KB full -> {total / 1e3:.0f} KB "
+          f"({raw / max(total, 1):.1f}x), mean delta {writer.bytes_delta / max(deltas, 1):.0f} bytes")
+    return DeltaReader(path)
+
+
+if __name__ == "__main__":
+    encode_pickles()
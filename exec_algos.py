@@ -0,0 +1,169 @@
+# SCHEDULE-BASED EXECUTION ALGORITHMS
+# TWAP, percent-of-volume and implementation-shortfall schedules behind one
+# interface. Each tick the algorithm's target cumulative quantity is compared
+# with what has filled and the difference is worked as one small passive
+# slice, so large tenders finish inside the period without walking the book.
+# Every algorithm records target vs filled per tick for adherence reporting.
+
+from abc import ABC, abstractmethod
+from final_utils import *
+from passive_exec import PassiveExecutor
+
+ALGO_HORIZON_TICKS = 30      # Default schedule length
+PERIOD_END_GUARD = 5         # Ticks left spare at the end of the period
+SLICE_SECONDS = 0.8          # How long a slice may rest before crossing (< one tick)
+ALGO_POLL_SECONDS = 0.05     # Tick polling interval between slices
+POV_RATE = 0.2               # Target share of traded volume
+IS_URGENCY = 3.0             # Front-loading of the IS trajectory (0 -> TWAP)
+
+
+class ExecAlgo(ABC):
+    """Common driver: subclasses only define target(elapsed_ticks)."""
+    name = "ALGO"
+
+    def __init__(self, ticker, side, qty, horizon_ticks=ALGO_HORIZON_TICKS, limit_price=None, executor=None):
+        self.ticker = ticker
+        self.side = side
+        self.qty = qty
+        self.horizon = max(int(horizon_ticks), 1)
+        self.limit_price = limit_price
+        self.executor = executor or PassiveExecutor(self.name)
+        self.filled = 0
+        self.value = 0.0
+        self.start_tick = None
+        self.log = []   # (tick, target, filled) per slice
+
+    @abstractmethod
+    def target(self, elapsed):
+        """Cumulative quantity that should have filled `elapsed` ticks in."""
+
+    def on_tick(self, tick):
+        """Hook for per-tick market observation (e.g. volume)."""
+        pass
+
+    @property
+    def remaining(self):
+        return self.qty - self.filled
+
+    @property
+    def vwap(self):
+        return self.value / self.filled if self.filled else 0.0
+
+    def _fit_horizon(self):
+        """Shrink the horizon so the schedule ends before the period does
+        (only when /case reports the period length)."""
+        case = get_case()
+        if 'ticks_per_period' in case:
+            left = case['ticks_per_period'] - case['tick'] - PERIOD_END_GUARD
+            self.horizon = max(min(self.horizon, left), 1)
+        return case['tick']
+
+    def _slice(self, tick):
+        elapsed = tick - self.start_tick
+        self.on_tick(tick)
+        goal = min(int(round(self.target(elapsed))), self.qty)
+        if elapsed >= self.horizon:
+            goal = self.qty   # Schedule over: finish
+        want = min(goal - self.filled, MAX_SIZE_EQUITY)
+        if want > 0:
+            child = self.executor.work_one(self.ticker, self.side, want, SLICE_SECONDS,
+                                           limit_price=self.limit_price)
+            self.filled += child.filled
+            self.value += child.filled * child.vwap
+        self.log.append((tick, goal, self.filled))
+
+    def run(self):
+        """Execute the schedule tick by tick until done or the period ends."""
+        self.start_tick = last = self._fit_horizon()
+        print(f"{self.name}: {self.side} {self.qty} {self.ticker} over {self.horizon} ticks")
+        self._slice(last)
+        while self.remaining > 0:
+            tick, status = get_tick_status()
+            if status != 'ACTIVE' or tick < last:
+                print(f"[red]{self.name}: period ended with {self.remaining} left")
+                break
+            if tick == last:
+                time.sleep(ALGO_POLL_SECONDS)
+                continue
+            last = tick
+            self._slice(tick)
+        self.print_report()
+        return self.filled, self.vwap
+
+    def adherence(self):
+        """How closely fills tracked the schedule, as fractions of the order."""
+        if not self.log:
+            return {'ticks': 0, 'completed': 0.0, 'max_lag': 0.0, 'mean_abs_dev': 0.0}
+        dev = np.array([target - filled for _, target, filled in self.log], dtype=float) / self.qty
+        return {'ticks': len(self.log), 'completed': self.filled / self.qty,
+                'max_lag': float(max(dev.max(), 0.0)), 'mean_abs_dev': float(np.abs(dev).mean())}
+
+    def print_report(self):
+        a = self.adherence()
+        print(f"{self.name}: {self.filled}/{self.qty} @ {self.vwap:.4f} in {a['ticks']} ticks | "
+              f"max lag {a['max_lag']:.1%}, mean |dev| {a['mean_abs_dev']:.1%}, "
+              f"passive {self.executor.passive_fill_ratio():.0%}")
+
+
+class TWAP(ExecAlgo):
+    """Equal quantity every tick over the horizon."""
+    name = "TWAP"
+
+    def target(self, elapsed):
+        return self.qty * min((elapsed + 1) / self.horizon, 1.0)
+
+
+class POV(ExecAlgo):
+    """Participate at `rate` of the volume printed on /securities/tas since
+    the start, with a TWAP floor so the order still completes in time."""
+    name = "POV"
+
+    def __init__(self, ticker, side, qty, horizon_ticks=ALGO_HORIZON_TICKS, limit_price=None,
+                 executor=None, rate=POV_RATE):
+        super().__init__(ticker, side, qty, horizon_ticks, limit_price, executor)
+        self.rate = rate
+        self.last_print_id = None
+        self.market_volume = 0   # Printed volume since start, ours excluded
+        self.seen_filled = 0
+
+    def on_tick(self, tick):
+        prints = get_tas(self.ticker, after=self.last_print_id)
+        if self.last_print_id is None:
+            # First call only sets the baseline
+            self.last_print_id = max((p['id'] for p in prints), default=0)
+            return
+        if prints:
+            self.last_print_id = max(p['id'] for p in prints)
+            volume = sum(p['quantity'] for p in prints)
+            ours, self.seen_filled = self.filled - self.seen_filled, self.filled
+            self.market_volume = max(self.market_volume + volume - ours, 0)
+
+    def target(self, elapsed):
+        pov = self.rate / (1 - self.rate) * self.market_volume
+        floor = self.qty * min((elapsed + 1) / self.horizon, 1.0)
+        return max(pov, floor)
+
+
+class ImplementationShortfall(ExecAlgo):
+    """Almgren-Chriss style trajectory: front-loads execution to cut price
+    risk, more so as `urgency` grows (urgency -> 0 recovers TWAP)."""
+    name = "IS"
+
+    def __init__(self, ticker, side, qty, horizon_ticks=ALGO_HORIZON_TICKS, limit_price=None,
+                 executor=None, urgency=IS_URGENCY):
+        super().__init__(ticker, side, qty, horizon_ticks, limit_price, executor)
+        self.urgency = urgency
+
+    def target(self, elapsed):
+        t = min((elapsed + 1) / self.horizon, 1.0)
+        if self.urgency <= 1e-9:
+            return self.qty * t
+        left = np.sinh(self.urgency * (1 - t)) / np.sinh(self.urgency)
+        return self.qty * (1 - left)
+
+
+ALGOS = {'TWAP': TWAP, 'POV': POV, 'IS': ImplementationShortfall}
+
+
+def make_algo(name, ticker, side, qty, **kwargs):
+    return ALGOS[name.upper()](ticker, side, qty, **kwargs)
@@ -0,0 +1,242 @@
+# QUEUE-POSITION FILL SIMULATOR
+# Answers "would a limit at this price have filled within N ticks?" against
+# the recorded per-order books, without the matching engine. A simulated
+# order joins the back of the recorded queue at its price (priority by
+# (tick, order_id)), with every order already resting there ahead of it.
+# Between consecutive snapshots the queue ahead only shrinks: by the fills
+# those orders show, and by their cancels. An order that vanished in front of
+# one that shows fills is taken as filled (FIFO). We fill when
+# - an order behind us at our price shows fills, or
+# - the level is swept (our side's touch moves past our price), or
+# - a new opposite order rests at or through our price.
+# A limit that crosses on arrival takes the opposite levels first. Status
+# dicts match GET /orders/{id}. Per-snapshot price levels are built once and
+# shared, so one simulator serves thousands of unwinds.
+
+from final_utils import *
+from replay import replay_snapshots
+
+FILL_PATIENCE_TICKS = 5      # Default window before the remainder crosses (1 tick ~ 1 s)
+FILL_ORDER_ID_BASE = 90000000
+
+
+def _levels(orders):
+    """{price: [[order_id, remaining, filled], ...]} in queue priority."""
+    levels = {}
+    for o in sorted(orders, key=lambda o: (o.get('tick', 0), o['order_id'])):
+        remaining = o['quantity'] - o.get('quantity_filled', 0)
+        if remaining > 0:
+            levels.setdefault(round(o['price'], 2), []).append((o['order_id'], remaining, o.get('quantity_filled', 0)))
+    return levels
+
+
+class SimOrder():
+    """One simulated limit order and its position in the recorded queue."""
+    def __init__(self, order_id, ticker, action, qty, price, n, tick):
+        self.order_id = order_id
+        self.ticker = ticker
+        self.action = action
+        self.quantity = qty
+        self.price = price
+        self.n = n                  # Snapshot the queue state refers to
+        self.tick = tick
+        self.ahead = {}             # order_id -> remaining, in priority order
+        self.taken = {}             # Opposite order_id -> shares we already took from it
+        self.passive_qty = 0.0
+        self.passive_value = 0.0
+        self.aggressive_qty = 0.0
+        self.aggressive_value = 0.0
+        self.state = 'OPEN'
+
+    @property
+    def filled(self):
+        return self.passive_qty + self.aggressive_qty
+
+    @property
+    def remaining(self):
+        return self.quantity - self.filled
+
+    @property
+    def queue_ahead(self):
+        return sum(self.ahead.values())
+
+    def _fill(self, qty, price, passive):
+        qty = min(qty, self.remaining)
+        if qty <= 0:
+            return
+        if passive:
+            self.passive_qty += qty
+            self.passive_value += qty * price
+        else:
+            self.aggressive_qty += qty
+            self.aggressive_value += qty * price
+        if self.remaining <= 0:
+            self.state = 'TRANSACTED'
+
+    def status(self):
+        """The order as GET /orders/{id} reports it."""
+        return {'order_id': self.order_id, 'tick': self.tick, 'ticker': self.ticker, 'type': 'LIMIT',
+                'quantity': self.quantity, 'price': self.price, 'action': self.action,
+                'quantity_filled': self.filled,
+                'vwap': (self.passive_value + self.aggressive_value) / self.filled if self.filled else None,
+                'status': self.state}
+
+
+class FillSimulator():
+    def __init__(self, snaps):
+        self.snaps = snaps if isinstance(snaps, list) else list(snaps)
+        self.ticks = [s['tick'] for s in self.snaps]
+        self._cache = {}
+        self.next_order_id = FILL_ORDER_ID_BASE
+
+    def book(self, n, ticker, side):
+        """Price levels of one side of snapshot n (built once, then shared)."""
+        key = (n, ticker, side)
+        levels = self._cache.get(key)
+        if levels is None:
+            levels = self._cache[key] = _levels(self.snaps[n][ticker.lower()][side])
+        return levels
+
+    def touch(self, n, ticker, side):
+        levels = self.book(n, ticker, side)
+        if not levels:
+            return None
+        return max(levels) if side == 'bids' else min(levels)
+
+    def price_at(self, n, ticker, action, delta=0.0):
+        """Our near touch moved `delta` toward the far side (book + DELTA)."""
+        if action == 'BUY':
+            near = self.touch(n, ticker, 'bids')
+            return None if near is None else round(near + delta, 2)
+        near = self.touch(n, ticker, 'asks')
+        return None if near is None else round(near - delta, 2)
+
+    # ---- order lifecycle ----
+    def place(self, n, ticker, action, qty, price):
+        """Post a limit at snapshot n: take what it crosses, queue the rest."""
+        price = round(price, 2)
+        order = SimOrder(self.next_order_id, ticker, action, qty, price, n, self.ticks[n])
+        self.next_order_id += 1
+        own, opp = ('bids', 'asks') if action == 'BUY' else ('asks', 'bids')
+        self._take(order, self.book(n, ticker, opp), passive=False)
+        if order.remaining > 0:
+            order.ahead = {oid: rem for oid, rem, _ in self.book(n, ticker, own).get(price, ())}
+        return order
+
+    def _take(self, order, opp_levels, passive):
+        """Fill against opposite levels at or through our price, best first;
+        a resting order is filled at its own price."""
+        buy = order.action == 'BUY'
+        for price in sorted(opp_levels, reverse=not buy):
+            if order.remaining <= 0 or (price > order.price if buy else price < order.price):
+                break
+            for oid, rem, _ in opp_levels[price]:
+                qty = min(rem - order.taken.get(oid, 0), order.remaining)
+                if qty > 0:
+                    order.taken[oid] = order.taken.get(oid, 0) + qty
+                    order._fill(qty, order.price if passive else price, passive)
+
+    def step(self, order):
+        """Move the order to the next snapshot, applying observed depletion."""
+        n = order.n + 1
+        if order.state != 'OPEN' or n >= len(self.snaps):
+            return order
+        own, opp = ('bids', 'asks') if order.action == 'BUY' else ('asks', 'bids')
+        buy = order.action == 'BUY'
+        p = order.price
+        prev = order.n
+        before = self.book(prev, order.ticker, own).get(p, ())
+        now = {oid: (rem, filled) for oid, rem, filled in self.book(n, order.ticker, own).get(p, ())}
+        was_ahead = set(order.ahead)
+        order.n = n
+
+        # Queue ahead only shrinks: fills lower what is left, vanished
+        # orders (filled or cancelled) leave it
+        for oid in list(order.ahead):
+            if oid in now:
+                order.ahead[oid] = min(order.ahead[oid], now[oid][0])
+            else:
+                del order.ahead[oid]
+
+        # Volume that reached us: fills on orders behind us at our price or
+        # at worse prices, plus orders behind us that vanished in front of
+        # one showing fills (FIFO says they traded too)
+        behind = 0.0
+        gone = 0.0
+        for oid, rem, filled in before:
+            if oid in was_ahead:
+                continue
+            if oid not in now:
+                gone += rem
+            elif now[oid][1] > filled:
+                behind += now[oid][1] - filled + gone
+                gone = 0.0
+        for price, orders in self.book(prev, order.ticker, own).items():
+            if price < p if buy else price > p:
+                later = {oid: f for oid, _, f in self.book(n, order.ticker, own).get(price, ())}
+                behind += sum(max(later[oid] - f, 0) for oid, _, f in orders if oid in later)
+        touch = self.touch(n, order.ticker, own)
+        swept = touch is None or (touch < p if buy else touch > p)
+        if swept and before:
+            order.ahead.clear()
+            order._fill(order.remaining, p, passive=True)
+        elif behind > 0:
+            order.ahead.clear()   # FIFO: everything ahead traded first
+            order._fill(behind, p, passive=True)
+        if order.remaining > 0 and not order.ahead:
+            self._take(order, self.book(n, order.ticker, opp), passive=True)
+        return order
+
+    def cross(self, order, n=None):
+        """Cancel the rest and sweep it at market on snapshot n (default: the
+        order's current one), like PassiveExecutor._cross."""
+        n = order.n if n is None else n
+        opp = 'asks' if order.action == 'BUY' else 'bids'
+        limit = order.price
+        order.price = float('inf') if order.action == 'BUY' else 0.0
+        self._take(order, self.book(n, order.ticker, opp), passive=False)
+        order.price = limit
+        order.state = 'TRANSACTED' if order.remaining <= 0 else 'CANCELLED'
+        return order
+
+    def simulate(self, n, ticker, action, qty, price, patience_ticks=FILL_PATIENCE_TICKS, cross=False):
+        """Rest a limit from snapshot n for `patience_ticks` ticks; returns the
+        order (cross=True sweeps any remainder at the end, as _execute_direct
+        does once its patience window runs out)."""
+        order = self.place(n, ticker, action, qty, price)
+        end_tick = self.ticks[n] + patience_ticks
+        while order.state == 'OPEN' and order.n + 1 < len(self.snaps):
+            nxt = self.ticks[order.n + 1]
+            if nxt < self.ticks[order.n] or nxt > end_tick:
+                break   # New period or out of patience
+            self.step(order)
+        if cross and order.remaining > 0:
+            self.cross(order)
+        return order
+
+
+def benchmark(snaps=None, trials=5000, seed=0):
+    """Random direct-unwind slices (touch + 0..2 ticks, 1..10 ticks of
+    patience); prints slices per second and the passive fill rate."""
+    sim = FillSimulator(replay_snapshots() if snaps is None else snaps)
+    rng = np.random.default_rng(seed)
+    st_time = time.perf_counter()
+    filled = passive = 0.0
+    for _ in range(trials):
+        n = int(rng.integers(len(sim.snaps) - 1))
+        action = 'BUY' if rng.random() < 0.5 else 'SELL'
+        price = sim.price_at(n, RITC, action, 0.01 * int(rng.integers(3)))
+        if price is None:
+            continue
+        order = sim.simulate(n, RITC, action, int(rng.integers(1, 11)) * 1000, price,
+                             int(rng.integers(1, 11)), cross=True)
+        filled += order.filled
+        passive += order.passive_qty
+    seconds = time.perf_counter() - st_time
+    print(f"Fill simulator: {trials} slices in {seconds:.2f}s ({trials / seconds:.0f}/s), "
+          f"{passive / max(filled, 1):.1%} filled passively")
+    return trials / seconds
+
+
+if __name__ == "__main__":
+    benchmark()
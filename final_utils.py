@@ -5,12 +5,17 @@ import numpy as np
 import pickle
 from tabulate import tabulate
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from rich import print
+from circuit_breaker import (GuardedSession, CircuitOpenError, DeadlineExceeded, deadline, no_deadline,
+                             retry_allowed, open_breakers, breaker_metrics)
 
-API = "http://localhost:9999/v1"
+API = os.environ.get("RIT_API", "http://localhost:9999/v1")  # rit_sim.py serves a local stand-in
 API_KEY = "PA83Q8EP"  # <-- your key
 HDRS = {"X-API-key": API_KEY}  # change to X-API-Key if your server needs it
 import datetime
+from contextlib import contextmanager
 
 # Tickers
 CAD = "CAD"  # currency instrument quoted in CAD
@@ -21,7 +26,7 @@ RITC = "RITC"  # ETF quoted in USD
 
 # Per problem statement
 FEE_MKT = 0.02  # $/share (market)
-REBATE_LMT = 0.01  # $/share (passive) - not used in this baseline
+REBATE_LMT = 0.01  # $/share (passive) - earned by passive_exec
 MAX_SIZE_EQUITY = 10000  # per order for BULL/BEAR/RITC
 MAX_SIZE_FX = 2500000  # per order for CAD/USD
 
@@ -49,23 +54,48 @@ EXECUTION_DELAY = 0.1  # Seconds between execution chunks
 MAX_SLIPPAGE_BPS = 20  # Maximum acceptable slippage in basis points
 
 # --------- SESSION ----------
-s = requests.Session()
+# Every call goes through a per-endpoint circuit breaker with a default
+# timeout, the shared retry budget and the calling thread's deadline
+s = GuardedSession()
 s.headers.update(HDRS)
 
 # NEW: Price history storage for volatility calculation
 price_history = {BULL: [], BEAR: [], RITC: [], USD: []}
 
+# NEW: Per-tick shared market snapshot. While a snapshot is installed and
+# fresh, book/position/tender helpers serve from it instead of the API, so
+# every strategy dispatched in a tick sees the same instant for one fetch.
+SNAPSHOT_TICKERS = (USD, BULL, BEAR, RITC)
+SNAPSHOT_MAX_AGE = 0.5  # Seconds a snapshot may stand in for live data
+
+_snapshot = None
+_ledger_lock = threading.Lock()
+_live = threading.local()   # Per-thread live_books() flag
+
+# NEW: Optional order router (e.g. the multi-process gateway client). When
+# set, order entry and order queries go through it instead of the session.
+_order_router = None
+_snapshot_source = None
+# NEW: Optional pre-trade risk engine (risk_engine.RiskEngine). When set,
+# orders are checked before they are sent and fills / cancels update it.
+_risk_engine = None
+# NEW: Optional recorder (recorder.Recorder). When set, fills and strategy
+# decisions are queued to its background writer (never blocking).
+_recorder = None
+_snapshot_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="snapshot")
+
 # --------- HELPERS ----------
-def get_tick_status():
+def get_case():
     r = s.get(f"{API}/case")
     r.raise_for_status()
-    j = r.json()
+    return r.json()
+
+def get_tick_status():
+    j = get_case()
     return j["tick"], j["status"]
 
 def best_bid_ask(ticker):
-    r = s.get(f"{API}/securities/book", params={"ticker": ticker})
-    r.raise_for_status()
-    book = r.json()
+    book = best_bid_ask_entire_depth(ticker)
     bid = float(book["bids"][0]["price"]) if book["bids"] else 0.0
     ask = float(book["asks"][0]["price"]) if book["asks"] else 1e12
     bid_depth = int(book["bids"][0]["quantity"]) if book["bids"] else 0
@@ -100,11 +130,119 @@ def get_top_level_price_and_qty(ticker, action):
 
 
 def best_bid_ask_entire_depth(ticker):
+    snap = current_snapshot()
+    if snap is not None:
+        return snap[ticker.lower()]
+    return fetch_book(ticker)
+
+
+def fetch_book(ticker):
     r = s.get(f"{API}/securities/book", params={"ticker": ticker})
     r.raise_for_status()
     book = r.json()
     return book
 
+
+def get_tas(ticker, after=None):
+    """Time & sales prints for ticker, only those with id > after if given."""
+    params = {"ticker": ticker}
+    if after is not None:
+        params["after"] = after
+    r = s.get(f"{API}/securities/tas", params=params)
+    r.raise_for_status()
+    return r.json()
+
+
+# NEW: Shared snapshot helpers
+def get_market_snapshot(tick=None):
+    """Fetch all books, positions and tenders concurrently in one pass.
+
+    Layout matches the recorded output/*.pkl files (lower-case book keys)."""
+    books = {t: _snapshot_pool.submit(fetch_book, t) for t in SNAPSHOT_TICKERS}
+    positions = _snapshot_pool.submit(fetch_positions)
+    tenders = _snapshot_pool.submit(fetch_tenders)
+
+    snap = {'tick': tick, 'timestamp': datetime.datetime.now().isoformat()}
+    for ticker, fut in books.items():
+        snap[ticker.lower()] = fut.result()
+    snap['positions'] = positions.result()
+    snap['tenders'] = tenders.result()
+    snap['tender'] = snap['tenders'][0] if snap['tenders'] else {}
+    snap['taken_at'] = time.time()
+    return snap
+
+
+def set_snapshot(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+
+
+def clear_snapshot():
+    set_snapshot(None)
+
+
+def record_fill(ticker, action, qty, order_id=None, price=None):
+    """Apply our own fill to the shared snapshot's position ledger so other
+    strategies in the same tick see it without refetching /securities."""
+    if _risk_engine is not None and qty > 0:
+        _risk_engine.apply_fill(ticker, action, qty, order_id)
+    if _recorder is not None and qty > 0:
+        _recorder.record('fill', {'ticker': ticker, 'action': action, 'quantity': qty,
+                                  'order_id': order_id, 'price': price})
+    snap = _snapshot
+    if snap is None or 'positions' not in snap or qty <= 0:
+        return
+    signed = int(qty) if action == 'BUY' else -int(qty)
+    with _ledger_lock:
+        positions = snap['positions']
+        positions[ticker] = positions.get(ticker, 0) + signed
+
+
+def set_snapshot_source(source):
+    """Install a cheap provider (e.g. a shared-memory reader) consulted when
+    the installed snapshot has gone stale, before falling back to the API."""
+    global _snapshot_source
+    _snapshot_source = source
+
+
+def _is_stale(snap):
+    return snap is None or time.time() - snap.get('taken_at', 0) > snap.get('max_age', SNAPSHOT_MAX_AGE)
+
+
+@contextmanager
+def live_books():
+    """Inside the block this thread skips the installed tick snapshot, so a
+    polling loop sees the market as of each poll (the snapshot source, e.g.
+    the shared-memory region, or else the API) instead of the same books."""
+    prev = getattr(_live, 'on', False)
+    _live.on = True
+    try:
+        yield
+    finally:
+        _live.on = prev
+
+
+def current_snapshot():
+    """The installed snapshot, or None once it is older than its max age."""
+    if getattr(_live, 'on', False):
+        snap = _snapshot_source() if _snapshot_source is not None else None
+        return None if _is_stale(snap) else snap
+    snap = _snapshot
+    if _is_stale(snap) and _snapshot_source is not None:
+        snap = _snapshot_source()
+        set_snapshot(snap)
+    if _is_stale(snap):
+        return None
+    return snap
+
+
+def current_tick():
+    """Case tick of the books current_snapshot() serves, else from /case."""
+    snap = current_snapshot()
+    if snap is not None and snap.get('tick') is not None:
+        return snap['tick']
+    return get_tick_status()[0]
+
 # NEW: Advanced volatility calculation
 def calculate_volatility(ticker):
     """Calculate rolling volatility for dynamic thresholding"""
@@ -201,6 +339,13 @@ def get_order_book_depth(ticker):
     return bid_depth, ask_depth
 
 def get_tenders():
+    snap = current_snapshot()
+    if snap is not None and 'tenders' in snap:
+        return snap['tenders']
+    return fetch_tenders()
+
+
+def fetch_tenders():
     r = s.get(f"{API}/tenders")
     r.raise_for_status()
     offers = r.json()
@@ -214,6 +359,14 @@ def get_usd_cad_spread():
 
 
 def positions_map():
+    snap = current_snapshot()
+    if snap is not None and 'positions' in snap:
+        with _ledger_lock:
+            return dict(snap['positions'])
+    return fetch_positions()
+
+
+def fetch_positions():
     r = s.get(f"{API}/securities")
     r.raise_for_status()
     out = {p["ticker"]: int(p.get("position", 0)) for p in r.json()}
@@ -223,31 +376,126 @@ def positions_map():
 
 
 def get_order_status(_id):
+    if _order_router is not None:
+        return _order_router.get_order_status(_id)
     return s.get(f"{API}/orders/{_id}")
 
 
 def cancel_order(_id):
+    if _order_router is not None:
+        return _order_router.cancel_order(_id)
+    if _risk_engine is not None:
+        _risk_engine.cancel(_id)
     return s.delete(f"{API}/orders/{_id}")
 
-def get_position_limits_impact(projected_ritc_change=0, projected_bull_change=0, projected_bear_change=0):
+
+def set_order_router(router):
+    global _order_router
+    _order_router = router
+
+
+def set_risk_engine(engine):
+    global _risk_engine
+    _risk_engine = engine
+
+
+def set_recorder(rec):
+    global _recorder
+    _recorder = rec
+
+
+def record_event(kind, data):
+    """Hand a decision (or other event) to the installed recorder, if any."""
+    if _recorder is not None:
+        _recorder.record(kind, data)
+
+
+def _risk_rejected(ticker, action, qty):
+    """Rejection result if the risk engine blocks this order, else None."""
+    if _risk_engine is None:
+        return None
+    reason = _risk_engine.check_order(ticker, action, qty)
+    if reason is None:
+        return None
+    _risk_engine.reject(ticker, action, qty, reason)
+    return {'vwap': 0, 'quantity_filled': 0, 'rejected': reason}
+
+
+def get_limits():
+    r = s.get(f"{API}/limits")
+    r.raise_for_status()
+    return r.json()
+
+
+def get_gross_limit():
+    return _risk_engine.gross_limit if _risk_engine is not None else MAX_GROSS
+
+
+def get_net_limit():
+    return _risk_engine.net_limit if _risk_engine is not None else MAX_LONG_NET
+
+
+def get_position(ticker):
+    return positions_map().get(ticker, 0)
+
+
+def aggregate_levels(orders, max_levels=None):
+    """Collapse a per-order RIT book side into [(price, remaining_qty)] levels."""
+    levels = []
+    for order in orders:
+        qty = order['quantity'] - order.get('quantity_filled', 0)
+        if qty <= 0:
+            continue
+        if levels and levels[-1][0] == order['price']:
+            levels[-1][1] += qty
+        else:
+            if max_levels is not None and len(levels) == max_levels:
+                break
+            levels.append([order['price'], qty])
+    return levels
+
+def get_position_limits_impact(projected_ritc_change=0, projected_bull_change=0, projected_bear_change=0,
+                               buffer=1.0):
+    """Whether the projected changes keep gross / net inside the limits
+    (times buffer): the installed risk engine once synced, else positions."""
+    if _risk_engine is not None and _risk_engine.synced:
+        deltas = {RITC: projected_ritc_change, BULL: projected_bull_change, BEAR: projected_bear_change}
+        return _risk_engine.check(deltas, buffer=buffer) is None
     pos = positions_map()
     gross = abs(pos[BULL] + projected_bull_change) + abs(pos[BEAR] + projected_bear_change) + 2 * abs(pos[RITC] + projected_ritc_change)
     net = (pos[BULL] + projected_bull_change) + (pos[BEAR] + projected_bear_change) + 2 * (pos[RITC] + projected_ritc_change)
 
 
-    return gross < MAX_GROSS and MAX_SHORT_NET < net < MAX_LONG_NET
+    return gross < MAX_GROSS * buffer and MAX_SHORT_NET * buffer < net < MAX_LONG_NET * buffer
 
 # IMPROVED: Smart order placement with retry logic
 
 def place_limit(ticker,action, qty, price):
-    return s.post(f"{API}/orders",
+    if _order_router is not None:
+        return _order_router.place_limit(ticker, action, qty, price)
+    rejected = _risk_rejected(ticker, action, qty)
+    if rejected is not None:
+        return rejected
+    order = s.post(f"{API}/orders",
                          params={"ticker": ticker, "type": "LIMIT",
                                "quantity": int(qty), "action": action, "price":price}).json()
+    if _risk_engine is not None and 'order_id' in order:
+        _risk_engine.add_pending(order['order_id'], ticker, action, int(qty))
+    return order
 
 def place_mkt(ticker, action, qty):
     """Enhanced market order placement with error handling"""
     if qty <= 0:
         return {'vwap': 0}
+
+    if _order_router is not None:
+        result = _order_router.place_mkt(ticker, action, qty)
+        record_fill(ticker, action, result.get('quantity_filled', 0), result.get('order_id'), result.get('vwap'))
+        return result
+
+    rejected = _risk_rejected(ticker, action, qty)
+    if rejected is not None:
+        return rejected
         
     max_retries = 3
     for attempt in range(max_retries):
@@ -257,43 +505,58 @@ def place_mkt(ticker, action, qty):
                                "quantity": int(qty), "action": action})
             
             if order.ok:
-                return order.json()
+                result = order.json()
+                record_fill(ticker, action, result.get('quantity_filled', 0), result.get('order_id'), result.get('vwap'))
+                return result
             else:
                 print(f"[WARNING] Order attempt {attempt+1} failed: {order.text}")
-                if attempt < max_retries - 1:
-                    sleep(0.1)
-                    
+
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            print(f"[ERROR] Order not sent: {e}")
+            break
+        except requests.exceptions.Timeout as e:
+            # The order may have executed; resending could double the fill
+            print(f"[ERROR] Order timed out, not retrying: {e}")
+            break
         except Exception as e:
             print(f"[ERROR] Exception in order placement: {e}")
-            if attempt < max_retries - 1:
-                sleep(0.1)
+
+        # Retries draw on the process-wide budget and respect the deadline
+        if attempt < max_retries - 1 and retry_allowed(0.1):
+            sleep(0.1)
+        else:
+            break
     
     print(f"[ERROR] All order attempts failed: {ticker} {action} {qty}")
     return {'vwap': 0}
 
 def within_limits():
+    if _risk_engine is not None and _risk_engine.synced:
+        return _risk_engine.within_limits()
     pos = positions_map()
     gross = abs(pos[BULL]) + abs(pos[BEAR]) + 2 * abs(pos[RITC])  # FIXED: Include RITC multiplier
     net = pos[BULL] + pos[BEAR] + 2 * pos[RITC]
     return (gross < MAX_GROSS) and (MAX_SHORT_NET < net < MAX_LONG_NET)
 
 def accept_tender(tender):
+    if _order_router is not None:
+        return _order_router.accept_tender(tender)
     tender_id = tender['tender_id']
     price = tender['price']
     if tender['is_fixed_bid']:
         resp = s.post(f"{API}/tenders/{tender_id}")
     else:
         resp = s.post(f"{API}/tenders/{tender_id}", params={"price": price})
+    if resp.ok:
+        # The tender fills at once; the unwind runs inline, before any tick
+        # could resync the risk engine from /securities
+        record_fill(tender['ticker'], tender['action'], int(tender['quantity']), price=price)
     return resp.ok
 
 def open_leases():
     try:
-        resp = s.post(f"{API}/leases", params={"ticker": "ETF-Creation"})
-        if not resp.ok:
-            print(f"[ERROR] Failed to open ETF-Creation lease: {resp.status_code} {resp.text}")
-        resp = s.post(f"{API}/leases", params={"ticker": "ETF-Redemption"})
-        if not resp.ok:
-            print(f"[ERROR] Failed to open ETF-Redemption lease: {resp.status_code} {resp.text}")
+        for ticker in LEASE_TICKERS:
+            open_lease(ticker)
     except Exception as e:
         print(f"[EXCEPTION] Exception in open_leases: {e}")
 
@@ -330,52 +593,183 @@ def fx_hedge(action, qty):
     
     print(f"Hedged FX: {action} {abs(base_qty):.2f} USD")
 
+# NEW: Session-wide lease cache. Lease IDs survive across periods / Converter
+# instances and are (re)validated on a background thread, so a fresh ACTIVE
+# period never blocks on get_leases -> open_leases -> sleep(2) -> get_leases.
+CONVERT_MAX_RETRIES = 3    # Was 10 x 1.5 s; now also bounded by the retry budget
+CONVERT_RETRY_DELAY = 1.5
+LEASE_TICKERS = ("ETF-Creation", "ETF-Redemption")
+LEASE_POLL_INTERVAL = 0.2  # Seconds between get_leases polls while a lease opens
+LEASE_OPEN_TIMEOUT = 5.0   # Give up warming after this long (retried lazily)
+LEASE_WAIT_TIMEOUT = 3.0   # Max time a conversion waits for a lease ID
+
+_lease_ids = {}
+_lease_lock = threading.Lock()
+_lease_ready = threading.Event()
+_lease_thread = None
+
+
+def open_lease(ticker):
+    resp = s.post(f"{API}/leases", params={"ticker": ticker})
+    if not resp.ok:
+        print(f"[ERROR] Failed to open {ticker} lease: {resp.status_code} {resp.text}")
+    return resp.ok
+
+
+def _read_lease_ids():
+    ids = {}
+    for lease in get_leases().json():
+        if lease['ticker'] in LEASE_TICKERS:
+            ids[lease['ticker']] = lease['id']
+    return ids
+
+
+def _warm_leases():
+    """Background worker: fetch lease IDs, opening only the missing ones."""
+    try:
+        ids = _read_lease_ids()
+        missing = [t for t in LEASE_TICKERS if t not in ids]
+        for ticker in missing:
+            open_lease(ticker)
+
+        st_time = time.time()
+        while missing and time.time() - st_time < LEASE_OPEN_TIMEOUT:
+            sleep(LEASE_POLL_INTERVAL)
+            ids = _read_lease_ids()
+            missing = [t for t in LEASE_TICKERS if t not in ids]
+
+        with _lease_lock:
+            _lease_ids.clear()
+            _lease_ids.update(ids)
+            if not missing:
+                _lease_ready.set()
+            else:
+                _lease_ready.clear()   # A forced re-check may find fewer leases than before
+        if missing:
+            print(f"[WARNING] Leases still missing after warm-up: {missing}")
+    except Exception as e:
+        print(f"[EXCEPTION] Exception in lease warm-up: {e}")
+
+
+def warm_leases(force=False):
+    """Start (or reuse) the background lease warm-up. Never blocks."""
+    global _lease_thread
+    with _lease_lock:
+        if _lease_thread is not None and _lease_thread.is_alive():
+            return _lease_thread
+        if _lease_ready.is_set() and not force:
+            return None
+        _lease_thread = threading.Thread(target=_warm_leases, name="lease-warmup", daemon=True)
+        _lease_thread.start()
+        return _lease_thread
+
+
+def invalidate_leases():
+    """Drop cached lease IDs (e.g. a conversion was rejected) and re-warm."""
+    _lease_ready.clear()
+    warm_leases(force=True)
+
+
+def wait_for_leases(timeout=LEASE_WAIT_TIMEOUT):
+    if not _lease_ready.is_set():
+        warm_leases()
+    return _lease_ready.wait(timeout)
+
+
+def get_lease_id(ticker):
+    with _lease_lock:
+        return _lease_ids.get(ticker)
+
+
 class Converter():
     def __init__(self):
-        self.creation_id = None
-        self.redemption_id = None
+        # Lease IDs come from the session cache; warming happens in the
+        # background, concurrently with the first market-data fetches.
         self.initialize_leases()
 
+    @property
+    def creation_id(self):
+        return get_lease_id("ETF-Creation")
+
+    @property
+    def redemption_id(self):
+        return get_lease_id("ETF-Redemption")
+
     def init_paths(self, leases):
-        for lease in leases.json():
-            if lease['ticker'] == 'ETF-Creation':
-                self.creation_id = lease['id']
-            elif lease['ticker'] == 'ETF-Redemption':
-                self.redemption_id = lease['id']
+        with _lease_lock:
+            for lease in leases.json():
+                if lease['ticker'] in LEASE_TICKERS:
+                    _lease_ids[lease['ticker']] = lease['id']
+            if all(t in _lease_ids for t in LEASE_TICKERS):
+                _lease_ready.set()
 
     def initialize_leases(self):
-        leases = get_leases()
-        if len(leases.json()) == 0:
-            open_leases()
-            sleep(2)
-            leases = get_leases()
-        self.init_paths(leases)
+        if _order_router is None:   # Routed conversions use the gateway's leases
+            warm_leases()
+
+    def revalidate(self):
+        """Re-check lease IDs in the background (e.g. on a new period)."""
+        warm_leases(force=True)
+
+    def _lease_endpoint(self, ticker):
+        if not wait_for_leases():
+            print(f"[ERROR] {ticker} lease not ready")
+            return None
+        lease_id = get_lease_id(ticker)
+        if lease_id is None:
+            print(f"[ERROR] No {ticker} lease ID")
+            invalidate_leases()
+            return None
+        return f"{API}/leases/{lease_id}"
+
+    def _record_legs(self, legs):
+        """A conversion moves positions like fills on every leg."""
+        for ticker, action, qty in legs:
+            record_fill(ticker, action, int(qty))
 
     def convert_ritc(self, qty_ritc, itr=0):
         if qty_ritc == 0:  # FIXED: was qty instead of qty_ritc
             return None
-        endpoint = f"{API}/leases/{self.redemption_id}"
+        if _order_router is not None:
+            return _order_router.convert('convert_ritc', qty_ritc)
+        endpoint = self._lease_endpoint("ETF-Redemption")
+        if endpoint is None:
+            return None
         resp = s.post(endpoint, params={"from1": "RITC", "quantity1": int(qty_ritc), 
                                       "from2": "USD", "quantity2": int(1500*qty_ritc // 10000)})
         if not resp.ok:
             print(f"[RETRY]", end=' ')
-            if itr < 10:
-                sleep(1.5)
+            if resp.status_code == 404:
+                invalidate_leases()  # Lease disappeared (new period), re-open lazily
+            if itr < CONVERT_MAX_RETRIES and retry_allowed(CONVERT_RETRY_DELAY):
+                sleep(CONVERT_RETRY_DELAY)
                 return self.convert_ritc(qty_ritc, itr + 1)  # FIXED: added return
+        else:
+            self._record_legs([(RITC, 'SELL', qty_ritc), (BULL, 'BUY', qty_ritc), (BEAR, 'BUY', qty_ritc),
+                               (USD, 'SELL', 1500*qty_ritc // 10000)])
         return resp
 
     def convert_bull_bear(self, qty, itr=0):
         if qty == 0:
             return None
-        endpoint = f"{API}/leases/{self.creation_id}"
+        if _order_router is not None:
+            return _order_router.convert('convert_bull_bear', qty)
+        endpoint = self._lease_endpoint("ETF-Creation")
+        if endpoint is None:
+            return None
         resp = s.post(endpoint, params={"from1": "BULL", "quantity1": int(qty), 
                                       "from2": "BEAR", "quantity2": int(qty), 
                                       "from3": "USD", "quantity3": int(1500*qty // 10000)})
         if not resp.ok:
             print(f"[RETRY]", end=' ')
-            if itr < 10:
-                sleep(1.5)
+            if resp.status_code == 404:
+                invalidate_leases()  # Lease disappeared (new period), re-open lazily
+            if itr < CONVERT_MAX_RETRIES and retry_allowed(CONVERT_RETRY_DELAY):
+                sleep(CONVERT_RETRY_DELAY)
                 return self.convert_bull_bear(qty, itr + 1)  # FIXED: added return
+        else:
+            self._record_legs([(BULL, 'SELL', qty), (BEAR, 'SELL', qty), (RITC, 'BUY', qty),
+                               (USD, 'SELL', 1500*qty // 10000)])
         return resp
 
 
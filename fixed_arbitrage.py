@@ -2,82 +2,59 @@
 # Major fixes: Correct currency conversion, proper execution sequence, complete profit calculations
 
 from final_utils import *
+from sizing import size_conversion_arbitrage, current_books
+from nav_engine import current_nav
 
 def check_conversion_arbitrage_fixed(converter):
     """COMPLETELY FIXED: Arbitrage with correct FX, sequencing, and profit calculations"""
     
-    # Get current market prices
-    bull_bid, bull_ask, _, _ = best_bid_ask(BULL)
-    bear_bid, bear_ask, _, _ = best_bid_ask(BEAR)
-    ritc_bid_usd, ritc_ask_usd, _, _ = best_bid_ask(RITC)
-    usd_bid, usd_ask, _, _ = best_bid_ask(USD)
+    # Get current market prices (shared NAV view for this snapshot)
+    nav = current_nav()
+    if not nav['valid']:
+        return False
+    bull_bid, bull_ask = nav['bull_bid'], nav['bull_ask']
+    bear_bid, bear_ask = nav['bear_bid'], nav['bear_ask']
+    ritc_bid_usd, ritc_ask_usd = nav['ritc_bid'], nav['ritc_ask']
+    usd_bid, usd_ask = nav['usd_bid'], nav['usd_ask']
     
-    # FIXED: Use smaller, more realistic trade size
-    q = 500  # Reduced trade size for better execution
+    # IMPROVED: Size each direction from full depth (one vectorized pass over
+    # every candidate size) instead of a hardcoded q = 500
+    books = current_books()
+    positions = positions_map()
+    create = size_conversion_arbitrage(books, 'CREATE', positions)
+    redeem = size_conversion_arbitrage(books, 'REDEEM', positions)
+    q1, profit1 = create['quantity'], create['profit']
+    q2, profit2 = redeem['quantity'], redeem['profit']
     
     print(f"\n=== FIXED ARBITRAGE ANALYSIS ===")
     print(f"BULL: {bull_bid:.4f}/{bull_ask:.4f} CAD")
     print(f"BEAR: {bear_bid:.4f}/{bear_ask:.4f} CAD")
     print(f"RITC: {ritc_bid_usd:.4f}/{ritc_ask_usd:.4f} USD")
     print(f"USD: {usd_bid:.6f}/{usd_ask:.6f} CAD/USD")
-    print(f"Trade size: {q} shares")
 
     # Direction 1: Create ETF (Buy stocks → Convert → Sell ETF)
-    # FIXED: Account for all costs and proper FX conversion
-    stock_cost_total = (bull_ask + bear_ask) * q  # Cost to buy stocks
-    stock_fees = q * 0.04  # Stock transaction fees (2¢ per share for each stock)
-    conversion_cost_cad = 1500  # Converter fee in CAD
-    
-    # ETF sale proceeds (we get USD, then convert to CAD at bid rate)
-    etf_sale_proceeds_usd = ritc_bid_usd * q  # USD from selling ETF
-    etf_fees_usd = q * 0.02  # ETF transaction fee in USD
-    net_etf_proceeds_usd = etf_sale_proceeds_usd - etf_fees_usd
-    net_etf_proceeds_cad = net_etf_proceeds_usd * usd_bid  # Convert USD to CAD at bid
-    
-    total_cost_direction1 = stock_cost_total + stock_fees + conversion_cost_cad
-    profit1 = net_etf_proceeds_cad - total_cost_direction1
-    
     # Direction 2: Redeem ETF (Buy ETF → Convert → Sell stocks)
-    # FIXED: Account for all costs and proper FX conversion
-    etf_cost_usd = ritc_ask_usd * q + q * 0.02  # Cost to buy ETF including fees
-    fx_cost_to_buy_usd = etf_cost_usd * usd_ask  # CAD cost to buy required USD
-    
-    # Stock sale proceeds
-    stock_sale_proceeds = (bull_bid + bear_bid) * q  # CAD from selling stocks
-    stock_sale_fees = q * 0.04  # Stock transaction fees
-    net_stock_proceeds = stock_sale_proceeds - stock_sale_fees
-    
-    total_cost_direction2 = fx_cost_to_buy_usd + conversion_cost_cad
-    profit2 = net_stock_proceeds - total_cost_direction2
+    # Both net of fees, FX and conversion_cost(q), walking every book level
+    print(f"Direction 1 (Create ETF): {profit1:.2f} CAD on {q1} shares")
+    print(f"Direction 2 (Redeem ETF): {profit2:.2f} CAD on {q2} shares")
 
-    print(f"Direction 1 (Create ETF): {profit1:.2f} CAD")
-    print(f"  Stock cost: {stock_cost_total:.2f} + fees: {stock_fees:.2f}")
-    print(f"  Conversion: {conversion_cost_cad:.2f} CAD")
-    print(f"  ETF proceeds: {net_etf_proceeds_cad:.2f} CAD")
-    
-    print(f"Direction 2 (Redeem ETF): {profit2:.2f} CAD") 
-    print(f"  ETF cost: {fx_cost_to_buy_usd:.2f} CAD")
-    print(f"  Conversion: {conversion_cost_cad:.2f} CAD") 
-    print(f"  Stock proceeds: {net_stock_proceeds:.2f} CAD")
-
-    # Calculate theoretical fair value for reference
-    theoretical_etf_cad = (bull_bid + bull_ask + bear_bid + bear_ask) / 2
-    market_etf_cad = (ritc_bid_usd + ritc_ask_usd) / 2 * (usd_bid + usd_ask) / 2
-    deviation = abs(theoretical_etf_cad - market_etf_cad)
-    
-    print(f"Fair RITC: {theoretical_etf_cad:.4f} CAD, Market: {market_etf_cad:.4f} CAD")
-    print(f"Deviation: {deviation:.4f} CAD")
+    # Theoretical fair value for reference (microprice-based, from the NAV engine)
+    print(f"Fair RITC: {nav['ritc_fair_cad']:.4f} CAD, Market: {nav['ritc_market_cad']:.4f} CAD")
+    print(f"Deviation: {abs(nav['deviation_cad']):.4f} CAD")
+    print(f"Top-of-book edge/share: create {nav['creation_edge']:.4f}, redeem {nav['redemption_edge']:.4f} CAD")
 
     # Execute only if profitable above minimum threshold
     min_profit_threshold = 50  # CAD minimum profit to cover execution risks
     
     if profit1 > min_profit_threshold and profit1 > profit2 and within_limits():
         print(f"✓ EXECUTING Direction 1: Create ETF ({profit1:.2f} CAD profit)")
-        return execute_create_etf_arbitrage_fixed(converter, q, profit1)
+        with no_deadline():  # Only the analysis runs under the scheduler's deadline
+            return execute_create_etf_arbitrage_fixed(converter, q1, profit1)
         
     elif profit2 > min_profit_threshold and within_limits():
         print(f"✓ EXECUTING Direction 2: Redeem ETF ({profit2:.2f} CAD profit)")
-        return execute_redeem_etf_arbitrage_fixed(converter, q, profit2)
+        with no_deadline():
+            return execute_redeem_etf_arbitrage_fixed(converter, q2, profit2)
         
     else:
         print("✗ No profitable arbitrage opportunity")
@@ -248,22 +225,14 @@ def execute_redeem_etf_arbitrage_fixed(converter, q, expected_profit):
 def statistical_arbitrage_fixed():
     """FIXED: Statistical arbitrage without converter, focusing on price relationships"""
     try:
-        # Get mid prices for fair value calculation
-        bull_bid, bull_ask, _, _ = best_bid_ask(BULL)
-        bear_bid, bear_ask, _, _ = best_bid_ask(BEAR)
-        ritc_bid_usd, ritc_ask_usd, _, _ = best_bid_ask(RITC)
-        usd_bid, usd_ask, _, _ = best_bid_ask(USD)
-
-        bull_mid = (bull_bid + bull_ask) / 2
-        bear_mid = (bear_bid + bear_ask) / 2
-        ritc_mid_usd = (ritc_bid_usd + ritc_ask_usd) / 2
-        usd_mid = (usd_bid + usd_ask) / 2
-
-        # Calculate fair value relationship
-        fair_etf_cad = bull_mid + bear_mid  # ETF should equal sum of components
-        market_etf_cad = ritc_mid_usd * usd_mid
-        deviation = fair_etf_cad - market_etf_cad
-        deviation_pct = abs(deviation) / fair_etf_cad * 100
+        # Fair value relationship from the shared NAV view (microprices)
+        nav = current_nav()
+        if not nav['valid']:
+            return False
+        fair_etf_cad = nav['ritc_fair_cad']  # ETF should equal sum of components
+        market_etf_cad = nav['ritc_market_cad']
+        deviation = nav['deviation_cad']
+        deviation_pct = abs(nav['deviation_pct'])
 
         print(f"\n=== STATISTICAL ARBITRAGE ANALYSIS ===")
         print(f"Fair ETF value: {fair_etf_cad:.4f} CAD")
@@ -282,11 +251,13 @@ def statistical_arbitrage_fixed():
             
             if deviation > 0:  # ETF undervalued relative to stocks
                 print(f"✓ ETF UNDERVALUED - Buy ETF, Sell Stocks ({q} shares)")
-                return execute_stat_arb_buy_etf(q, deviation)
+                with no_deadline():
+                    return execute_stat_arb_buy_etf(q, deviation)
                 
             else:  # ETF overvalued relative to stocks  
                 print(f"✓ ETF OVERVALUED - Sell ETF, Buy Stocks ({q} shares)")
-                return execute_stat_arb_sell_etf(q, abs(deviation))
+                with no_deadline():
+                    return execute_stat_arb_sell_etf(q, abs(deviation))
         else:
             print(f"✗ No statistical arbitrage opportunity")
             print(f"   Minimum deviation: {min_deviation_pct}%")
@@ -17,6 +17,82 @@ from tender_eval import check_tender
 from fixed_arbitrage import check_conversion_arbitrage_fixed, statistical_arbitrage_fixed
 from arb import StatArbTrader
 from arb2 import ETFArbitrageTrader
+from tick_clock import TickClock
+from scheduler import StrategyScheduler
+from md_publisher import MarketDataPublisher
+from nav_engine import nav
+from replenishment import replenishment, seed_from_recordings
+from signals import signals
+from risk_engine import risk
+from recorder import recorder
+
+# Strategies scheduled alongside tender handling
+ENABLE_STAT_ARB = True
+ENABLE_ETF_ARB = True
+ENABLE_CONVERSION_ARB = True
+TENDER_BUDGET = 1.0       # Seconds; informational only, tenders are never skipped
+ARB_BUDGET = 0.5          # Seconds per tick for the stat-arb / ETF-arb books
+CONVERSION_BUDGET = 0.5   # Seconds per tick for conversion arbitrage
+REPORT_EVERY_TICKS = 60  # Print tick/latency stats this often
+USE_MULTIPROCESS = False  # One market-data/gateway process + one process per strategy
+ENABLE_RECORDER = True    # Snapshots, tenders, fills and decisions to output/session_*.rec
+ERROR_BACKOFF_SECONDS = 0.5   # Doubles per consecutive failed tick, capped below
+MAX_ERROR_BACKOFF = 5.0
+
+
+def print_breaker_report():
+    metrics = breaker_metrics()
+    budget = metrics.pop('retry_budget')
+    rows = [[key, m['state'], m['calls'], m['failures'], m['short_circuited'], m['times_opened'],
+             f"{m['mean_ms']:.1f}"] for key, m in sorted(metrics.items())]
+    print(tabulate(rows, headers=['endpoint', 'state', 'calls', 'fail', 'short', 'opened', 'mean ms']))
+    print(f"Retry budget: {budget['tokens']:.1f} tokens, {budget['granted']} granted, {budget['denied']} denied")
+
+
+# Strategy process factories (top-level so they pickle under spawn)
+def tender_process():
+    converter = Converter()
+    seed_from_recordings()
+    return lambda tick, snap: check_tender(converter)
+
+def stat_arb_process():
+    trader = StatArbTrader()
+    return lambda tick, snap: trader.run_strategy()
+
+def etf_arb_process():
+    trader = ETFArbitrageTrader()
+    return lambda tick, snap: trader.run_strategy()
+
+def conversion_arb_process():
+    converter = Converter()
+    return lambda tick, snap: check_conversion_arbitrage_fixed(converter)
+
+
+def main_multiprocess():
+    """Market data + order gateway in this process; each book in its own
+    process reading the shared-memory snapshot and sending orders back."""
+    print("=== MULTI-PROCESS ETF ARBITRAGE SYSTEM ===")
+    Converter()  # Warm the lease cache once for the whole session
+    # Orders, tender accepts and conversions from every process pass through
+    # the gateway here, so the risk engine in this process sees all of them
+    # (and can reject orders); limit fills are applied as the gateway polls them
+    set_risk_engine(risk)
+    risk.load_limits()
+    publisher = MarketDataPublisher()
+    publisher.add_local('risk', risk.on_tick)
+    if ENABLE_RECORDER:
+        # Gateway fills are recorded here; strategy processes have no recorder
+        set_recorder(recorder.start())
+        publisher.add_local('recorder', recorder.on_tick)
+    publisher.add_strategy_process('tender', tender_process)
+    if ENABLE_STAT_ARB:
+        publisher.add_strategy_process('stat_arb', stat_arb_process)
+    if ENABLE_ETF_ARB:
+        publisher.add_strategy_process('etf_arb', etf_arb_process)
+    if ENABLE_CONVERSION_ARB:
+        publisher.add_strategy_process('conversion_arb', conversion_arb_process)
+    publisher.run(TickClock())
+
 
 def main():
     """FIXED: Main trading loop with comprehensive error handling and monitoring"""
@@ -35,28 +111,73 @@ def main():
     consecutive_errors = 0
     max_consecutive_errors = 5
     
-    while True: 
-        tick, status = get_tick_status()
+    # Lease IDs are cached for the whole session and warmed in the background,
+    # so building the converter here never delays the first decision.
+    converter = Converter()
+    seed_from_recordings()   # Offline replenishment estimates from output/*.pkl
+    set_risk_engine(risk)    # Pre-trade checks on every order; case limits from /limits
+    risk.load_limits()
+    if ENABLE_RECORDER:
+        set_recorder(recorder.start())   # Background writer; never blocks the loop
 
-        if status == 'ACTIVE':
-            converter = Converter()
+    # All books run in this process off one snapshot per tick. Tenders run
+    # inline on the clock thread; the arb books each get a worker thread and
+    # a time budget so they can never starve tender handling.
+    scheduler = StrategyScheduler()
+    scheduler.add('tender', lambda tick, snap: check_tender(converter), budget=TENDER_BUDGET, critical=True)
+    stat_arb = StatArbTrader()
+    scheduler.add('stat_arb', lambda tick, snap: stat_arb.run_strategy(), budget=ARB_BUDGET)
+    etf_arb = ETFArbitrageTrader()
+    scheduler.add('etf_arb', lambda tick, snap: etf_arb.run_strategy(), budget=ARB_BUDGET)
+    scheduler.add('conversion_arb', lambda tick, snap: check_conversion_arbitrage_fixed(converter), budget=CONVERSION_BUDGET)
+    scheduler.set_enabled('stat_arb', ENABLE_STAT_ARB)
+    scheduler.set_enabled('etf_arb', ENABLE_ETF_ARB)
+    scheduler.set_enabled('conversion_arb', ENABLE_CONVERSION_ARB)
+    # Any open breaker: shed the arb books and keep the API for tenders
+    scheduler.set_health_check(lambda: not open_breakers())
 
-        
-        # arb = StatArbTrader()
-        # arb = ETFArbitrageTrader()
-        while status == "ACTIVE" and consecutive_errors < max_consecutive_errors:
-            # place_mkt(RITC, 'BUY', 1000)
+    # The clock polls fast only around the expected tick boundary and hands
+    # the scheduler exactly one snapshot per tick.
+    clock = TickClock()
+    clock.register('risk', risk.on_tick)   # Reconcile positions before anyone trades
+    if ENABLE_RECORDER:
+        clock.register('recorder', recorder.on_tick)   # Pre-decision state of every tick
+    clock.register('nav', nav.on_tick)   # One fair-value view per tick, before any strategy
+    clock.register('replenishment', replenishment.on_tick)
+    clock.register('signals', signals.on_tick)
+    clock.register('scheduler', scheduler.run_tick)
+
+    last_tick = None
+    while consecutive_errors < max_consecutive_errors:
+        try:
+            tick, status = clock.wait_for_tick()
+
+            if last_tick is None or tick < last_tick:
+                converter.revalidate()  # New period: re-check leases lazily
+            last_tick = tick
 
-            sleep(3)
-            # place_mkt(RITC, 'SELL', 1000)
             loop_count += 1
-            # current_time = time.time()
-            check_tender(converter)
-            # arb.run_strategy()
+            clock.dispatch(tick)
+            consecutive_errors = 0
+        except Exception as e:
+            # /case or the snapshot failed (or its breaker is open): back off
+            consecutive_errors += 1
+            backoff = min(ERROR_BACKOFF_SECONDS * 2 ** (consecutive_errors - 1), MAX_ERROR_BACKOFF)
+            print(f"[ERROR] Tick loop failed ({consecutive_errors}/{max_consecutive_errors}): {e}")
+            sleep(backoff)
+            continue
 
-            tick, status = get_tick_status()
-            sleep(0.5)
+        if loop_count % REPORT_EVERY_TICKS == 0:
+            clock.print_report()
+            scheduler.print_report()
+            print(f"Risk: {risk.metrics()}")
+            if ENABLE_RECORDER:
+                print(f"Recorder: {recorder.metrics()}")
+            print_breaker_report()
         
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if USE_MULTIPROCESS:
+        main_multiprocess()
+    else:
+        main()
\ No newline at end of file
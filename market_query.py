@@ -0,0 +1,169 @@
+# MARKET DATA QUERIES
+# Point lookups and range scans over a tick store (tick_store.py). Opening
+# reads only the per-snapshot (tick, ts) index and the tender tables; book
+# rows stay memory-mapped. Ticks restart every period, so each snapshot gets
+# a session key of period * TICKS_PER_PERIOD + tick (a new period is any
+# tick going backwards); lookups binary-search that key or the timestamp in
+# O(log n) and range scans yield one snapshot or book at a time.
+
+from final_utils import *
+from rit_sim import TICKS_PER_PERIOD
+from tick_store import TickStore, STORE_DIR, PRICE_SCALE, convert_pickles
+
+
+class MarketQuery():
+    def __init__(self, path=STORE_DIR, ticks_per_period=TICKS_PER_PERIOD):
+        self.store = TickStore(path)
+        self.ticks_per_period = ticks_per_period
+        index = self.store.snapshot_index()
+        self.tick = index['tick'].astype(np.int64)
+        self.ts = index['ts'].astype(np.float64)
+        if np.any(np.diff(self.ts) < 0):
+            raise ValueError("Tick store snapshots are not in time order")
+        # 1-based period of each snapshot, and a key that only ever grows
+        self.period = 1 + np.concatenate(([0], np.cumsum(np.diff(self.tick) < 0)))
+        self.key = self.period * ticks_per_period + self.tick
+
+        # Secondary index: every sighting of a tender, sorted by tender_id
+        rows = []
+        for seg, offset in zip(self.store.segments, self.store.offsets):
+            t = seg.tenders
+            rows.append(np.stack([t['tender_id'], t['snap'].astype(np.int64) + int(offset)], axis=1))
+        sightings = np.concatenate(rows) if rows else np.empty((0, 2), np.int64)
+        order = np.lexsort((sightings[:, 1], sightings[:, 0]))
+        self.tender_ids = sightings[order, 0]
+        self.tender_snaps = sightings[order, 1]
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def periods(self):
+        return int(self.period[-1]) if len(self) else 0
+
+    # ---- point lookups (O(log n)) ----
+    def _session_key(self, tick, period):
+        return (period or self.periods) * self.ticks_per_period + tick
+
+    def at_tick(self, tick, period=None):
+        """Number of the last snapshot at or before `tick` of `period` (default:
+        the last period), or None if there is none."""
+        n = int(np.searchsorted(self.key, self._session_key(tick, period), side='right')) - 1
+        if n < 0 or self.period[n] != (period or self.periods):
+            return None   # Nothing yet in that period; never fall back to the one before
+        return n
+
+    def at_time(self, ts):
+        """Number of the last snapshot taken at or before epoch time `ts`."""
+        n = int(np.searchsorted(self.ts, ts, side='right')) - 1
+        return n if n >= 0 else None
+
+    def snapshot(self, n):
+        return None if n is None else self.store.snapshot(n)
+
+    def book(self, n, ticker):
+        """Aggregated book of `ticker` in snapshot n: {'bids': [(price, qty)],
+        'asks': [...]}, touch first."""
+        book = {}
+        for side in ('bids', 'asks'):
+            prices, qtys = self.store.book(n, ticker, side)
+            book[side] = list(zip(prices.tolist(), qtys.tolist()))
+        return book
+
+    def book_at_tick(self, ticker, tick, period=None):
+        n = self.at_tick(tick, period)
+        return None if n is None else self.book(n, ticker)
+
+    def book_at_time(self, ticker, ts):
+        n = self.at_time(ts)
+        return None if n is None else self.book(n, ticker)
+
+    # ---- range scans (lazy) ----
+    def tick_range(self, start, stop, period=None):
+        """Snapshot numbers with start <= tick < stop in `period` (default: the
+        last), or across the whole session if period is 0."""
+        if period == 0:
+            return np.flatnonzero((self.tick >= start) & (self.tick < stop))
+        lo = int(np.searchsorted(self.key, self._session_key(start, period), side='left'))
+        hi = int(np.searchsorted(self.key, self._session_key(stop, period), side='left'))
+        return range(lo, hi)
+
+    def time_range(self, t0, t1):
+        """Snapshot numbers taken in [t0, t1)."""
+        return range(int(np.searchsorted(self.ts, t0, side='left')), int(np.searchsorted(self.ts, t1, side='left')))
+
+    def period_range(self, period):
+        return range(int(np.searchsorted(self.period, period, side='left')),
+                     int(np.searchsorted(self.period, period, side='right')))
+
+    def scan(self, numbers):
+        """Full snapshots (aggregated layout) for `numbers`, one at a time."""
+        for n in numbers:
+            yield self.store.snapshot(int(n))
+
+    def scan_books(self, ticker, numbers):
+        """(tick, ts, book) of `ticker` for `numbers`, one at a time."""
+        for n in numbers:
+            n = int(n)
+            yield int(self.tick[n]), float(self.ts[n]), self.book(n, ticker)
+
+    def touch(self, ticker, numbers):
+        """Best bid / ask of `ticker` as arrays (NaN where a side is empty),
+        read straight from the level-0 rows."""
+        bid = np.full(len(numbers), np.nan)
+        ask = np.full(len(numbers), np.nan)
+        for i, n in enumerate(numbers):
+            seg, j = self.store.locate(int(n))
+            r = seg.rows(j)
+            top = (r['ticker'] == SNAPSHOT_TICKERS.index(ticker)) & (r['level'] == 0)
+            for side, price in zip(r['side'][top], r['price'][top]):
+                (bid if side == 0 else ask)[i] = price / PRICE_SCALE
+        return bid, ask
+
+    # ---- tenders ----
+    def tender_sightings(self, tender_id):
+        """Snapshot numbers in which `tender_id` was outstanding (O(log n))."""
+        lo = int(np.searchsorted(self.tender_ids, tender_id, side='left'))
+        hi = int(np.searchsorted(self.tender_ids, tender_id, side='right'))
+        return self.tender_snaps[lo:hi]
+
+    def tender(self, tender_id):
+        """The tender as first seen, with the first / last snapshot it was seen in."""
+        seen = self.tender_sightings(tender_id)
+        if not len(seen):
+            return None
+        snap = self.store.snapshot(int(seen[0]))
+        tender = next(t for t in snap['tenders'] if t['tender_id'] == tender_id)
+        return dict(tender, first_seen=int(seen[0]), last_seen=int(seen[-1]),
+                    period=int(self.period[seen[0]]))
+
+    def tenders(self, numbers=None, period=None):
+        """Distinct tenders first seen within `numbers` or `period` (default:
+        the whole session), in order of appearance."""
+        if period is not None:
+            numbers = self.period_range(period)
+        ids, idx = np.unique(self.tender_ids, return_index=True)
+        first = self.tender_snaps[idx]   # Sightings sort by snapshot within an id
+        if isinstance(numbers, range):
+            keep = (first >= numbers.start) & (first < numbers.stop)
+        elif numbers is not None:
+            keep = np.isin(first, np.asarray(numbers))
+        else:
+            keep = np.ones(len(ids), bool)
+        order = np.argsort(first[keep], kind='stable')
+        return [self.tender(int(i)) for i in ids[keep][order]]
+
+
+def open_query(path=STORE_DIR, pattern="output/*.pkl"):
+    """Query the tick store at `path`, converting the recorded pickles first
+    if it does not exist yet."""
+    if not os.path.exists(os.path.join(path, "index.json")):
+        convert_pickles(pattern, path)
+    return MarketQuery(path)
+
+
+if __name__ == "__main__":
+    q = open_query()
+    print(f"Market query: {len(q)} snapshots over {q.periods} period(s), {len(q.tenders())} tenders")
+    n = q.at_tick(int(q.tick[-1]))
+    print(q.book(n, RITC))
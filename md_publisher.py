@@ -0,0 +1,411 @@
+# MULTI-PROCESS MARKET DATA
+# One process owns the RIT connection: it publishes aggregated books,
+# positions, tenders and the tick into a shared-memory region guarded by a
+# seqlock, and runs an order gateway that strategy processes reach through
+# a multiprocessing queue for orders, tender accepts and conversions.
+# Strategy processes read the region zero-copy and never touch the API for
+# market data, so adding cores adds no API load.
+
+from final_utils import *
+import itertools
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+from circuit_breaker import DEFAULT_TIMEOUT
+
+SHM_NAME = "rit_market_data"
+MAX_LEVELS = 20          # Aggregated price levels kept per side
+MAX_TENDERS = 4
+BOOK_TICKERS = SNAPSHOT_TICKERS              # USD, BULL, BEAR, RITC
+POSITION_TICKERS = (BULL, BEAR, RITC, USD, CAD)
+TENDER_FIELDS = ('tender_id', 'price', 'quantity', 'action', 'tick', 'expires', 'is_fixed_bid', 'period')
+
+SEQLOCK_SPIN_LIMIT = 10000
+SHM_SNAPSHOT_MAX_AGE = 1.5   # Publisher refreshes once per tick; tolerate ~1.5 ticks
+GATEWAY_WORKERS = 8      # Requests served concurrently, so a slow conversion never holds up orders
+# Seconds a strategy process waits for a reply: the op's worst case plus slack
+GATEWAY_TIMEOUT = 3 * DEFAULT_TIMEOUT + 1.0    # place_mkt: three attempts
+CONVERT_TIMEOUT = (LEASE_WAIT_TIMEOUT + (CONVERT_MAX_RETRIES + 1) * DEFAULT_TIMEOUT
+                   + CONVERT_MAX_RETRIES * CONVERT_RETRY_DELAY + 1.0)   # Lease wait, then retried POSTs
+STRATEGY_POLL_SECONDS = 0.002
+
+# Header slots (int64)
+H_SEQ, H_TICK, H_ACTIVE, H_PUBLISHES, H_NTENDERS = range(5)
+HEADER_SLOTS = 8
+
+
+class MarketDataLayout():
+    """Offsets of every array inside the shared block."""
+    def __init__(self, max_levels=MAX_LEVELS, max_tenders=MAX_TENDERS):
+        self.max_levels = max_levels
+        self.max_tenders = max_tenders
+        self.specs = [
+            ('header', np.int64, (HEADER_SLOTS,)),
+            ('timestamp', np.float64, (1,)),
+            ('positions', np.float64, (len(POSITION_TICKERS),)),
+            ('depth', np.int32, (len(BOOK_TICKERS), 2)),
+            ('books', np.float64, (len(BOOK_TICKERS), 2, max_levels, 2)),   # [ticker, bid/ask, level, price/qty]
+            ('tenders', np.float64, (max_tenders, len(TENDER_FIELDS))),
+        ]
+        self.offsets = {}
+        offset = 0
+        for name, dtype, shape in self.specs:
+            offset = (offset + 7) // 8 * 8
+            self.offsets[name] = offset
+            offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self.size = offset
+
+    def views(self, buf):
+        return {name: np.ndarray(shape, dtype=dtype, buffer=buf, offset=self.offsets[name])
+                for name, dtype, shape in self.specs}
+
+
+class SharedMarketData():
+    """Seqlocked market-data region. The writer is the publisher process;
+    any number of readers attach by name."""
+    def __init__(self, name=SHM_NAME, create=False, layout=None):
+        self.layout = layout or MarketDataLayout()
+        if create:
+            try:
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=self.layout.size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = create
+        self.v = self.layout.views(self.shm.buf)
+        if create:
+            for arr in self.v.values():
+                arr[...] = 0
+        self._copy = {k: np.empty_like(a) for k, a in self.v.items()}
+
+    # --- writer side ---
+    def publish(self, snapshot):
+        v = self.v
+        header = v['header']
+        header[H_SEQ] += 1                     # odd: write in progress
+        header[H_TICK] = snapshot.get('tick') or 0
+        header[H_ACTIVE] = 1
+        v['timestamp'][0] = snapshot.get('taken_at', time.time())
+
+        positions = snapshot.get('positions', {})
+        for i, ticker in enumerate(POSITION_TICKERS):
+            v['positions'][i] = positions.get(ticker, 0)
+
+        for i, ticker in enumerate(BOOK_TICKERS):
+            book = snapshot[ticker.lower()]
+            for side, key in enumerate(('bids', 'asks')):
+                levels = aggregate_levels(book[key], self.layout.max_levels)
+                n = len(levels)
+                v['depth'][i, side] = n
+                if n:
+                    v['books'][i, side, :n] = levels
+
+        tenders = snapshot.get('tenders', [])[:self.layout.max_tenders]
+        for i, tender in enumerate(tenders):
+            row = v['tenders'][i]
+            row[0] = tender['tender_id']
+            row[1] = tender['price']
+            row[2] = tender['quantity']
+            row[3] = 1 if tender['action'] == 'BUY' else -1
+            row[4] = tender.get('tick', 0)
+            row[5] = tender.get('expires', 0)
+            row[6] = 1 if tender.get('is_fixed_bid') else 0
+            row[7] = tender.get('period', 0)
+        header[H_NTENDERS] = len(tenders)
+        header[H_PUBLISHES] += 1
+        header[H_SEQ] += 1                     # even: consistent
+
+    def set_inactive(self):
+        header = self.v['header']
+        header[H_SEQ] += 1
+        header[H_ACTIVE] = 0
+        header[H_SEQ] += 1
+
+    # --- reader side ---
+    def seq(self):
+        return int(self.v['header'][H_SEQ])
+
+    def tick(self):
+        """Zero-copy peek at the published tick (may be mid-write)."""
+        return int(self.v['header'][H_TICK])
+
+    def read(self):
+        """Consistent copy of the whole region via the seqlock. Reuses the
+        same buffers every call, so callers must copy what they keep."""
+        for _ in range(SEQLOCK_SPIN_LIMIT):
+            s1 = self.seq()
+            if s1 & 1:
+                continue
+            for k, arr in self.v.items():
+                np.copyto(self._copy[k], arr)
+            if self.seq() == s1:
+                return self._copy
+        raise RuntimeError("seqlock: writer never settled")
+
+    def read_snapshot(self):
+        """Rebuild a final_utils-style snapshot dict from the shared region."""
+        c = self.read()
+        header = c['header']
+        snap = {'tick': int(header[H_TICK]), 'taken_at': float(c['timestamp'][0]),
+                'max_age': SHM_SNAPSHOT_MAX_AGE, 'active': bool(header[H_ACTIVE])}
+        snap['timestamp'] = datetime.datetime.fromtimestamp(snap['taken_at']).isoformat()
+        for i, ticker in enumerate(BOOK_TICKERS):
+            book = {}
+            for side, key in enumerate(('bids', 'asks')):
+                n = int(c['depth'][i, side])
+                book[key] = [{'price': float(p), 'quantity': float(q), 'quantity_filled': 0.0}
+                             for p, q in c['books'][i, side, :n]]
+            snap[ticker.lower()] = book
+        snap['positions'] = {t: int(c['positions'][i]) for i, t in enumerate(POSITION_TICKERS)}
+        tenders = []
+        for row in c['tenders'][:int(header[H_NTENDERS])]:
+            tenders.append({'tender_id': int(row[0]), 'ticker': RITC, 'price': float(row[1]),
+                            'quantity': float(row[2]), 'action': 'BUY' if row[3] > 0 else 'SELL',
+                            'tick': int(row[4]), 'expires': int(row[5]),
+                            'is_fixed_bid': bool(row[6]), 'period': int(row[7])})
+        snap['tenders'] = tenders
+        snap['tender'] = tenders[0] if tenders else {}
+        return snap
+
+    def read_snapshot_if_active(self):
+        snap = self.read_snapshot()
+        return snap if snap['active'] else None
+
+    def close(self):
+        self.v = None
+        self._copy = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# --------- ORDER GATEWAY ----------
+def _response_payload(resp):
+    """What a strategy process needs of a requests.Response."""
+    return None if resp is None else {'ok': resp.ok, 'status_code': resp.status_code, 'text': resp.text}
+
+
+class OrderGateway():
+    """Services order requests from strategy processes on a thread inside
+    the process that owns the RIT session. Fills, tender positions and
+    conversion legs are applied here (risk engine, recorder); limit order
+    fills as STATUS polls reveal them."""
+    OPS = {
+        'MARKET': lambda r: place_mkt(r['ticker'], r['action'], r['quantity']),
+        'CANCEL': lambda r: cancel_order(r['order_id']).ok,
+        'TENDER': lambda r: accept_tender(r['tender']),
+        'CONVERT': lambda r: _response_payload(getattr(Converter(), r['method'])(r['quantity'])),
+    }
+
+    def __init__(self, ctx=None):
+        ctx = ctx or mp.get_context()
+        self.ctx = ctx
+        self.ops = dict(self.OPS, LIMIT=self._place_limit, STATUS=self._order_status)
+        self.working = {}   # Limit order_id -> [ticker, action, quantity_filled applied so far]
+        self.requests = ctx.Queue()
+        self.replies = {}
+        self.handled = 0
+        self.failed = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.pool = ThreadPoolExecutor(GATEWAY_WORKERS, thread_name_prefix="gateway")
+        self._lock = threading.Lock()
+
+    def reply_queue(self, client):
+        if client not in self.replies:
+            self.replies[client] = self.ctx.Queue()
+        return self.replies[client]
+
+    def start(self):
+        self.thread = threading.Thread(target=self._serve, name="order-gateway", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while not self.stop_event.is_set():
+            try:
+                req = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.pool.submit(self._handle, req)
+        self.pool.shutdown(wait=False)
+
+    def _handle(self, req):
+        try:
+            result, error = self.ops[req['op']](req), None
+        except Exception as e:
+            result, error = None, str(e)
+        with self._lock:
+            self.handled += 1
+            if error is not None:
+                self.failed += 1
+        self.replies[req['client']].put({'req_id': req['req_id'], 'result': result, 'error': error})
+
+    def _place_limit(self, r):
+        order = place_limit(r['ticker'], r['action'], r['quantity'], r['price'])
+        if order and 'order_id' in order:
+            with self._lock:
+                self.working[order['order_id']] = [r['ticker'], r['action'], 0]
+        return order
+
+    def _order_status(self, r):
+        status = get_order_status(r['order_id']).json()
+        new = 0
+        with self._lock:
+            order = self.working.get(r['order_id'])
+            if status and order is not None:
+                filled = status.get('quantity_filled', 0)
+                new, order[2] = max(filled - order[2], 0), max(filled, order[2])
+                if status.get('status') in ('TRANSACTED', 'CANCELLED'):
+                    del self.working[r['order_id']]
+        if new > 0:
+            record_fill(order[0], order[1], new, r['order_id'], status.get('vwap') or status.get('price'))
+        return status
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class _GatewayResponse():
+    """Minimal requests.Response stand-in for order status / cancel and
+    conversion replies."""
+    def __init__(self, payload, ok=True, status_code=200, text=""):
+        self.payload = payload
+        self.ok = ok
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return self.payload
+
+
+class GatewayClient():
+    """Order router used inside strategy processes (see set_order_router)."""
+    def __init__(self, client, requests_q, replies_q, timeout=GATEWAY_TIMEOUT):
+        self.client = client
+        self.requests = requests_q
+        self.replies = replies_q
+        self.timeout = timeout
+        self._ids = itertools.count()
+
+    def _call(self, timeout=None, **req):
+        """The op's result, or None (what the order helpers already treat as
+        a failed call) on an error or no reply within the timeout; a late
+        reply is discarded by the next call."""
+        req.update(client=self.client, req_id=next(self._ids))
+        self.requests.put(req)
+        end = time.time() + (timeout or self.timeout)
+        while True:
+            try:
+                reply = self.replies.get(timeout=max(end - time.time(), 0))
+            except queue.Empty:
+                print(f"[ERROR] gateway {req['op']} got no reply in {timeout or self.timeout:.1f}s")
+                return None
+            if reply['req_id'] == req['req_id']:
+                break
+        if reply['error']:
+            print(f"[ERROR] gateway {req['op']} failed: {reply['error']}")
+        return reply['result']
+
+    def place_mkt(self, ticker, action, qty):
+        if qty <= 0:
+            return {'vwap': 0}
+        return self._call(op='MARKET', ticker=ticker, action=action, quantity=qty) or {'vwap': 0}
+
+    def place_limit(self, ticker, action, qty, price):
+        return self._call(op='LIMIT', ticker=ticker, action=action, quantity=qty, price=price)
+
+    def get_order_status(self, _id):
+        return _GatewayResponse(self._call(op='STATUS', order_id=_id))
+
+    def cancel_order(self, _id):
+        ok = self._call(op='CANCEL', order_id=_id)
+        return _GatewayResponse(ok, ok=bool(ok))
+
+    def accept_tender(self, tender):
+        return bool(self._call(op='TENDER', tender=tender))
+
+    def convert(self, method, qty):
+        """Converter.convert_ritc / convert_bull_bear run by the gateway."""
+        reply = self._call(op='CONVERT', method=method, quantity=qty, timeout=CONVERT_TIMEOUT)
+        if reply is None:
+            return None
+        return _GatewayResponse(reply, ok=reply['ok'], status_code=reply['status_code'], text=reply['text'])
+
+
+# --------- PROCESSES ----------
+def strategy_process(name, factory, requests_q, replies_q, stop_event, shm_name=SHM_NAME):
+    """Child entry point: attach to the region, route orders via the gateway
+    and run factory()'s fn(tick, snapshot) once per published tick."""
+    md = SharedMarketData(shm_name)
+    set_order_router(GatewayClient(name, requests_q, replies_q))
+    # Book/position/tender helpers (including inside long unwind loops) now
+    # read the shared region; the API is only hit if the publisher stalls.
+    set_snapshot_source(md.read_snapshot_if_active)
+    fn = factory()
+    last_tick = None
+    try:
+        while not stop_event.is_set():
+            tick = md.tick()
+            if tick == last_tick:
+                sleep(STRATEGY_POLL_SECONDS)
+                continue
+            snapshot = md.read_snapshot()
+            last_tick = snapshot['tick']
+            if not snapshot['active']:
+                continue
+            set_snapshot(snapshot)
+            try:
+                fn(last_tick, snapshot)
+            except Exception as e:
+                print(f"[ERROR] {name} failed on tick {last_tick}: {e}")
+    finally:
+        md.close()
+
+
+class MarketDataPublisher():
+    """Owns the RIT session: tick clock + shared region + order gateway +
+    strategy processes. Critical callbacks (tenders) still run in here."""
+    def __init__(self, shm_name=SHM_NAME):
+        self.ctx = mp.get_context("spawn")
+        self.md = SharedMarketData(shm_name, create=True)
+        self.shm_name = shm_name
+        self.gateway = OrderGateway(self.ctx)
+        self.stop_event = self.ctx.Event()
+        self.processes = []
+        self.local_callbacks = []
+
+    def add_strategy_process(self, name, factory):
+        """factory must be a picklable top-level callable returning fn(tick, snapshot)."""
+        proc = self.ctx.Process(target=strategy_process, name=name, daemon=True,
+                                args=(name, factory, self.gateway.requests,
+                                      self.gateway.reply_queue(name), self.stop_event, self.shm_name))
+        self.processes.append(proc)
+
+    def add_local(self, name, fn):
+        self.local_callbacks.append((name, fn))
+
+    def run(self, clock, max_ticks=None):
+        self.gateway.start()
+        for proc in self.processes:
+            proc.start()
+        for name, fn in self.local_callbacks:
+            clock.register(name, fn)
+        try:
+            while max_ticks is None or clock.ticks_dispatched < max_ticks:
+                tick, _ = clock.wait_for_tick()
+                clock.dispatch(tick, before_callbacks=self.md.publish)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        self.md.set_inactive()
+        for proc in self.processes:
+            proc.join(timeout=2)
+        self.gateway.stop()
+        self.md.close()
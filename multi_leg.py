@@ -0,0 +1,157 @@
+# CONCURRENT MULTI-LEG EXECUTION
+# Sends all legs of an ETF/basket trade at once instead of one round trip
+# after another, hedges USD from the decision-time RITC notional and trues it
+# up after fills, unwinds completed legs if any leg fails, and reports each
+# leg's slippage against the decision-time snapshot.
+
+from final_utils import *
+from concurrent.futures import ThreadPoolExecutor
+
+LEG_TIMEOUT = 10.0       # Seconds to wait for any single leg
+FILL_TOLERANCE = 0.999   # A leg counts as done once this fraction is filled
+USD_FIXUP_MIN = 50       # USD; smaller hedge residuals are left for cleanup
+
+_leg_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="leg")
+
+
+def filled_qty(result):
+    return result.get('quantity_filled', 0) if result else 0
+
+
+def opposite(action):
+    return 'SELL' if action == 'BUY' else 'BUY'
+
+
+class Leg():
+    def __init__(self, name, ticker, action, qty, ref_price):
+        self.name = name
+        self.ticker = ticker
+        self.action = action
+        self.qty = qty
+        self.ref_price = ref_price   # Decision-time touch (ask to buy, bid to sell)
+
+
+def ref_price(prices, ticker, action):
+    side = 'ask' if action == 'BUY' else 'bid'
+    return prices[f"{ticker.lower()}_{side}"]
+
+
+class MultiLegExecutor():
+    def __init__(self, name="multi-leg"):
+        self.name = name
+        self.executions = 0
+        self.failures = 0
+        self.slippage_log = []   # One row per leg per execution
+
+    def _send(self, legs):
+        futures = {leg.name: _leg_pool.submit(place_mkt, leg.ticker, leg.action, leg.qty) for leg in legs}
+        results = {}
+        for name, fut in futures.items():
+            try:
+                results[name] = fut.result(timeout=LEG_TIMEOUT)
+            except Exception as e:
+                print(f"[ERROR] {self.name} leg {name} failed: {e}")
+                results[name] = None
+        return results
+
+    def _unwind(self, legs, results):
+        """Flatten whatever did fill, concurrently."""
+        back = [Leg(leg.name, leg.ticker, opposite(leg.action), filled_qty(results[leg.name]), leg.ref_price)
+                for leg in legs if filled_qty(results[leg.name]) > 0]
+        if back:
+            print(f"[red][UNWIND] {self.name}: reversing {[(l.ticker, l.action, l.qty) for l in back]}")
+            self._send(back)
+
+    def execute(self, legs):
+        """Fire every leg at once. Returns {leg name: order result} when all
+        legs fill, otherwise unwinds the filled ones and returns None."""
+        t0 = time.perf_counter()
+        results = self._send(legs)
+        self.executions += 1
+
+        failed = [leg.name for leg in legs if filled_qty(results[leg.name]) < leg.qty * FILL_TOLERANCE]
+        if failed:
+            self.failures += 1
+            print(f"[WARNING] {self.name}: legs {failed} did not fill, unwinding the rest")
+            self._unwind(legs, results)
+            return None
+
+        self._record(legs, results, time.perf_counter() - t0)
+        return results
+
+    def execute_etf_arb(self, ritc_action, size, prices, names=('ritc', 'usd', 'bull', 'bear')):
+        """RITC + USD hedge one way, BULL + BEAR the other, all concurrently.
+        The USD leg is sized from the decision-time RITC notional and trued
+        up against the actual RITC fill afterwards. Runs clear of the
+        caller's deadline: the unwind and FX fix-up must never be cut short."""
+        with no_deadline():
+            return self._execute_etf_arb(ritc_action, size, prices, names)
+
+    def _execute_etf_arb(self, ritc_action, size, prices, names):
+        ritc_name, usd_name, bull_name, bear_name = names
+        other = opposite(ritc_action)
+        ritc_ref = ref_price(prices, RITC, ritc_action)
+        legs = [
+            Leg(ritc_name, RITC, ritc_action, size, ritc_ref),
+            Leg(usd_name, USD, ritc_action, ritc_ref * size, ref_price(prices, USD, ritc_action)),
+            Leg(bull_name, BULL, other, size, ref_price(prices, BULL, other)),
+            Leg(bear_name, BEAR, other, size, ref_price(prices, BEAR, other)),
+        ]
+        results = self.execute(legs)
+        if results is None:
+            return None
+
+        # True up the FX hedge: USD actually needed/received vs what we hedged
+        ritc = results[ritc_name]
+        usd = results[usd_name]
+        residual = ritc['vwap'] * filled_qty(ritc) - filled_qty(usd)
+        if abs(residual) >= USD_FIXUP_MIN:
+            action = ritc_action if residual > 0 else other
+            fix = place_mkt(USD, action, abs(residual))
+            results[usd_name] = self._merge(usd, fix, ritc_action)
+            print(f"[FX FIXUP] {action} {abs(residual):.2f} USD")
+        return results
+
+    def _merge(self, base, fix, base_action):
+        """Combine the original USD fill with its fix-up into one net fill."""
+        base_qty, fix_qty = filled_qty(base), filled_qty(fix)
+        if fix_qty <= 0:
+            return base
+        same_side = fix.get('action', base_action) == base_action
+        net_qty = base_qty + fix_qty if same_side else base_qty - fix_qty
+        if same_side and net_qty > 0:
+            vwap = (base['vwap'] * base_qty + fix['vwap'] * fix_qty) / net_qty
+        else:
+            vwap = base['vwap']
+        merged = dict(base)
+        merged.update(quantity_filled=net_qty, vwap=vwap)
+        return merged
+
+    def _record(self, legs, results, elapsed):
+        rows = []
+        for leg in legs:
+            vwap = results[leg.name].get('vwap') or 0
+            # Positive slippage = worse than the decision-time touch
+            per_share = (vwap - leg.ref_price) if leg.action == 'BUY' else (leg.ref_price - vwap)
+            row = {'leg': leg.name, 'ticker': leg.ticker, 'action': leg.action,
+                   'qty': filled_qty(results[leg.name]), 'ref': leg.ref_price, 'vwap': vwap,
+                   'slip': per_share, 'slip_total': per_share * filled_qty(results[leg.name]),
+                   'elapsed_ms': elapsed * 1000}
+            rows.append(row)
+            self.slippage_log.append(row)
+        print(f"{self.name}: {len(legs)} legs in {elapsed * 1000:.0f} ms")
+        print(tabulate([[r['leg'], r['action'], r['qty'], f"{r['ref']:.4f}", f"{r['vwap']:.4f}",
+                         f"{r['slip']:+.4f}"] for r in rows],
+                       headers=['leg', 'side', 'qty', 'ref', 'vwap', 'slip/sh']))
+
+    def slippage_summary(self):
+        """Average per-share slippage and total cost by leg name."""
+        out = {}
+        for row in self.slippage_log:
+            agg = out.setdefault(row['leg'], {'fills': 0, 'slip_total': 0.0, 'qty': 0.0})
+            agg['fills'] += 1
+            agg['slip_total'] += row['slip_total']
+            agg['qty'] += row['qty']
+        for agg in out.values():
+            agg['slip_per_share'] = agg['slip_total'] / agg['qty'] if agg['qty'] else 0.0
+        return out
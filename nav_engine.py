@@ -0,0 +1,126 @@
+# STREAMING NAV ENGINE
+# One fair-value view per market snapshot: touch prices, depth-weighted
+# microprices, RITC fair value in USD and CAD, basket value and the
+# executable ETF / creation / redemption edges. Every strategy reads the same
+# view, so they all price off the same instant with the same formulas.
+
+from final_utils import *
+
+NAV_DEPTH_LEVELS = 3        # Book levels per side in the depth-weighted microprice
+CONVERSION_COST_PER_SHARE = conversion_cost(1)
+ETF_ARB_FEES = 3 * FEE_MKT  # RITC + BULL + BEAR at market, per share
+
+
+def side_summary(orders, max_levels=NAV_DEPTH_LEVELS):
+    """Touch price, depth-weighted price and quantity of the top levels."""
+    levels = aggregate_levels(orders, max_levels)
+    if not levels:
+        return None, None, 0
+    qty = sum(q for _, q in levels)
+    vwap = sum(p * q for p, q in levels) / qty
+    return levels[0][0], vwap, qty
+
+
+def microprice(book, max_levels=NAV_DEPTH_LEVELS):
+    """Depth-weighted microprice: each side's VWAP weighted by the opposite
+    side's depth, so the price leans toward the thinner side."""
+    bid, bid_vwap, bid_qty = side_summary(book['bids'], max_levels)
+    ask, ask_vwap, ask_qty = side_summary(book['asks'], max_levels)
+    if bid is None or ask is None:
+        return bid if ask is None else ask
+    return (bid_vwap * ask_qty + ask_vwap * bid_qty) / (bid_qty + ask_qty)
+
+
+class NavEngine():
+    def __init__(self, depth_levels=NAV_DEPTH_LEVELS):
+        self.depth_levels = depth_levels
+        self.subscribers = []
+        self.view = None
+        self._source = None   # Snapshot the current view was built from
+        self.updates = 0
+
+    def subscribe(self, fn):
+        """Call fn(view) every time a new view is published."""
+        self.subscribers.append(fn)
+
+    def on_tick(self, tick, snapshot):
+        """TickClock callback: build the view once, before the strategies run."""
+        self.update(snapshot)
+
+    def current(self):
+        """View for the installed snapshot (built on first use), or a fresh
+        one from live books when no snapshot is installed."""
+        snap = current_snapshot()
+        if snap is not None and snap is self._source:
+            return self.view
+        return self.update(snap)
+
+    def update(self, snapshot=None):
+        if snapshot is not None:
+            books = {t.lower(): snapshot[t.lower()] for t in SNAPSHOT_TICKERS}
+        else:
+            books = {t.lower(): best_bid_ask_entire_depth(t) for t in SNAPSHOT_TICKERS}
+        view = self.compute(books)
+        view['tick'] = snapshot.get('tick') if snapshot else None
+        view['taken_at'] = snapshot.get('taken_at') if snapshot else time.time()
+
+        self.view = view
+        self._source = snapshot
+        self.updates += 1
+        for fn in self.subscribers:
+            try:
+                fn(view)
+            except Exception as e:
+                print(f"[ERROR] NAV subscriber failed: {e}")
+        return view
+
+    def compute(self, books):
+        view = {}
+        for name, book in books.items():
+            # Same empty-side convention as best_bid_ask
+            view[f"{name}_bid"] = float(book['bids'][0]['price']) if book['bids'] else 0.0
+            view[f"{name}_ask"] = float(book['asks'][0]['price']) if book['asks'] else 1e12
+        view['valid'] = all(view[f"{n}_bid"] > 0 and view[f"{n}_ask"] < 1e12 for n in books)
+
+        micro = {name: microprice(book, self.depth_levels) or 0.0 for name, book in books.items()}
+        view['micro'] = micro
+        if not view['valid']:
+            return view
+
+        # Fair value off microprices
+        usd_cad = micro['usd']
+        basket_cad = micro['bull'] + micro['bear']
+        ritc_market_cad = micro['ritc'] * usd_cad
+        view.update(
+            usd_cad=usd_cad,
+            basket_cad=basket_cad,
+            ritc_fair_cad=basket_cad,
+            ritc_fair_usd=basket_cad / usd_cad,
+            ritc_market_cad=ritc_market_cad,
+            deviation_cad=basket_cad - ritc_market_cad,
+            deviation_pct=(basket_cad - ritc_market_cad) / basket_cad * 100,
+        )
+
+        # Executable at the touch, per share, in CAD
+        ritc_buy_cad = view['ritc_ask'] * view['usd_ask']
+        ritc_sell_cad = view['ritc_bid'] * view['usd_bid']
+        basket_sell_cad = view['bull_bid'] + view['bear_bid']
+        basket_buy_cad = view['bull_ask'] + view['bear_ask']
+        view.update(
+            spread_short=ritc_buy_cad - basket_sell_cad,
+            spread_long=ritc_sell_cad - basket_buy_cad,
+            buy_ritc_edge=basket_sell_cad - ritc_buy_cad - ETF_ARB_FEES,
+            sell_ritc_edge=ritc_sell_cad - basket_buy_cad - ETF_ARB_FEES,
+        )
+        # Converter trades: create = buy basket, convert, sell RITC; redeem the reverse
+        view['creation_edge'] = view['sell_ritc_edge'] - CONVERSION_COST_PER_SHARE
+        view['redemption_edge'] = view['buy_ritc_edge'] - CONVERSION_COST_PER_SHARE
+        return view
+
+
+# Process-wide engine shared by every strategy
+nav = NavEngine()
+
+
+def current_nav():
+    return nav.current()
@@ -0,0 +1,165 @@
+# PARAMETER SWEEP
+# Grid and random search over the execution tunables, scored by the tender
+# backtester (backtest_tenders.py) on the recorded sessions. Each parameter
+# set is one task on a process pool; within a task the sessions run in the
+# worker. Results are cached on disk by (parameter set, dataset hash), the
+# hash covering the bytes of every session file, so a rerun only evaluates
+# new parameter sets or changed data.
+#
+# EvaluateTendersNew's tunables are instance attributes and are set on each
+# evaluator; module-level ones (MIN_CHUNK, UNWIND_HORIZON_TICKS) are
+# patched in the worker for the task and restored afterwards.
+
+import glob
+import json
+import random
+import hashlib
+import itertools
+import multiprocessing as mp
+import tender_eval
+import backtest_tenders
+from final_utils import *
+from backtest_tenders import BACKTEST_SESSIONS, run_backtest
+
+SWEEP_WORKERS = None         # Pool size; None = every core
+SWEEP_CACHE = "output/param_sweep_cache.json"
+SWEEP_OBJECTIVE = 'accepted_pnl'   # Column the sweep maximises
+RANDOM_SAMPLES = 50
+RANDOM_SEED = 7
+
+# Tunables by where they live
+EVALUATOR_TUNABLES = ('SLIPPAGE_TOLERANCE', 'PATIENCE_WINDOW_SECONDS', 'REQUIRED_PROFIT_MARGIN')
+MODULE_TUNABLES = {
+    'MIN_CHUNK': tender_eval,
+    'UNWIND_HORIZON_TICKS': backtest_tenders,
+}
+
+PARAM_GRID = {
+    'SLIPPAGE_TOLERANCE': [0.0, 0.02, 0.05],
+    'PATIENCE_WINDOW_SECONDS': [2, 5, 10],
+    'REQUIRED_PROFIT_MARGIN': [0.0, 0.05],
+    'MIN_CHUNK': [2500, 5000, 10000],
+    'UNWIND_HORIZON_TICKS': [10, 30],
+}
+PARAM_RANGES = {   # name -> (low, high, type) for random search
+    'SLIPPAGE_TOLERANCE': (0.0, 0.10, float),
+    'PATIENCE_WINDOW_SECONDS': (1, 15, int),
+    'REQUIRED_PROFIT_MARGIN': (0.0, 0.10, float),
+    'MIN_CHUNK': (1000, 10000, int),
+    'UNWIND_HORIZON_TICKS': (5, 60, int),
+}
+
+
+def grid(param_grid=PARAM_GRID):
+    names = sorted(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[n] for n in names))]
+
+
+def random_search(param_ranges=PARAM_RANGES, samples=RANDOM_SAMPLES, seed=RANDOM_SEED):
+    """`samples` parameter sets drawn uniformly from the ranges; same seed, same sets."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(samples):
+        params = {}
+        for name in sorted(param_ranges):
+            lo, hi, kind = param_ranges[name]
+            params[name] = rng.randint(lo, hi) if kind is int else round(rng.uniform(lo, hi), 4)
+        out.append(params)
+    return out
+
+
+def dataset_hash(sessions=BACKTEST_SESSIONS):
+    """Hash of the session globs and the bytes of every file they match."""
+    h = hashlib.sha1()
+    for source in sessions:
+        h.update(source.encode())
+        for path in sorted(glob.glob(source)):
+            h.update(path.encode())
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+    return h.hexdigest()[:16]
+
+
+def cache_key(params, data_hash):
+    return hashlib.sha1((json.dumps(params, sort_keys=True) + data_hash).encode()).hexdigest()[:16]
+
+
+def evaluate_params(task):
+    """Pool task: backtest every session under one parameter set."""
+    params, sessions = task
+    unknown = set(params) - set(EVALUATOR_TUNABLES) - set(MODULE_TUNABLES)
+    if unknown:
+        raise ValueError(f"Unknown tunables: {sorted(unknown)}")
+    saved = {name: getattr(MODULE_TUNABLES[name], name) for name in params if name in MODULE_TUNABLES}
+    try:
+        for name in saved:
+            setattr(MODULE_TUNABLES[name], name, params[name])
+        overrides = {n: v for n, v in params.items() if n in EVALUATOR_TUNABLES}
+        rows, wall = run_backtest(sessions, workers=1, overrides=overrides)
+    finally:
+        for name, value in saved.items():
+            setattr(MODULE_TUNABLES[name], name, value)
+    accepted = [r for r in rows if r['accept']]
+    return {'params': params, 'tenders': len(rows), 'right': sum(r['right'] for r in rows),
+            'accepted': len(accepted), 'accepted_pnl': round(sum(r['simulated'] for r in accepted), 2),
+            'all_pnl': round(sum(r['simulated'] for r in rows), 2), 'seconds': round(wall, 3),
+            'digest': backtest_tenders.results_digest(rows)}
+
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_cache(path, cache):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def run_sweep(param_sets, sessions=BACKTEST_SESSIONS, workers=SWEEP_WORKERS, cache_path=SWEEP_CACHE,
+              objective=SWEEP_OBJECTIVE):
+    """Evaluate every parameter set not already cached for this data; returns
+    all results, best `objective` first."""
+    st_time = time.perf_counter()
+    data_hash = dataset_hash(sessions)
+    cache = _load_cache(cache_path) if cache_path else {}
+    keys = [cache_key(p, data_hash) for p in param_sets]
+    todo = [(p, tuple(sessions)) for p, k in zip(param_sets, keys) if k not in cache]
+    todo = list({cache_key(p, data_hash): (p, s) for p, s in todo}.values())   # Duplicate sets run once
+    workers = workers or os.cpu_count() or 1
+    if todo:
+        if workers == 1 or len(todo) == 1:
+            fresh = [evaluate_params(t) for t in todo]
+        else:
+            with mp.Pool(min(workers, len(todo))) as pool:
+                fresh = pool.map(evaluate_params, todo, chunksize=max(1, len(todo) // (workers * 4)))
+        for res in fresh:
+            cache[cache_key(res['params'], data_hash)] = res
+        if cache_path:
+            _save_cache(cache_path, cache)
+    results = [cache[k] for k in dict.fromkeys(keys)]
+    results.sort(key=lambda r: (-r[objective], json.dumps(r['params'], sort_keys=True)))
+    print(f"Sweep: {len(results)} parameter sets ({len(todo)} evaluated, {len(results) - len(todo)} cached) "
+          f"on data {data_hash} in {time.perf_counter() - st_time:.2f}s")
+    return results
+
+
+def print_sweep(results, top=10, objective=SWEEP_OBJECTIVE):
+    if not results:
+        return
+    names = sorted(results[0]['params'])
+    rows = [[r['params'][n] for n in names] + [r['accepted'], r['right'], r['tenders'], r[objective]]
+            for r in results[:top]]
+    print(tabulate(rows, headers=names + ['accepted', 'right', 'tenders', objective]))
+
+
+if __name__ == "__main__":
+    print_sweep(run_sweep(grid()))
+    print_sweep(run_sweep(random_search()))
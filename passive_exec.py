@@ -0,0 +1,222 @@
+# PASSIVE EXECUTION ENGINE
+# Works child orders as resting limits at or inside the touch to earn the
+# limit rebate instead of paying the market fee. Reprices as the book moves,
+# tracks queue position from book snapshots, and escalates toward the far
+# touch as the deadline or the adverse-move risk budget is used up; whatever
+# is left at the end crosses with a market order.
+
+from final_utils import *
+
+PRICE_TICK = 0.01            # Minimum price increment for BULL/BEAR/RITC
+PASSIVE_POLL_SECONDS = 0.25  # Book / fill polling interval while resting
+ESCALATE_AT = 0.6            # Urgency after which we step inside the spread
+QUEUE_JUMP_RATIO = 2.0       # Improve a tick if this many x our size sits ahead
+
+
+def _book_side(book, side):
+    """Our side of the book: bids when buying, asks when selling."""
+    return book['bids'] if side == 'BUY' else book['asks']
+
+
+def queue_ahead(book, side, price, order_id=None):
+    """Shares resting at `price` on our side of the book, excluding our order."""
+    ahead = 0
+    for order in _book_side(book, side):
+        if order['price'] != price or order.get('order_id') == order_id:
+            continue
+        ahead += order['quantity'] - order.get('quantity_filled', 0)
+    return ahead
+
+
+class ChildOrder():
+    """One ticker's slice being worked passively."""
+    def __init__(self, ticker, side, qty, limit_price=None):
+        self.ticker = ticker
+        self.side = side
+        self.qty = qty
+        self.limit_price = limit_price   # Never rest at a worse price than this
+        self.order_id = None
+        self.price = None
+        self.order_filled = 0            # Filled on the currently resting order
+        self.passive_qty = 0
+        self.passive_value = 0.0
+        self.aggressive_qty = 0
+        self.aggressive_value = 0.0
+        self.queue_ahead = None
+        self.reprices = 0
+        self.arrival = None              # Touch on our side when work started
+
+    @property
+    def filled(self):
+        return self.passive_qty + self.aggressive_qty
+
+    @property
+    def remaining(self):
+        return self.qty - self.filled
+
+    @property
+    def vwap(self):
+        return (self.passive_value + self.aggressive_value) / self.filled if self.filled else 0.0
+
+
+class PassiveExecutor():
+    def __init__(self, name="passive"):
+        self.name = name
+        self.passive_qty = 0
+        self.aggressive_qty = 0
+        self.orders_sent = 0
+        self.reprices = 0
+
+    # ---- pricing ----
+    def target_price(self, child, book, urgency):
+        """Join the touch; step one tick inside when the spread allows and the
+        queue ahead is long; past ESCALATE_AT, walk toward the far touch."""
+        bids, asks = book['bids'], book['asks']
+        if not bids or not asks:
+            return None
+        bid, ask = bids[0]['price'], asks[0]['price']
+        spread_ticks = int(round((ask - bid) / PRICE_TICK))
+
+        if child.side == 'BUY':
+            near, far, inside = bid, ask, 1
+        else:
+            near, far, inside = ask, bid, -1
+
+        steps = 0
+        if spread_ticks > 1:
+            ahead = queue_ahead(book, child.side, near, child.order_id)
+            if ahead > QUEUE_JUMP_RATIO * child.remaining:
+                steps = 1
+            if urgency > ESCALATE_AT:
+                frac = (urgency - ESCALATE_AT) / (1 - ESCALATE_AT)
+                steps = max(steps, int(frac * (spread_ticks - 1)))
+            steps = min(steps, spread_ticks - 1)   # Stay passive: never cross
+        price = round(near + inside * steps * PRICE_TICK, 2)
+
+        if child.limit_price is not None:
+            price = min(price, child.limit_price) if child.side == 'BUY' else max(price, child.limit_price)
+        return price
+
+    def urgency(self, child, book, elapsed, deadline, risk_budget):
+        """Fraction of the deadline, or of the risk budget (CAD of adverse
+        touch move on the unfilled quantity), used so far - whichever is larger."""
+        used = elapsed / deadline if deadline > 0 else 1.0
+        if risk_budget and child.arrival is not None:
+            levels = _book_side(book, child.side)
+            if levels:
+                move = levels[0]['price'] - child.arrival
+                adverse = move if child.side == 'BUY' else -move
+                used = max(used, adverse * child.remaining / risk_budget)
+        return min(max(used, 0.0), 1.0)
+
+    # ---- order handling ----
+    def _sync_fills(self, child):
+        if child.order_id is None:
+            return
+        status = get_order_status(child.order_id).json()
+        if not status:
+            return
+        filled = status.get('quantity_filled', 0)
+        new = filled - child.order_filled
+        if new > 0:
+            child.passive_qty += new
+            child.passive_value += new * (status.get('vwap') or child.price)
+            child.order_filled = filled
+            record_fill(child.ticker, child.side, new, child.order_id, child.price)
+        if status.get('status') in ('TRANSACTED', 'CANCELLED'):
+            child.order_id = None
+
+    def _cancel(self, child):
+        if child.order_id is None:
+            return
+        cancel_order(child.order_id)
+        self._sync_fills(child)   # Catch fills that landed before the cancel
+        child.order_id = None
+
+    def _rest(self, child, price):
+        child.order_filled = 0
+        order = place_limit(child.ticker, child.side, min(child.remaining, MAX_SIZE_EQUITY), price)
+        self.orders_sent += 1
+        if order and 'order_id' in order:
+            child.order_id = order['order_id']
+            child.price = price
+
+    def _step(self, child, book, urgency):
+        self._sync_fills(child)
+        if child.remaining <= 0:
+            return
+        price = self.target_price(child, book, urgency)
+        if price is None:
+            return
+        if child.order_id is not None:
+            # Orders ahead only leave the queue; new arrivals join behind us
+            ahead = queue_ahead(book, child.side, child.price, child.order_id)
+            child.queue_ahead = ahead if child.queue_ahead is None else min(child.queue_ahead, ahead)
+            if price == child.price:
+                return
+            self._cancel(child)
+            child.reprices += 1
+            self.reprices += 1
+            if child.remaining <= 0:
+                return
+        self._rest(child, price)
+        child.queue_ahead = queue_ahead(book, child.side, price, child.order_id)
+
+    def _cross(self, child):
+        self._cancel(child)
+        qty = child.remaining
+        while qty > 0:
+            result = place_mkt(child.ticker, child.side, min(qty, MAX_SIZE_EQUITY))
+            filled = result.get('quantity_filled', 0) if result else 0
+            if filled <= 0:
+                break
+            child.aggressive_qty += filled
+            child.aggressive_value += filled * result['vwap']
+            qty -= filled
+
+    def work(self, children, deadline, risk_budget=None):
+        """Work every child passively until filled or `deadline` seconds have
+        passed, then cross the remainder. Returns the children."""
+        st_time = time.time()
+        for child in children:
+            levels = _book_side(best_bid_ask_entire_depth(child.ticker), child.side)
+            child.arrival = levels[0]['price'] if levels else None
+
+        with live_books():   # Reprice against each poll's book, not the tick's snapshot
+            while True:
+                active = [c for c in children if c.remaining > 0]
+                elapsed = time.time() - st_time
+                if not active or elapsed >= deadline:
+                    break
+                for child in active:
+                    book = best_bid_ask_entire_depth(child.ticker)
+                    urgency = self.urgency(child, book, elapsed, deadline, risk_budget)
+                    if urgency >= 1.0:
+                        self._cross(child)
+                    else:
+                        self._step(child, book, urgency)
+                time.sleep(PASSIVE_POLL_SECONDS)
+
+        for child in children:
+            self._sync_fills(child)
+            if child.remaining > 0:
+                self._cross(child)
+            self.passive_qty += child.passive_qty
+            self.aggressive_qty += child.aggressive_qty
+            print(f"{self.name}: {child.ticker} {child.side} {child.filled}/{child.qty} "
+                  f"passive {child.passive_qty} @ {child.vwap:.4f}, reprices {child.reprices}")
+        return children
+
+    def work_one(self, ticker, side, qty, deadline, limit_price=None, risk_budget=None):
+        child = ChildOrder(ticker, side, qty, limit_price)
+        self.work([child], deadline, risk_budget)
+        return child
+
+    # ---- reporting ----
+    def passive_fill_ratio(self):
+        total = self.passive_qty + self.aggressive_qty
+        return self.passive_qty / total if total else 0.0
+
+    def fee_savings(self):
+        """CAD earned in rebates plus market fees avoided on passive fills."""
+        return self.passive_qty * (REBATE_LMT + FEE_MKT)
@@ -0,0 +1,107 @@
+# POSITION BOOK
+# Open ETF-vs-basket positions stored column-wise in NumPy arrays so every
+# position is marked against one snapshot in a single vectorized pass and
+# exit rules (profit target, stop loss, max hold time) are evaluated
+# array-wide, with no per-position API calls.
+
+from final_utils import *
+
+LONG_RITC = 1     # Long RITC (+USD), short BULL+BEAR
+SHORT_RITC = -1   # Short RITC (+USD), long BULL+BEAR
+
+# Columns of the entry VWAP matrix
+COL_RITC, COL_USD, COL_BULL, COL_BEAR = range(4)
+
+FEES_PER_SHARE = 3 * FEE_MKT   # RITC + BULL + BEAR round trip per side
+
+
+class PositionBook():
+    def __init__(self, capacity=32):
+        self.direction = np.zeros(capacity, dtype=np.int8)
+        self.size = np.zeros(capacity)
+        self.entry = np.zeros((capacity, 4))      # RITC, USD, BULL, BEAR entry VWAPs
+        self.entry_time = np.zeros(capacity)
+        self.open = np.zeros(capacity, dtype=bool)
+        self.meta = [None] * capacity              # Original trade dicts, per slot
+
+    def __len__(self):
+        return int(self.open.sum())
+
+    def _grow(self):
+        cap = len(self.size)
+        self.direction = np.concatenate([self.direction, np.zeros(cap, dtype=np.int8)])
+        self.size = np.concatenate([self.size, np.zeros(cap)])
+        self.entry = np.vstack([self.entry, np.zeros((cap, 4))])
+        self.entry_time = np.concatenate([self.entry_time, np.zeros(cap)])
+        self.open = np.concatenate([self.open, np.zeros(cap, dtype=bool)])
+        self.meta.extend([None] * cap)
+
+    def add(self, direction, size, trades, entry_time=None, meta=None, names=('ritc', 'usd', 'bull', 'bear')):
+        """Store a filled position; trades maps leg names to order results."""
+        free = np.flatnonzero(~self.open)
+        if len(free) == 0:
+            self._grow()
+            free = np.flatnonzero(~self.open)
+        i = free[0]
+        self.direction[i] = direction
+        self.size[i] = size
+        self.entry[i] = [trades[name]['vwap'] for name in names]
+        self.entry_time[i] = time.time() if entry_time is None else entry_time
+        self.open[i] = True
+        self.meta[i] = meta
+        return i
+
+    def close(self, i):
+        self.open[i] = False
+        meta, self.meta[i] = self.meta[i], None
+        return meta
+
+    def open_slots(self):
+        return np.flatnonzero(self.open)
+
+    def mark(self, prices, exit_costs=True):
+        """Unrealized CAD P&L of every slot if closed at the current touch
+        (net of closing fees). exit_costs=False marks at the mids without
+        fees: the move since entry, not what closing would cost. Closed
+        slots mark to 0."""
+        d = self.direction.astype(float)
+        long_ritc = self.direction > 0
+
+        if exit_costs:
+            # Closing a long RITC sells RITC/USD at the bid and buys the basket at the ask
+            ritc_exit = np.where(long_ritc, prices['ritc_bid'], prices['ritc_ask'])
+            usd_exit = np.where(long_ritc, prices['usd_bid'], prices['usd_ask'])
+            bull_exit = np.where(long_ritc, prices['bull_ask'], prices['bull_bid'])
+            bear_exit = np.where(long_ritc, prices['bear_ask'], prices['bear_bid'])
+            fees = FEES_PER_SHARE
+        else:
+            ritc_exit, usd_exit, bull_exit, bear_exit = [(prices[f"{t}_bid"] + prices[f"{t}_ask"]) / 2
+                                                         for t in ('ritc', 'usd', 'bull', 'bear')]
+            fees = 0.0
+
+        e = self.entry
+        etf_pnl = d * (ritc_exit * usd_exit - e[:, COL_RITC] * e[:, COL_USD])
+        basket_pnl = -d * ((bull_exit - e[:, COL_BULL]) + (bear_exit - e[:, COL_BEAR]))
+        pnl = (etf_pnl + basket_pnl - fees) * self.size
+        return np.where(self.open, pnl, 0.0)
+
+    def notional(self):
+        """Entry CAD value of each slot's RITC leg (the basket leg matches it)."""
+        return self.entry[:, COL_RITC] * self.entry[:, COL_USD] * self.size
+
+    def exit_signals(self, marks, now=None, profit_target=None, stop_loss_pct=None, max_hold_time=None):
+        """Slots to close and why, evaluated across the whole book at once.
+        Time exits win over stop losses, which win over profit takes. The
+        stop is a fraction of notional; judge it on mark(exit_costs=False)
+        marks, or a fresh position is stopped out by its own closing cost."""
+        now = time.time() if now is None else now
+        reason = np.full(len(self.size), '', dtype=object)
+        if profit_target is not None:
+            reason[marks > profit_target] = 'profit'
+        if stop_loss_pct is not None:
+            reason[marks < -stop_loss_pct * self.notional()] = 'stop_loss'
+        if max_hold_time is not None:
+            reason[now - self.entry_time > max_hold_time] = 'time'
+        hit = self.open & (reason != '')
+        idx = np.flatnonzero(hit)
+        return idx, reason[idx]
@@ -0,0 +1,210 @@
+# ASYNCHRONOUS MARKET-DATA RECORDER
+# Snapshots, tenders, fills and decisions are handed to a background writer
+# thread through a bounded queue. The trading loop never blocks: when the
+# queue is full a record is dropped and counted instead. The writer pickles
+# records in batches into size-rotated segment files and fsyncs them
+# according to FSYNC_POLICY. Snapshots are delta-encoded against the previous
+# one (delta_store), so every tick is kept at a fraction of the size.
+# read_records() / recorded_snapshots() stream
+# them back, the latter in the output/*.pkl layout that replay.py consumes.
+
+import glob
+import queue
+import atexit
+from final_utils import *
+from delta_store import DeltaEncoder, DeltaDecoder, KEY, DELTA
+
+RECORD_DIR = "output"
+RECORDER_QUEUE_SIZE = 2000   # Records buffered before new ones are dropped
+BATCH_MAX_RECORDS = 200      # Records per write() call at most
+BATCH_MAX_SECONDS = 0.5      # A partial batch is flushed after this long
+FSYNC_POLICY = 'interval'    # 'batch': every batch, 'interval': every FSYNC_SECONDS, 'never'
+FSYNC_SECONDS = 5.0
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024   # Start a new segment file past this size
+RECORD_KINDS = ('snapshot', 'tender', 'fill', 'decision')
+DELTA_ENCODE = True          # Snapshots as keyframes + per-order deltas (delta_store)
+
+
+class Recorder():
+    def __init__(self, directory=RECORD_DIR, queue_size=RECORDER_QUEUE_SIZE, fsync_policy=FSYNC_POLICY,
+                 delta_encode=DELTA_ENCODE):
+        if fsync_policy not in ('batch', 'interval', 'never'):
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        # Encoding happens on the writer thread, never in record()
+        self.encoder = DeltaEncoder() if delta_encode else None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.enqueued = {k: 0 for k in RECORD_KINDS}
+        self.dropped = {k: 0 for k in RECORD_KINDS}
+        self.written = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.max_depth = 0
+        self.write_seconds = 0.0
+        self.segment = None
+        self.segments = []
+        self.seen_tenders = set()
+        self._file = None
+        self._last_fsync = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- producer side (hot path) ----
+    def record(self, kind, data):
+        """Queue one record; never blocks. Returns False if it was dropped."""
+        try:
+            self.queue.put_nowait((kind, time.time(), data))
+        except queue.Full:
+            self.dropped[kind] = self.dropped.get(kind, 0) + 1
+            return False
+        self.enqueued[kind] = self.enqueued.get(kind, 0) + 1
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def on_tick(self, tick, snapshot):
+        """TickClock callback: the snapshot, plus each tender the first time
+        it is seen. Positions are copied; record_fill keeps mutating them."""
+        snap = {k: v for k, v in snapshot.items() if k != 'positions'}
+        if 'positions' in snapshot:
+            snap['positions'] = dict(snapshot['positions'])
+        self.record('snapshot', snap)
+        for tender in snapshot.get('tenders', []):
+            if tender['tender_id'] not in self.seen_tenders:
+                self.seen_tenders.add(tender['tender_id'])
+                self.record('tender', dict(tender, seen_tick=tick))
+
+    # ---- writer side ----
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._sync(force=True)
+            self._file.close()
+        stamp = datetime.datetime.now().isoformat().replace(':', '-')
+        self.segment = os.path.join(self.directory, f"session_{stamp}.rec")
+        self._file = open(self.segment, 'ab')
+        self.segments.append(self.segment)
+        if self.encoder is not None:
+            self.encoder.reset()   # Every segment starts with a keyframe
+
+    def _sync(self, force=False):
+        self._file.flush()
+        due = self.fsync_policy == 'batch' or (
+            self.fsync_policy == 'interval' and time.time() - self._last_fsync >= FSYNC_SECONDS)
+        if (force and self.fsync_policy != 'never') or due:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+            self._last_fsync = time.time()
+
+    def _write(self, batch):
+        t0 = time.perf_counter()
+        if self._file is None or self._file.tell() >= SEGMENT_MAX_BYTES:
+            self._open_segment()
+        if self.encoder is not None:
+            batch = [(kind, ts, self.encoder.encode(data)) if kind == 'snapshot' else (kind, ts, data)
+                     for kind, ts, data in batch]
+        payload = b''.join(pickle.dumps(rec, protocol=pickle.HIGHEST_PROTOCOL) for rec in batch)
+        self._file.write(payload)
+        self._sync()
+        self.written += len(batch)
+        self.batches += 1
+        self.bytes_written += len(payload)
+        self.write_seconds += time.perf_counter() - t0
+
+    def _drain(self, timeout):
+        """Up to BATCH_MAX_RECORDS records, waiting at most `timeout` for the first."""
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=timeout))
+            while len(batch) < BATCH_MAX_RECORDS:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _flush(self, pending):
+        try:
+            self._write(pending)
+        except Exception as e:
+            print(f"[ERROR] Recorder write failed, {len(pending)} records lost: {e}")
+            if self.encoder is not None:
+                self.encoder.reset()   # Lost deltas: the next snapshot must be a keyframe
+
+    def _run(self):
+        pending, started = [], None
+        while not self._stop.is_set() or not self.queue.empty():
+            pending.extend(self._drain(BATCH_MAX_SECONDS))
+            if pending and started is None:
+                started = time.time()
+            full = len(pending) >= BATCH_MAX_RECORDS
+            if pending and (full or time.time() - started >= BATCH_MAX_SECONDS or self._stop.is_set()):
+                self._flush(pending)
+                pending, started = [], None
+        if pending:
+            self._flush(pending)
+
+    def close(self):
+        """Flush everything queued, fsync (unless 'never') and stop."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._file is not None:
+            self._sync(force=True)
+            self._file.close()
+            self._file = None
+
+    def metrics(self):
+        return {'queued': self.queue.qsize(), 'max_depth': self.max_depth, 'written': self.written,
+                'batches': self.batches, 'mb_written': self.bytes_written / 1e6, 'fsyncs': self.fsyncs,
+                'dropped': sum(self.dropped.values()), 'dropped_by_kind': dict(self.dropped),
+                'write_ms_per_batch': self.write_seconds / self.batches * 1000 if self.batches else 0.0}
+
+
+# Process-wide recorder; main installs it with set_recorder() and starts it
+recorder = Recorder()
+
+
+# ---- reading back ----
+def read_records(pattern=os.path.join(RECORD_DIR, "session_*.rec"), kinds=None):
+    """Stream (kind, ts, data) from segment files in order, delta-encoded
+    snapshots rebuilt; a torn final record (crash mid-write) ends its file."""
+    for path in sorted(glob.glob(pattern)):
+        decoder = DeltaDecoder()
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    kind, ts, data = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    print(f"[WARNING] Truncated record in {path}")
+                    break
+                if kinds is not None and kind not in kinds:
+                    continue
+                if kind == 'snapshot' and isinstance(data, tuple) and data[0] in (KEY, DELTA):
+                    data = decoder.decode(*data)
+                yield kind, ts, data
+
+
+def recorded_snapshots(pattern=os.path.join(RECORD_DIR, "session_*.rec")):
+    """Recorded snapshots in the output/*.pkl layout (lower-case books,
+    'tender', ISO 'timestamp'), ready for replay.py's pipeline."""
+    for kind, ts, snap in read_records(pattern, kinds=('snapshot',)):
+        snap = dict(snap)
+        snap.setdefault('tender', snap['tenders'][0] if snap.get('tenders') else {})
+        snap.setdefault('timestamp', datetime.datetime.fromtimestamp(ts).isoformat())
+        yield snap
@@ -0,0 +1,303 @@
+# SNAPSHOT REPLAY ENGINE
+# Streams the recorded output/*.pkl snapshots in time order through a chain
+# of generators (paths -> load -> time order -> implied flow -> live layout)
+# and installs each one as the shared snapshot, so tender evaluation and the
+# arb books read books, tenders and positions exactly as they do live and
+# never touch the API. Their orders go to a PaperBroker (set_order_router)
+# that fills them against the replayed books with the simulator's matching
+# engine. Runs as fast as the strategies allow and reports throughput,
+# tender decisions against later books and the arb books' paper PnL.
+
+import glob
+import contextlib
+from final_utils import *
+from rit_sim import SimExchange, SimError, snapshot_tick, implied_flow, FLOW_MAX_GAP_TICKS
+from tick_clock import LatencyStats
+from tender_eval import EvaluateTendersNew
+from arb import StatArbTrader
+from arb2 import ETFArbitrageTrader
+from risk_engine import risk
+
+REPLAY_PATTERN = "output/*.pkl"
+TENDER_HORIZON_SECONDS = 5.0   # Score accept decisions against the books this much later
+REPLAY_STRATEGIES = ('tender', 'stat_arb', 'etf_arb')
+
+
+# ---- pipeline stages ----
+def snapshot_paths(pattern=REPLAY_PATTERN):
+    yield from sorted(glob.glob(pattern))
+
+
+def load_snapshots(paths):
+    """Unpickle each file, skipping unreadable ones."""
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                yield pickle.load(f)
+        except Exception:
+            continue
+
+
+def in_time_order(snaps):
+    """Stamp epoch time and case tick; drop snapshots older than the last one."""
+    last_ts = None
+    for snap in snaps:
+        ts = datetime.datetime.fromisoformat(snap['timestamp']).timestamp()
+        if last_ts is not None and ts < last_ts:
+            continue
+        last_ts = ts
+        yield dict(snap, ts=ts, tick=snapshot_tick(snap))
+
+
+def with_flow(snaps):
+    """Attach the aggressive flow implied since the previous snapshot, so the
+    paper broker can fill resting limits."""
+    prev = None
+    for snap in snaps:
+        if prev is not None and 0 <= snap['tick'] - prev['tick'] <= FLOW_MAX_GAP_TICKS:
+            snap['flow'] = implied_flow(prev, snap)
+        prev = snap
+        yield snap
+
+
+def replay_snapshots(pattern=REPLAY_PATTERN):
+    """The recorded session as a stream of time-ordered snapshots."""
+    return with_flow(in_time_order(load_snapshots(snapshot_paths(pattern))))
+
+
+def as_live(snap, positions):
+    """Recorded snapshot -> the layout get_market_snapshot() produces, never
+    stale, with the paper positions."""
+    live = {t.lower(): snap[t.lower()] for t in SNAPSHOT_TICKERS}
+    tender = snap.get('tender') or {}
+    live.update({'tick': snap['tick'], 'timestamp': snap['timestamp'], 'ts': snap['ts'], 'tender': tender,
+                 'tenders': [tender] if tender.get('ticker') == RITC else [],
+                 'positions': positions, 'taken_at': time.time(), 'max_age': float('inf')})
+    return live
+
+
+# ---- paper broker ----
+class _PaperResponse():
+    """requests.Response stand-in for get_order_status/cancel_order and
+    conversions."""
+    def __init__(self, payload, ok=True, status_code=200, text=""):
+        self.payload = payload
+        self.ok = ok
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return self.payload
+
+
+class PaperBroker():
+    """Order router that fills against the replayed books through the
+    simulator's matching engine (price-time priority, fees, limits)."""
+    def __init__(self):
+        self.exchange = SimExchange((), ticks_per_period=10 ** 9)
+        self.rejects = 0
+        self.leases = {}   # 'ETF-Creation' / 'ETF-Redemption' -> lease id
+
+    def load(self, snap):
+        self.exchange.load(snap, snap['tick'])
+
+    def _post(self, params):
+        try:
+            with self.exchange.lock:
+                return self.exchange.post_order(params)
+        except SimError as e:
+            self.rejects += 1
+            print(f"[WARNING] Paper order rejected: {e}")
+            return None
+
+    def place_mkt(self, ticker, action, qty):
+        if qty <= 0:
+            return {'vwap': 0}
+        return self._post({'ticker': ticker, 'type': 'MARKET', 'quantity': qty, 'action': action}) or {'vwap': 0}
+
+    def place_limit(self, ticker, action, qty, price):
+        return self._post({'ticker': ticker, 'type': 'LIMIT', 'quantity': qty, 'action': action, 'price': price}) or {}
+
+    def get_order_status(self, _id):
+        try:
+            with self.exchange.lock:
+                return _PaperResponse(self.exchange.get_order({}, _id))
+        except SimError:
+            return _PaperResponse({}, ok=False)
+
+    def cancel_order(self, _id):
+        try:
+            with self.exchange.lock:
+                result = self.exchange.delete_order({}, _id)
+            return _PaperResponse(result, ok=result['success'])
+        except SimError:
+            return _PaperResponse({'success': False}, ok=False)
+
+    def accept_tender(self, tender):
+        params = {} if tender['is_fixed_bid'] else {'price': tender['price']}
+        try:
+            with self.exchange.lock:
+                return self.exchange.post_tender(params, tender['tender_id'])['success']
+        except SimError as e:
+            print(f"[WARNING] Paper tender rejected: {e}")
+            return False
+
+    def convert(self, method, qty):
+        """Converter.convert_ritc / convert_bull_bear through a paper lease."""
+        fee = int(1500 * qty // 10000)
+        if method == 'convert_ritc':
+            ticker = 'ETF-Redemption'
+            legs = {'from1': RITC, 'quantity1': int(qty), 'from2': USD, 'quantity2': fee}
+        else:
+            ticker = 'ETF-Creation'
+            legs = {'from1': BULL, 'quantity1': int(qty), 'from2': BEAR, 'quantity2': int(qty),
+                    'from3': USD, 'quantity3': fee}
+        try:
+            with self.exchange.lock:
+                if ticker not in self.leases:
+                    self.leases[ticker] = self.exchange.post_lease({'ticker': ticker})['id']
+                return _PaperResponse(self.exchange.use_lease(legs, self.leases[ticker]))
+        except SimError as e:
+            self.rejects += 1
+            print(f"[WARNING] Paper conversion rejected: {e}")
+            return _PaperResponse({}, ok=False, status_code=e.status, text=str(e))
+
+    def positions(self):
+        return {t: int(round(q)) for t, q in self.exchange.positions.items()}
+
+    def mark_to_market(self, snap):
+        """Paper PnL in CAD at the snapshot's mids (RITC and USD cash via USD/CAD)."""
+        mids = {}
+        for ticker in SNAPSHOT_TICKERS:
+            book = snap[ticker.lower()]
+            if book['bids'] and book['asks']:
+                mids[ticker] = (book['bids'][0]['price'] + book['asks'][0]['price']) / 2
+        pos = self.exchange.positions
+        usd_cad = mids.get(USD, 1.0)
+        return (pos[CAD] + (pos[USD] + pos[RITC] * mids.get(RITC, 0)) * usd_cad
+                + pos[BULL] * mids.get(BULL, 0) + pos[BEAR] * mids.get(BEAR, 0))
+
+
+# ---- engine ----
+class ReplayEngine():
+    def __init__(self, strategies=REPLAY_STRATEGIES, tender_horizon=TENDER_HORIZON_SECONDS, quiet=True):
+        self.broker = PaperBroker()
+        self.strategies = {}
+        if 'tender' in strategies:
+            self.strategies['tender'] = self.evaluate_tenders
+        if 'stat_arb' in strategies:
+            self.stat_arb = StatArbTrader()
+            self.strategies['stat_arb'] = lambda snap: self.stat_arb.run_strategy()
+        if 'etf_arb' in strategies:
+            self.etf_arb = ETFArbitrageTrader()
+            self.strategies['etf_arb'] = lambda snap: self.etf_arb.run_strategy()
+        self.tender_horizon = tender_horizon
+        self.quiet = quiet
+        self.latency = {name: LatencyStats() for name in self.strategies}
+        self.tenders = {}         # tender_id -> decision row
+        self.snapshots = 0
+        self.wall_seconds = 0.0
+        self.first_ts = None
+        self.last_snap = None
+
+    def evaluate_tenders(self, snap):
+        """Evaluate each tender once on arrival and again once on the first
+        snapshot tender_horizon seconds later (what unwinding then would give)."""
+        for tender in snap['tenders']:
+            row = self.tenders.get(tender['tender_id'])
+            if row is None:
+                t0 = time.perf_counter()
+                predicted = EvaluateTendersNew(tender, None).evaluate_tender_profit()
+                self.tenders[tender['tender_id']] = {
+                    'tender_id': tender['tender_id'], 'action': tender['action'], 'quantity': tender['quantity'],
+                    'price': tender['price'], 'ts': snap['ts'], 'predicted': predicted, 'accept': predicted > 0,
+                    'realized': None, 'eval_ms': (time.perf_counter() - t0) * 1000}
+        for row in self.tenders.values():
+            if row['realized'] is None and snap['ts'] - row['ts'] >= self.tender_horizon:
+                tender = {'action': row['action'], 'price': row['price'], 'quantity': row['quantity']}
+                row['realized'] = EvaluateTendersNew(tender, None).evaluate_tender_profit()
+
+    def step(self, snap):
+        self.broker.load(snap)
+        live = as_live(snap, self.broker.positions())
+        set_snapshot(live)
+        risk.sync(live['positions'])
+        for name, fn in self.strategies.items():
+            t0 = time.perf_counter()
+            try:
+                fn(live)
+            except Exception as e:
+                self.latency[name].errors += 1
+                print(f"[ERROR] Replay {name} failed: {e}")
+            self.latency[name].add(time.perf_counter() - t0)
+        self.snapshots += 1
+        self.last_snap = snap
+        if self.first_ts is None:
+            self.first_ts = snap['ts']
+
+    def run(self, snaps=None):
+        """Replay `snaps` (default: the recorded session) through every
+        strategy; the live order router and snapshot are restored afterwards."""
+        snaps = replay_snapshots() if snaps is None else snaps
+        st_time = time.perf_counter()
+        set_order_router(self.broker)
+        out = open(os.devnull, 'w') if self.quiet else None
+        try:
+            with contextlib.redirect_stdout(out) if out else contextlib.nullcontext():
+                for snap in snaps:
+                    self.step(snap)
+        finally:
+            set_order_router(None)
+            clear_snapshot()
+            if out:
+                out.close()
+        self.wall_seconds += time.perf_counter() - st_time
+        return self.results()
+
+    def results(self):
+        span = self.last_snap['ts'] - self.first_ts if self.last_snap else 0.0
+        scored = [r for r in self.tenders.values() if r['realized'] is not None]
+        right = sum(1 for r in scored if r['accept'] == (r['realized'] > 0))
+        return {
+            'snapshots': self.snapshots,
+            'wall_seconds': self.wall_seconds,
+            'snapshots_per_second': self.snapshots / self.wall_seconds if self.wall_seconds else 0.0,
+            'session_seconds': span,
+            'speedup': span / self.wall_seconds if self.wall_seconds else 0.0,
+            'tenders': len(self.tenders),
+            'tender_decisions_right': right,
+            'tenders_scored': len(scored),
+            'paper_pnl': self.broker.mark_to_market(self.last_snap) if self.last_snap else 0.0,
+            'stat_arb_pnl': self.stat_arb.pnl if 'stat_arb' in self.strategies else None,
+            'etf_arb_pnl': self.etf_arb.pnl if 'etf_arb' in self.strategies else None,
+            'fills': self.broker.exchange.fills,
+            'rejects': self.broker.rejects,
+            'latency': {name: stats.summary() for name, stats in self.latency.items()},
+        }
+
+    def print_report(self):
+        res = self.results()
+        print(f"Replay: {res['snapshots']} snapshots in {res['wall_seconds']:.2f}s "
+              f"({res['snapshots_per_second']:.0f}/s, {res['speedup']:.0f}x the {res['session_seconds']:.0f}s session)")
+        rows = [[name, s['count'], s['errors'], f"{s.get('mean_ms', 0):.2f}", f"{s.get('p95_ms', 0):.2f}"]
+                for name, s in res['latency'].items()]
+        print(tabulate(rows, headers=['strategy', 'calls', 'errors', 'mean ms', 'p95 ms']))
+        rows = [[r['tender_id'], r['action'], int(r['quantity']), r['price'], f"{r['predicted']:.0f}",
+                 'accept' if r['accept'] else 'reject', '-' if r['realized'] is None else f"{r['realized']:.0f}"]
+                for r in self.tenders.values()]
+        if rows:
+            print(tabulate(rows, headers=['tender', 'action', 'qty', 'price', 'predicted', 'decision',
+                                          f"at +{self.tender_horizon:.0f}s"]))
+        print(f"Tender decisions right {res['tender_decisions_right']}/{res['tenders_scored']}, "
+              f"paper PnL {res['paper_pnl']:.2f} CAD ({res['fills']} fills, {res['rejects']} rejects)")
+        return res
+
+
+def run_replay(pattern=REPLAY_PATTERN, strategies=REPLAY_STRATEGIES, quiet=True):
+    engine = ReplayEngine(strategies, quiet=quiet)
+    engine.run(replay_snapshots(pattern))
+    return engine.print_report()
+
+
+if __name__ == "__main__":
+    run_replay()
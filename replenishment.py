@@ -0,0 +1,164 @@
+# ORDER BOOK REPLENISHMENT MODEL
+# Per ticker and book side: how many shares of new liquidity arrive near the
+# touch per tick, how deep the near book usually is, and so how many ticks a
+# swept level takes to refill. Seeded offline from the recorded output/*.pkl
+# snapshots and updated incrementally from every live snapshot; the unwind
+# slicer asks it for chunk sizes and waits.
+
+import glob
+from final_utils import *
+
+REPLENISH_LEVELS = 3        # Price levels counted as "near the touch"
+REPLENISH_ALPHA = 0.2       # EWMA weight of each new observation
+MAX_GAP_TICKS = 5           # Larger snapshot gaps fall back to order ages
+AGE_WINDOW_TICKS = 5        # Order-age estimator looks back this many ticks
+MIN_WAIT_SECONDS = 0.5
+MAX_WAIT_SECONDS = 5.0
+SECONDS_PER_TICK = 1.0
+SIDES = ('bids', 'asks')
+
+
+def book_tick(book):
+    """Latest posting tick in a book: a proxy for 'now' when none is given."""
+    ticks = [o.get('tick', 0) for side in SIDES for o in book.get(side, [])]
+    return max(ticks) if ticks else None
+
+
+def near_orders(orders, levels=REPLENISH_LEVELS):
+    """Resting orders on the first `levels` price levels."""
+    out, prices = [], []
+    for order in orders:
+        if order['quantity'] - order.get('quantity_filled', 0) <= 0:
+            continue
+        if order['price'] not in prices:
+            if len(prices) == levels:
+                break
+            prices.append(order['price'])
+        out.append(order)
+    return out
+
+
+def remaining_qty(order):
+    return order['quantity'] - order.get('quantity_filled', 0)
+
+
+class SideStats():
+    def __init__(self):
+        self.rate = None      # Shares of new near-touch liquidity per tick
+        self.depth = None     # Near-touch resting shares
+        self.samples = 0
+
+    def _ewma(self, old, new):
+        return new if old is None else (1 - REPLENISH_ALPHA) * old + REPLENISH_ALPHA * new
+
+    def add(self, rate=None, depth=None):
+        if rate is not None:
+            self.rate = self._ewma(self.rate, rate)
+            self.samples += 1
+        if depth is not None:
+            self.depth = self._ewma(self.depth, depth)
+
+    @property
+    def refill_ticks(self):
+        """Ticks for fresh flow to rebuild the usual near-touch depth."""
+        if not self.rate or self.depth is None:
+            return None
+        return self.depth / self.rate
+
+
+class ReplenishmentModel():
+    def __init__(self, levels=REPLENISH_LEVELS):
+        self.levels = levels
+        self.stats = {(t, side): SideStats() for t in SNAPSHOT_TICKERS for side in SIDES}
+        self._last = {}   # ticker -> (tick, {side: set(order_id)})
+
+    # ---- estimation ----
+    def observe(self, ticker, book, tick=None):
+        """Fold one book into the estimates (incremental, O(levels))."""
+        tick = book_tick(book) if tick is None else tick
+        if tick is None:
+            return
+        prev = self._last.get(ticker)
+        seen = {}
+        for side in SIDES:
+            near = near_orders(book.get(side, []), self.levels)
+            seen[side] = {o.get('order_id') for o in near}
+            depth = sum(remaining_qty(o) for o in near)
+
+            dt = tick - prev[0] if prev else None
+            if dt == 0 or any('order_id' not in o for o in near):
+                rate = None   # Same tick again, or aggregated levels: depth only
+            elif prev and 0 < dt <= MAX_GAP_TICKS:
+                # Liquidity that was not there last time, per elapsed tick
+                added = sum(remaining_qty(o) for o in near if o['order_id'] not in prev[1][side])
+                rate = added / dt
+            else:
+                # Survivors posted in the last AGE_WINDOW_TICKS (a lower bound)
+                recent = sum(remaining_qty(o) for o in near if tick - o.get('tick', tick) < AGE_WINDOW_TICKS)
+                rate = recent / AGE_WINDOW_TICKS
+            self.stats[(ticker, side)].add(rate, depth)
+        if prev is None or tick != prev[0]:
+            self._last[ticker] = (tick, seen)
+
+    def observe_snapshot(self, snapshot):
+        tick = snapshot.get('tick')
+        for ticker in SNAPSHOT_TICKERS:
+            book = snapshot.get(ticker.lower())
+            if book:
+                self.observe(ticker, book, tick)
+
+    def on_tick(self, tick, snapshot):
+        """TickClock callback: online update from the shared snapshot."""
+        self.observe_snapshot(snapshot)
+
+    def fit_files(self, paths):
+        """Offline seed from recorded snapshot pickles (unreadable files skipped)."""
+        fitted = 0
+        for path in sorted(paths):
+            try:
+                with open(path, 'rb') as f:
+                    snap = pickle.load(f)
+            except Exception:
+                continue
+            self.observe_snapshot(snap)
+            fitted += 1
+        return fitted
+
+    # ---- slicing advice ----
+    def side_for(self, action):
+        """Book side our marketable flow consumes."""
+        return 'asks' if action == 'BUY' else 'bids'
+
+    def chunk_and_wait(self, ticker, action, remaining, book=None, fallback=(5000, 5.0)):
+        """Chunk we can take without reaching past the near levels, and how
+        long until that much liquidity comes back."""
+        stats = self.stats[(ticker, self.side_for(action))]
+        if book is not None:
+            near = near_orders(book.get(self.side_for(action), []), self.levels)
+            available = sum(remaining_qty(o) for o in near)
+        else:
+            available = stats.depth
+        if not available or not stats.rate:
+            chunk, wait = fallback
+            return min(chunk, remaining, MAX_SIZE_EQUITY), wait
+
+        chunk = int(min(available, remaining, MAX_SIZE_EQUITY))
+        wait = chunk / stats.rate * SECONDS_PER_TICK
+        return chunk, min(max(wait, MIN_WAIT_SECONDS), MAX_WAIT_SECONDS)
+
+    def summary(self):
+        rows = []
+        for (ticker, side), st in self.stats.items():
+            if st.samples:
+                refill = st.refill_ticks
+                rows.append([ticker, side, f"{st.rate:.0f}", f"{st.depth:.0f}",
+                             f"{refill:.1f}" if refill is not None else '-', st.samples])
+        return tabulate(rows, headers=['ticker', 'side', 'shares/tick', 'near depth', 'refill ticks', 'n'])
+
+
+# Process-wide model, seeded from output/*.pkl by seed_from_recordings()
+replenishment = ReplenishmentModel()
+
+
+def seed_from_recordings(pattern="output/*.pkl"):
+    return replenishment.fit_files(glob.glob(pattern))
@@ -0,0 +1,152 @@
+# PRE-TRADE RISK ENGINE
+# Keeps per-ticker position, pending (resting) order exposure and the
+# resulting gross / net (RITC counted double) incrementally, so "can I send
+# this order?" is a handful of additions instead of a /securities round trip.
+# Installed with set_risk_engine(), it is consulted by place_mkt /
+# place_limit (and so by the multi-process order gateway) before any order
+# reaches the wire, and updated from every fill, cancel and tick snapshot.
+
+from final_utils import *
+
+RISK_WEIGHTS = {BULL: 1, BEAR: 1, RITC: 2}   # Limit weight per share
+
+
+class RiskEngine():
+    def __init__(self, gross_limit=MAX_GROSS, net_limit=MAX_LONG_NET):
+        self.gross_limit = gross_limit
+        self.net_limit = net_limit
+        self.pos = {t: 0 for t in RISK_WEIGHTS}
+        self.pending_buy = {t: 0 for t in RISK_WEIGHTS}
+        self.pending_sell = {t: 0 for t in RISK_WEIGHTS}
+        self.orders = {}          # order_id -> [ticker, action, unfilled qty]
+        self.gross = 0            # Filled exposure only
+        self.net = 0
+        self.synced = False
+        self.checks = 0
+        self.rejects = 0
+        self.last_reject = None
+        self._lock = threading.Lock()
+
+    # ---- state ----
+    def sync(self, positions):
+        """Reset filled positions from an authoritative position map."""
+        with self._lock:
+            for t in RISK_WEIGHTS:
+                self.pos[t] = int(positions.get(t, 0))
+            self.gross = sum(w * abs(self.pos[t]) for t, w in RISK_WEIGHTS.items())
+            self.net = sum(w * self.pos[t] for t, w in RISK_WEIGHTS.items())
+            self.synced = True
+
+    def on_tick(self, tick, snapshot):
+        """TickClock callback: reconcile against the snapshot's positions."""
+        if snapshot and 'positions' in snapshot:
+            self.sync(snapshot['positions'])
+
+    def load_limits(self):
+        """Adopt the gross / net limits the case reports on /limits."""
+        try:
+            for limit in get_limits():
+                if limit.get('gross_limit'):
+                    self.gross_limit = limit['gross_limit']
+                if limit.get('net_limit'):
+                    self.net_limit = limit['net_limit']
+        except Exception as e:
+            print(f"[WARNING] Could not load case limits, using defaults: {e}")
+        return self.gross_limit, self.net_limit
+
+    def apply_fill(self, ticker, action, qty, order_id=None):
+        with self._lock:
+            if order_id in self.orders:
+                order = self.orders[order_id]
+                done = min(qty, order[2])
+                order[2] -= done
+                book = self.pending_buy if order[1] == 'BUY' else self.pending_sell
+                book[order[0]] -= done
+                if order[2] <= 0:
+                    del self.orders[order_id]
+            w = RISK_WEIGHTS.get(ticker)
+            if w is None:
+                return
+            old = self.pos[ticker]
+            new = old + (qty if action == 'BUY' else -qty)
+            self.pos[ticker] = new
+            self.gross += w * (abs(new) - abs(old))
+            self.net += w * (new - old)
+
+    def add_pending(self, order_id, ticker, action, qty):
+        if ticker not in RISK_WEIGHTS or order_id is None:
+            return
+        with self._lock:
+            self.orders[order_id] = [ticker, action, qty]
+            book = self.pending_buy if action == 'BUY' else self.pending_sell
+            book[ticker] += qty
+
+    def cancel(self, order_id):
+        with self._lock:
+            order = self.orders.pop(order_id, None)
+            if order is not None:
+                book = self.pending_buy if order[1] == 'BUY' else self.pending_sell
+                book[order[0]] -= order[2]
+
+    # ---- checks ----
+    def _worst_case(self, deltas):
+        """Gross and net range if every resting order (and `deltas`) filled,
+        buys and sells taken separately."""
+        gross, net_hi, net_lo = 0, 0, 0
+        for t, w in RISK_WEIGHTS.items():
+            d = deltas.get(t, 0)
+            hi = self.pos[t] + self.pending_buy[t] + max(d, 0)
+            lo = self.pos[t] - self.pending_sell[t] + min(d, 0)
+            gross += w * max(abs(hi), abs(lo))
+            net_hi += w * hi
+            net_lo += w * lo
+        return gross, net_hi, net_lo
+
+    def check(self, deltas, buffer=1.0):
+        """None if signed per-ticker deltas fit the limits (times buffer),
+        else the reason they don't. Orders that only reduce an existing
+        breach (e.g. unwinding an oversized tender) are always allowed."""
+        if not self.synced:
+            self.sync(positions_map())
+        with self._lock:
+            self.checks += 1
+            gross0, hi0, lo0 = self._worst_case({})
+            gross, net_hi, net_lo = self._worst_case(deltas)
+        gross_limit, net_limit = self.gross_limit * buffer, self.net_limit * buffer
+        if gross >= gross_limit and gross > gross0:
+            return f"gross {gross:.0f} >= {gross_limit:.0f}"
+        if (net_hi >= net_limit and net_hi > hi0) or (net_lo <= -net_limit and net_lo < lo0):
+            return f"net {net_lo:.0f}..{net_hi:.0f} outside +/-{net_limit:.0f}"
+        return None
+
+    def check_order(self, ticker, action, qty):
+        """Reason to reject this order, or None to let it through."""
+        limit = MAX_SIZE_FX if ticker == USD else MAX_SIZE_EQUITY
+        if qty > limit:
+            return f"size {qty} > {limit}"
+        if ticker not in RISK_WEIGHTS:
+            return None
+        return self.check({ticker: qty if action == 'BUY' else -qty})
+
+    def can_send(self, ticker, action, qty):
+        return self.check_order(ticker, action, qty) is None
+
+    def reject(self, ticker, action, qty, reason):
+        self.rejects += 1
+        self.last_reject = (ticker, action, qty, reason)
+        print(f"[red][RISK] rejected {action} {qty} {ticker}: {reason}")
+
+    def within_limits(self):
+        """Filled exposure inside the limits (same test as within_limits())."""
+        return self.gross < self.gross_limit and -self.net_limit < self.net < self.net_limit
+
+    def metrics(self):
+        gross, net_hi, net_lo = self._worst_case({})
+        return {'gross': self.gross, 'net': self.net, 'gross_worst': gross,
+                'net_range': (net_lo, net_hi), 'pending_orders': len(self.orders),
+                'checks': self.checks, 'rejects': self.rejects,
+                'gross_limit': self.gross_limit, 'net_limit': self.net_limit}
+
+
+# Process-wide engine; main installs it with set_risk_engine()
+risk = RiskEngine()
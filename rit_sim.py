@@ -0,0 +1,720 @@
+# LOCAL RIT EXCHANGE SIMULATOR
+# Serves the part of the RIT REST API that final_utils uses (/case,
+# /securities, /securities/book, /securities/tas, /orders, /tenders, /limits,
+# /leases and lease conversions) on localhost, so main.py runs end to end
+# without the RIT client. Each simulated tick loads the next book snapshot
+# (recorded output/*.pkl, a synthetic random walk or a synthetic.py mode);
+# our orders match against it with price-time priority and background flow
+# implied by the recording fills our resting limits. Every request can be delayed or failed on purpose.
+#
+#   python rit_sim.py
+#   RIT_API=http://localhost:9999/v1 python main.py
+
+import glob
+import json
+import random
+import re
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from final_utils import *
+from synthetic import SyntheticMarket, MODES as SYNTHETIC_MODES
+
+SIM_HOST = "localhost"
+SIM_PORT = 9999
+SIM_SOURCE = "recorded"      # 'recorded' (output/*.pkl), 'synthetic' or a synthetic.py mode
+SIM_PATTERN = "output/*.pkl"
+SIM_TICK_SECONDS = 1.0       # Wall seconds per case tick; lower runs faster
+TICKS_PER_PERIOD = 300
+TOTAL_PERIODS = 2
+LATENCY_MS = 0.0             # Fixed delay added to every request
+JITTER_MS = 0.0              # Plus a uniform 0..JITTER_MS
+ERROR_RATE = 0.0             # Fraction of requests answered with a 503
+FLOW_SCALE = 1.0             # Multiplier on background market flow
+FLOW_MAX_GAP_TICKS = 2       # Recorded snapshots further apart imply no flow
+ENFORCE_LIMITS = True        # Reject orders that would breach gross / net
+SIM_SEED = 7
+SIM_TRADER_ID = "SIM"
+OUR_ID_BASE = 10000000       # Our order ids, clear of the recorded ones
+PRICE_STEP = 0.01            # Synthetic equity ladder spacing (USD uses 0.0001)
+BOOK_LIMIT = 20              # Orders per side returned by /securities/book
+TAS_KEEP = 1000              # Prints kept per ticker
+REPORT_EVERY_TICKS = 30
+
+QUOTE_CURRENCY = {BULL: CAD, BEAR: CAD, RITC: USD, USD: CAD}
+LIMIT_WEIGHTS = {BULL: 1, BEAR: 1, RITC: 2}
+CONVERSIONS = {   # lease ticker -> (consumed per share, produced per share)
+    "ETF-Redemption": ({RITC: 1}, {BULL: 1, BEAR: 1}),
+    "ETF-Creation": ({BULL: 1, BEAR: 1}, {RITC: 1}),
+}
+
+
+class SimError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ---- feeds: iterables of snapshot dicts in the output/*.pkl layout ----
+def load_recordings(pattern=SIM_PATTERN):
+    """Readable recorded snapshots in file (time) order."""
+    snaps = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            with open(path, 'rb') as f:
+                snaps.append(pickle.load(f))
+        except Exception:
+            continue
+    return snaps
+
+
+def snapshot_tick(snap):
+    """Case tick of a recorded snapshot: the newest order in its books."""
+    ticks = [o.get('tick', 0) for t in (BULL, BEAR, RITC) for side in ('bids', 'asks')
+             for o in snap[t.lower()][side]]
+    return max(ticks) if ticks else 0
+
+
+def implied_flow(prev, snap):
+    """Aggressive volume per ticker and side implied by resting orders that
+    filled between two snapshots: fills on the asks were buys, on the bids sells."""
+    flow = {}
+    for ticker in SNAPSHOT_TICKERS:
+        key = ticker.lower()
+        before = {o['order_id']: o.get('quantity_filled', 0) for side in ('bids', 'asks') for o in prev[key][side]}
+        out = {'BUY': 0.0, 'SELL': 0.0}
+        for side, action in (('asks', 'BUY'), ('bids', 'SELL')):
+            for o in snap[key][side]:
+                out[action] += max(o.get('quantity_filled', 0) - before.get(o['order_id'], 0), 0)
+        flow[ticker] = out
+    return flow
+
+
+def recorded_feed(pattern=SIM_PATTERN, loop=True):
+    """One recorded snapshot per case tick (the last seen for that tick),
+    with the flow implied since the previous tick; loops forever by default."""
+    snaps = load_recordings(pattern)
+    per_tick = {}
+    for snap in snaps:
+        per_tick[snapshot_tick(snap)] = snap
+    ticks = sorted(per_tick)
+    if not ticks:
+        return
+    while True:
+        prev_tick = None
+        for tick in ticks:
+            snap = dict(per_tick[tick])
+            if prev_tick is not None and tick - prev_tick <= FLOW_MAX_GAP_TICKS:
+                snap['flow'] = implied_flow(per_tick[prev_tick], snap)
+            prev_tick = tick
+            yield snap
+        if not loop:
+            return
+
+
+def synthetic_feed(seed=SIM_SEED, bull=9.8, bear=15.8, usd=1.0, vol=0.02, levels=10,
+                   level_qty=5000, flow_qty=3000, tender_every=30):
+    """Random-walk BULL/BEAR/USD with RITC quoted around NAV, ladder books
+    and a fixed-bid RITC tender every `tender_every` ticks."""
+    rng = random.Random(seed)
+    next_id, tender_id, tick = 1, 1, 0
+    while True:
+        tick += 1
+        bull = max(bull + rng.gauss(0, vol), 1.0)
+        bear = max(bear + rng.gauss(0, vol), 1.0)
+        usd = max(usd + rng.gauss(0, vol / 20), 0.5)
+        mids = {BULL: bull, BEAR: bear, USD: usd, RITC: (bull + bear) / usd + rng.gauss(0, vol)}
+        snap = {'timestamp': datetime.datetime.now().isoformat(), 'tender': {}, 'flow': {}}
+        for ticker, mid in mids.items():
+            step = 0.0001 if ticker == USD else PRICE_STEP
+            book = {'bids': [], 'asks': []}
+            for side, sign, action in (('bids', -1, 'BUY'), ('asks', 1, 'SELL')):
+                for lvl in range(levels):
+                    price = round((round(mid / step) + sign * (lvl + 1)) * step, 4)
+                    book[side].append({'order_id': next_id, 'period': 1, 'tick': tick, 'trader_id': 'ANON',
+                                       'ticker': ticker, 'quantity': float(level_qty * (1 + rng.random())),
+                                       'price': price, 'type': 'LIMIT', 'action': action,
+                                       'quantity_filled': 0.0, 'vwap': None, 'status': 'OPEN'})
+                    next_id += 1
+            snap[ticker.lower()] = book
+            snap['flow'][ticker] = {'BUY': rng.random() * flow_qty, 'SELL': rng.random() * flow_qty}
+        if tick % tender_every == 0:
+            action = rng.choice(('BUY', 'SELL'))
+            edge = rng.uniform(-0.1, 0.1)
+            price = round(mids[RITC] - edge if action == 'BUY' else mids[RITC] + edge, 2)
+            snap['tender'] = {'tender_id': tender_id, 'period': 1, 'tick': tick, 'expires': tick + 15,
+                              'caption': 'Synthetic tender', 'ticker': RITC,
+                              'quantity': float(rng.randrange(20000, 100000, 1000)),
+                              'action': action, 'is_fixed_bid': True, 'price': price}
+            tender_id += 1
+        yield snap
+
+
+def make_feed(source=SIM_SOURCE, pattern=SIM_PATTERN, seed=SIM_SEED):
+    if source == 'recorded':
+        return recorded_feed(pattern)
+    if source == 'synthetic':
+        return synthetic_feed(seed)
+    if source in SYNTHETIC_MODES:   # 'generated', 'heavy_tenders', 'thin_book', 'stress'
+        return SyntheticMarket(seed, mode=source)
+    raise ValueError(f"Unknown simulator source: {source}")
+
+
+# ---- exchange ----
+class SimExchange():
+    def __init__(self, feed, ticks_per_period=TICKS_PER_PERIOD, total_periods=TOTAL_PERIODS,
+                 flow_scale=FLOW_SCALE, enforce_limits=ENFORCE_LIMITS):
+        self.feed = iter(feed)
+        self.ticks_per_period = ticks_per_period
+        self.total_periods = total_periods
+        self.flow_scale = flow_scale
+        self.enforce_limits = enforce_limits
+        self.lock = threading.RLock()
+        self.period, self.tick, self.status = 1, 0, 'ACTIVE'
+        self.books = {t: {'bids': [], 'asks': []} for t in SNAPSHOT_TICKERS}
+        self.arrival = {}       # order_id -> (tick, seq): queue priority
+        self.orders = {}        # Our orders by id
+        self.positions = {t: 0.0 for t in (BULL, BEAR, RITC, USD, CAD)}
+        self.last = {t: 0.0 for t in SNAPSHOT_TICKERS}
+        self.tenders = {}       # Active tenders by id
+        self.seen_tenders = set()
+        self.leases = {}
+        self.tas = {t: [] for t in SNAPSHOT_TICKERS}
+        self.next_order_id = OUR_ID_BASE
+        self.next_print_id = 1
+        self.next_lease_id = 1
+        self.seq = 0
+        self.fills = 0
+        self.fees = 0.0
+        self.conversions = 0
+        self.tenders_accepted = 0
+
+    # ---- clock ----
+    def advance(self):
+        """Move to the next tick: next snapshot, tenders, background flow."""
+        with self.lock:
+            if self.status != 'ACTIVE':
+                return False
+            snap = next(self.feed, None)
+            if snap is None:
+                self.status = 'STOPPED'
+                return False
+            self.tick += 1
+            if self.tick > self.ticks_per_period:
+                self._end_period()
+                if self.status != 'ACTIVE':
+                    return False
+            self.load(snap)
+            return True
+
+    def load(self, snap, tick=None):
+        """Make `snap` the current market: its books, any new tenders and the
+        background flow it carries. The replay broker calls this directly."""
+        with self.lock:
+            if tick is not None:
+                self.tick = tick
+            self._load_books(snap)
+            self._load_tenders(snap)
+            for ticker, flow in snap.get('flow', {}).items():
+                for action, qty in flow.items():
+                    if qty * self.flow_scale >= 1:
+                        self._sweep(ticker, action, int(qty * self.flow_scale))
+
+    def _end_period(self):
+        """Close out at the mid like RIT does, then start a clean period."""
+        for ticker in SNAPSHOT_TICKERS:
+            bid, ask = self._touch(ticker)
+            mid = (bid + ask) / 2 if bid and ask else self.last[ticker]
+            qty = self.positions[ticker]
+            self.positions[QUOTE_CURRENCY[ticker]] += qty * mid
+            self.positions[ticker] = 0.0
+        if self.positions[USD]:   # USD cash back to CAD
+            self.positions[CAD] += self.positions[USD] * (self.last[USD] or 1.0)
+            self.positions[USD] = 0.0
+        for order in self.orders.values():
+            if order['status'] == 'OPEN':
+                order['status'] = 'CANCELLED'
+        for book in self.books.values():
+            book['bids'], book['asks'] = [], []
+        self.tenders.clear()
+        self.leases.clear()
+        self.period += 1
+        self.tick = 1
+        if self.period > self.total_periods:
+            self.period, self.tick = self.total_periods, self.ticks_per_period
+            self.status = 'STOPPED'
+
+    # ---- books ----
+    def _next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def _sort(self, ticker):
+        book = self.books[ticker]
+        book['bids'].sort(key=lambda o: (-o['price'], self.arrival[o['order_id']], o['order_id']))
+        book['asks'].sort(key=lambda o: (o['price'], self.arrival[o['order_id']], o['order_id']))
+
+    def _load_books(self, snap):
+        """Replace background liquidity with the snapshot's, keep our resting
+        orders in the queue, then let crossing background orders hit ours."""
+        live = set()
+        for ticker in SNAPSHOT_TICKERS:
+            book = self.books[ticker]
+            for side in ('bids', 'asks'):
+                ours = [o for o in book[side] if o['trader_id'] == SIM_TRADER_ID]
+                theirs = [dict(o) for o in snap[ticker.lower()][side]
+                          if o['quantity'] - o.get('quantity_filled', 0) > 0]
+                for o in theirs:
+                    self.arrival.setdefault(o['order_id'], (self.tick, 0))
+                book[side] = ours + theirs
+                live.update(o['order_id'] for o in book[side])
+            self._sort(ticker)
+            self._uncross(ticker)
+        self.arrival = {oid: a for oid, a in self.arrival.items() if oid in live}
+
+    def _uncross(self, ticker):
+        book = self.books[ticker]
+        while book['bids'] and book['asks']:
+            bid, ask = book['bids'][0], book['asks'][0]
+            if bid['price'] < ask['price']:
+                break
+            ours_bid, ours_ask = bid['trader_id'] == SIM_TRADER_ID, ask['trader_id'] == SIM_TRADER_ID
+            if not ours_bid and not ours_ask:
+                break   # Recorded book crossed on its own: leave it
+            # New background liquidity trades at our resting price
+            resting = bid if ours_bid and (not ours_ask or self.arrival[bid['order_id']] <= self.arrival[ask['order_id']]) else ask
+            qty = min(self._remaining(bid), self._remaining(ask))
+            self._fill(bid, qty, resting['price'], passive=bid is resting)
+            self._fill(ask, qty, resting['price'], passive=ask is resting)
+            self._print(ticker, resting['price'], qty)
+            self._prune(ticker)
+
+    def _remaining(self, order):
+        return order['quantity'] - order['quantity_filled']
+
+    def _prune(self, ticker):
+        book = self.books[ticker]
+        for side in ('bids', 'asks'):
+            book[side] = [o for o in book[side] if self._remaining(o) > 0 and o['status'] == 'OPEN']
+
+    def _touch(self, ticker):
+        book = self.books[ticker]
+        bid = book['bids'][0]['price'] if book['bids'] else 0.0
+        ask = book['asks'][0]['price'] if book['asks'] else 0.0
+        return bid, ask
+
+    def _print(self, ticker, price, qty):
+        self.last[ticker] = price
+        prints = self.tas[ticker]
+        prints.append({'id': self.next_print_id, 'period': self.period, 'tick': self.tick,
+                       'price': price, 'quantity': qty})
+        self.next_print_id += 1
+        if len(prints) > TAS_KEEP:
+            del prints[:len(prints) - TAS_KEEP]
+
+    def _fill(self, order, qty, price, passive):
+        filled = order['quantity_filled']
+        order['vwap'] = ((order['vwap'] or 0.0) * filled + price * qty) / (filled + qty)
+        order['quantity_filled'] = filled + qty
+        if self._remaining(order) <= 0:
+            order['status'] = 'TRANSACTED'
+        if order['trader_id'] != SIM_TRADER_ID:
+            return
+        ticker, sign = order['ticker'], 1 if order['action'] == 'BUY' else -1
+        self.positions[ticker] += sign * qty
+        self.positions[QUOTE_CURRENCY[ticker]] -= sign * qty * price
+        if ticker != USD:
+            fee = -REBATE_LMT * qty if passive else FEE_MKT * qty
+            self.positions[CAD] -= fee
+            self.fees += fee
+        self.fills += 1
+
+    def _sweep(self, ticker, action, qty, taker=None, limit=None):
+        """Aggressive `action` of qty against the opposite side in priority
+        order, up to `limit`. `taker` is our order when we are the aggressor."""
+        levels = self.books[ticker]['asks' if action == 'BUY' else 'bids']
+        left = qty
+        for resting in levels:
+            if left <= 0:
+                break
+            price = resting['price']
+            if limit is not None and (price > limit if action == 'BUY' else price < limit):
+                break
+            take = min(left, self._remaining(resting))
+            if take <= 0:
+                continue
+            self._fill(resting, take, price, passive=True)
+            if taker is not None:
+                self._fill(taker, take, price, passive=False)
+            self._print(ticker, price, take)
+            left -= take
+        self._prune(ticker)
+        return qty - left
+
+    # ---- checks ----
+    def _limit_usage(self, positions):
+        gross = sum(w * abs(positions[t]) for t, w in LIMIT_WEIGHTS.items())
+        net = sum(w * positions[t] for t, w in LIMIT_WEIGHTS.items())
+        return gross, net
+
+    def _check_limits(self, ticker, action, qty):
+        if not self.enforce_limits or ticker not in LIMIT_WEIGHTS:
+            return
+        after = dict(self.positions)
+        after[ticker] += qty if action == 'BUY' else -qty
+        gross0, net0 = self._limit_usage(self.positions)
+        gross, net = self._limit_usage(after)
+        if (gross > MAX_GROSS and gross > gross0) or (abs(net) > MAX_LONG_NET and abs(net) > abs(net0)):
+            raise SimError(400, "Order would exceed trading limits")
+
+    def _require_active(self):
+        if self.status != 'ACTIVE':
+            raise SimError(400, "Case is not active")
+
+    # ---- API ----
+    def get_case(self, params):
+        return {'name': 'RIT Simulator', 'period': self.period, 'tick': self.tick,
+                'ticks_per_period': self.ticks_per_period, 'total_periods': self.total_periods,
+                'status': self.status, 'is_enforce_trading_limits': self.enforce_limits}
+
+    def get_securities(self, params):
+        out = []
+        for ticker in (CAD, USD, BULL, BEAR, RITC):
+            row = {'ticker': ticker, 'position': self.positions[ticker]}
+            if ticker in self.books:
+                bid, ask = self._touch(ticker)
+                book = self.books[ticker]
+                row.update({'bid': bid, 'ask': ask, 'last': self.last[ticker],
+                            'bid_size': self._remaining(book['bids'][0]) if book['bids'] else 0,
+                            'ask_size': self._remaining(book['asks'][0]) if book['asks'] else 0,
+                            'currency': QUOTE_CURRENCY[ticker]})
+            out.append(row)
+        return out
+
+    def _ticker(self, params):
+        ticker = params.get('ticker')
+        if ticker not in self.books:
+            raise SimError(400, f"Unknown ticker: {ticker}")
+        return ticker
+
+    def get_book(self, params):
+        book = self.books[self._ticker(params)]
+        limit = int(params.get('limit', BOOK_LIMIT))
+        return {side: [dict(o) for o in book[side][:limit]] for side in ('bids', 'asks')}
+
+    def get_tas(self, params):
+        after = int(params.get('after', 0))
+        return [p for p in self.tas[self._ticker(params)] if p['id'] > after]
+
+    def get_orders(self, params):
+        status = params.get('status', 'OPEN')
+        return [dict(o) for o in self.orders.values() if o['status'] == status]
+
+    def post_order(self, params):
+        self._require_active()
+        ticker = self._ticker(params)
+        action, kind = params.get('action'), params.get('type')
+        if action not in ('BUY', 'SELL') or kind not in ('LIMIT', 'MARKET'):
+            raise SimError(400, "action must be BUY/SELL and type LIMIT/MARKET")
+        qty = int(float(params.get('quantity', 0)))
+        max_size = MAX_SIZE_FX if ticker == USD else MAX_SIZE_EQUITY
+        if not 0 < qty <= max_size:
+            raise SimError(400, f"Order quantity must be between 1 and {max_size}")
+        price = float(params['price']) if kind == 'LIMIT' and 'price' in params else None
+        if kind == 'LIMIT' and price is None:
+            raise SimError(400, "LIMIT orders need a price")
+        self._check_limits(ticker, action, qty)
+
+        order = {'order_id': self.next_order_id, 'period': self.period, 'tick': self.tick,
+                 'trader_id': SIM_TRADER_ID, 'ticker': ticker, 'quantity': float(qty), 'price': price,
+                 'type': kind, 'action': action, 'quantity_filled': 0.0, 'vwap': None, 'status': 'OPEN'}
+        self.next_order_id += 1
+        self.orders[order['order_id']] = order
+        self._sweep(ticker, action, qty, taker=order, limit=price)
+        if kind == 'MARKET':
+            order['status'] = 'TRANSACTED'   # Unfilled remainder of a market order lapses
+        elif order['status'] == 'OPEN':
+            self.arrival[order['order_id']] = (self.tick, self._next_seq())
+            self.books[ticker]['bids' if action == 'BUY' else 'asks'].append(order)
+            self._sort(ticker)
+        return dict(order)
+
+    def _our_order(self, order_id):
+        order = self.orders.get(int(order_id))
+        if order is None:
+            raise SimError(404, f"Order {order_id} not found")
+        return order
+
+    def get_order(self, params, order_id):
+        return dict(self._our_order(order_id))
+
+    def delete_order(self, params, order_id):
+        order = self._our_order(order_id)
+        if order['status'] != 'OPEN':
+            return {'success': False}
+        order['status'] = 'CANCELLED'
+        self._prune(order['ticker'])
+        return {'success': True}
+
+    def get_limits(self, params):
+        gross, net = self._limit_usage(self.positions)
+        return [{'name': 'LIMIT-STOCK', 'gross': gross, 'net': net, 'gross_limit': MAX_GROSS,
+                 'net_limit': MAX_LONG_NET, 'gross_fine': 0, 'net_fine': 0}]
+
+    # ---- tenders ----
+    def _load_tenders(self, snap):
+        offers = snap.get('tenders') or ([snap['tender']] if snap.get('tender') else [])
+        for offer in offers:
+            if offer['tender_id'] in self.seen_tenders:
+                continue
+            self.seen_tenders.add(offer['tender_id'])
+            tender = dict(offer)
+            life = max(int(offer.get('expires', 0) - offer.get('tick', 0)), 1)
+            tender.update({'period': self.period, 'tick': self.tick, 'expires': self.tick + life})
+            self.tenders[tender['tender_id']] = tender
+        for tender_id in [i for i, t in self.tenders.items() if self.tick >= t['expires']]:
+            del self.tenders[tender_id]
+
+    def get_tenders(self, params):
+        return [dict(t) for t in self.tenders.values()]
+
+    def _tender(self, tender_id):
+        tender = self.tenders.get(int(tender_id))
+        if tender is None:
+            raise SimError(404, f"Tender {tender_id} not found or expired")
+        return tender
+
+    def post_tender(self, params, tender_id):
+        self._require_active()
+        tender = self._tender(tender_id)
+        price = tender['price']
+        if not tender['is_fixed_bid']:
+            if 'price' not in params:
+                raise SimError(400, "Auction tenders need a price")
+            price = float(params['price'])
+            # Reserve: the institution takes bids at least as good as its quote
+            if (price < tender['price']) if tender['action'] == 'BUY' else (price > tender['price']):
+                del self.tenders[tender['tender_id']]
+                return {'success': False}
+        sign = 1 if tender['action'] == 'BUY' else -1
+        self.positions[tender['ticker']] += sign * tender['quantity']
+        self.positions[QUOTE_CURRENCY[tender['ticker']]] -= sign * tender['quantity'] * price
+        del self.tenders[tender['tender_id']]
+        self.tenders_accepted += 1
+        return {'success': True}
+
+    def delete_tender(self, params, tender_id):
+        del self.tenders[self._tender(tender_id)['tender_id']]
+        return {'success': True}
+
+    # ---- leases ----
+    def get_leases(self, params):
+        return [dict(l) for l in self.leases.values()]
+
+    def post_lease(self, params):
+        self._require_active()
+        ticker = params.get('ticker')
+        if ticker not in CONVERSIONS:
+            raise SimError(400, f"Unknown lease: {ticker}")
+        lease = {'id': self.next_lease_id, 'ticker': ticker, 'type': 'CONVERTER',
+                 'start_lease_period': self.period, 'start_lease_tick': self.tick}
+        self.next_lease_id += 1
+        self.leases[lease['id']] = lease
+        return dict(lease)
+
+    def use_lease(self, params, lease_id):
+        """Convert instantly: the `fromN`/`quantityN` legs must hold the
+        per-share inputs and the USD conversion fee."""
+        self._require_active()
+        lease = self.leases.get(int(lease_id))
+        if lease is None:
+            raise SimError(404, f"Lease {lease_id} not found")
+        legs = {}
+        for n in range(1, 4):
+            if f"from{n}" in params:
+                legs[params[f"from{n}"]] = int(float(params.get(f"quantity{n}", 0)))
+        consumed, produced = CONVERSIONS[lease['ticker']]
+        qty = legs.get(next(iter(consumed)), 0)
+        if qty <= 0 or any(legs.get(t, 0) != w * qty for t, w in consumed.items()):
+            raise SimError(400, f"{lease['ticker']} needs equal {'/'.join(consumed)} legs")
+        fee = int(CONVERTER_COST * qty // CONVERTER_BATCH)
+        if legs.get(USD, 0) < fee:
+            raise SimError(400, f"Conversion of {qty} needs {fee} USD")
+        for ticker, w in consumed.items():
+            self.positions[ticker] -= w * qty
+        for ticker, w in produced.items():
+            self.positions[ticker] += w * qty
+        self.positions[USD] -= fee
+        self.conversions += 1
+        return dict(lease)
+
+    def summary(self):
+        gross, net = self._limit_usage(self.positions)
+        return {'period': self.period, 'tick': self.tick, 'status': self.status, 'fills': self.fills,
+                'fees': round(self.fees, 2), 'conversions': self.conversions,
+                'tenders_accepted': self.tenders_accepted, 'gross': gross, 'net': net,
+                'positions': {t: round(q, 2) for t, q in self.positions.items()}}
+
+
+# ---- HTTP ----
+ROUTES = [
+    ('GET', r"/v1/case", 'get_case'),
+    ('GET', r"/v1/securities", 'get_securities'),
+    ('GET', r"/v1/securities/book", 'get_book'),
+    ('GET', r"/v1/securities/tas", 'get_tas'),
+    ('GET', r"/v1/orders", 'get_orders'),
+    ('POST', r"/v1/orders", 'post_order'),
+    ('GET', r"/v1/orders/(\d+)", 'get_order'),
+    ('DELETE', r"/v1/orders/(\d+)", 'delete_order'),
+    ('GET', r"/v1/limits", 'get_limits'),
+    ('GET', r"/v1/tenders", 'get_tenders'),
+    ('POST', r"/v1/tenders/(\d+)", 'post_tender'),
+    ('DELETE', r"/v1/tenders/(\d+)", 'delete_tender'),
+    ('GET', r"/v1/leases", 'get_leases'),
+    ('POST', r"/v1/leases", 'post_lease'),
+    ('POST', r"/v1/leases/(\d+)", 'use_lease'),
+]
+ROUTES = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+
+
+class SimHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive, like the real client
+
+    def _dispatch(self, method):
+        sim = self.server.sim
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        delay = sim.latency_ms + random.random() * sim.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if sim.error_rate and random.random() < sim.error_rate:
+            sim.injected_errors += 1
+            return self._reply(503, {'code': 'SERVICE_UNAVAILABLE', 'message': 'Injected failure'})
+
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                st_time = time.perf_counter()
+                try:
+                    with sim.exchange.lock:
+                        body = getattr(sim.exchange, name)(params, *match.groups())
+                    status = 200
+                except SimError as e:
+                    status, body = e.status, {'code': 'BAD_REQUEST' if e.status == 400 else 'NOT_FOUND',
+                                              'message': str(e)}
+                except (KeyError, ValueError) as e:
+                    status, body = 400, {'code': 'BAD_REQUEST', 'message': f"Bad parameters: {e}"}
+                sim.record(name, time.perf_counter() - st_time)
+                return self._reply(status, body)
+        self._reply(404, {'code': 'NOT_FOUND', 'message': f"No route for {method} {url.path}"})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.server.sim.stopped:
+            self.close_connection = True   # Don't keep serving after stop()
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RitSimulator():
+    """HTTP server plus the thread that advances the case clock."""
+    def __init__(self, exchange, host=SIM_HOST, port=SIM_PORT, tick_seconds=SIM_TICK_SECONDS,
+                 latency_ms=LATENCY_MS, jitter_ms=JITTER_MS, error_rate=ERROR_RATE):
+        self.exchange = exchange
+        self.tick_seconds = tick_seconds
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.injected_errors = 0
+        self.stats = {}        # route -> [requests, seconds handling]
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), SimHandler)
+        self.server.daemon_threads = True
+        self.server.sim = self
+        self.threads = []
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    @property
+    def api(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, route, seconds):
+        with self._stats_lock:
+            stat = self.stats.setdefault(route, [0, 0.0])
+            stat[0] += 1
+            stat[1] += seconds
+
+    def _run_clock(self):
+        next_tick = time.time()
+        while not self._stop.is_set():
+            if not self.exchange.advance() and self.exchange.status != 'ACTIVE':
+                print(f"Simulator: case {self.exchange.status} at tick {self.exchange.tick}")
+                break
+            if REPORT_EVERY_TICKS and self.exchange.tick % REPORT_EVERY_TICKS == 0:
+                self.print_report()
+            next_tick += self.tick_seconds
+            self._stop.wait(max(next_tick - time.time(), 0))
+
+    def start(self):
+        """Serve and tick in background threads; returns self."""
+        for name, target in (('sim-http', self.server.serve_forever), ('sim-clock', self._run_clock)):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def print_report(self):
+        with self._stats_lock:
+            rows = [[route, n, f"{secs / n * 1e6:.0f}"] for route, (n, secs) in sorted(self.stats.items())]
+        print(f"Simulator: {self.exchange.summary()} injected errors {self.injected_errors}")
+        print(tabulate(rows, headers=['route', 'requests', 'mean us']))
+
+
+def run_simulator(source=SIM_SOURCE, port=SIM_PORT, tick_seconds=SIM_TICK_SECONDS,
+                  latency_ms=LATENCY_MS, jitter_ms=JITTER_MS, error_rate=ERROR_RATE, feed=None):
+    """Start a simulator in the background and return it (stop() when done)."""
+    exchange = SimExchange(feed if feed is not None else make_feed(source))
+    sim = RitSimulator(exchange, port=port, tick_seconds=tick_seconds, latency_ms=latency_ms,
+                       jitter_ms=jitter_ms, error_rate=error_rate)
+    print(f"Simulator: serving {source} books on {sim.api}, {tick_seconds}s ticks, "
+          f"{latency_ms}+{jitter_ms}ms latency, {error_rate:.0%} errors")
+    return sim.start()
+
+
+if __name__ == "__main__":
+    sim = run_simulator()
+    try:
+        while sim.exchange.status == 'ACTIVE':
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    sim.print_report()
+    sim.stop()
@@ -0,0 +1,136 @@
+# ROLLING STATISTICS ENGINE
+# O(1) per-tick running mean / variance over fixed windows (ring buffers with
+# running sums) plus EWMA mean / variance, for several windows at once and
+# for several series side by side (e.g. the short and long StatArb spreads).
+
+import numpy as np
+
+RESYNC_EVERY = 64   # Re-sum a window from its buffer every RESYNC_EVERY * window updates
+
+
+class RollingWindow():
+    """Fixed-length window over `width` parallel series with running sums."""
+    def __init__(self, window, width=1):
+        self.window = window
+        self.buf = np.zeros((window, width))
+        self.sum = np.zeros(width)
+        self.sumsq = np.zeros(width)
+        self.n = 0
+        self.pos = 0
+        self.updates = 0
+
+    def update(self, x):
+        old = self.buf[self.pos]
+        if self.n == self.window:
+            self.sum -= old
+            self.sumsq -= old * old
+        else:
+            self.n += 1
+        old[:] = x
+        self.sum += old
+        self.sumsq += old * old
+        self.pos = (self.pos + 1) % self.window
+
+        # Running sums drift in float arithmetic; rebuild them occasionally
+        self.updates += 1
+        if self.updates % (RESYNC_EVERY * self.window) == 0:
+            live = self.buf[:self.n]
+            self.sum = live.sum(axis=0)
+            self.sumsq = (live * live).sum(axis=0)
+
+    @property
+    def full(self):
+        return self.n == self.window
+
+    def mean(self):
+        if self.n == 0:
+            return np.zeros_like(self.sum)
+        return self.sum / self.n
+
+    def var(self):
+        """Population variance (matches np.var / np.std defaults)."""
+        if self.n == 0:
+            return np.zeros_like(self.sum)
+        m = self.sum / self.n
+        return np.maximum(self.sumsq / self.n - m * m, 0.0)
+
+    def std(self):
+        return np.sqrt(self.var())
+
+    def values(self):
+        """Window contents, oldest first (copies; not for the hot path)."""
+        if self.n < self.window:
+            return self.buf[:self.n].copy()
+        return np.roll(self.buf, -self.pos, axis=0)
+
+
+class Ewma():
+    """Exponentially weighted mean / variance; span follows the pandas convention."""
+    def __init__(self, span, width=1):
+        self.span = span
+        self.alpha = 2.0 / (span + 1.0)
+        self.m = np.zeros(width)
+        self.v = np.zeros(width)
+        self.n = 0
+
+    def update(self, x):
+        if self.n == 0:
+            self.m = np.array(x, dtype=float)
+        else:
+            diff = x - self.m
+            incr = self.alpha * diff
+            self.m = self.m + incr
+            self.v = (1 - self.alpha) * (self.v + diff * incr)
+        self.n += 1
+
+    def mean(self):
+        return self.m
+
+    def var(self):
+        return self.v
+
+    def std(self):
+        return np.sqrt(self.v)
+
+
+class RollingStats():
+    """Several windows and EWMA spans over the same series, one update per tick."""
+    def __init__(self, windows=(30,), spans=(), width=1):
+        self.width = width
+        self.windows = {w: RollingWindow(w, width) for w in windows}
+        self.ewmas = {span: Ewma(span, width) for span in spans}
+        self.count = 0
+        self.last = np.zeros(width)
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        self.last = x
+        for win in self.windows.values():
+            win.update(x)
+        for ew in self.ewmas.values():
+            ew.update(x)
+        self.count += 1
+
+    def _source(self, window=None, span=None):
+        if span is not None:
+            return self.ewmas[span]
+        if window is None:
+            window = next(iter(self.windows))
+        return self.windows[window]
+
+    def mean(self, window=None, span=None):
+        return self._source(window, span).mean()
+
+    def std(self, window=None, span=None):
+        return self._source(window, span).std()
+
+    def zscore(self, x=None, window=None, span=None):
+        """z-score of x (default: latest observation) against one window / span."""
+        src = self._source(window, span)
+        x = self.last if x is None else np.asarray(x, dtype=float)
+        std = src.std()
+        return np.divide(x - src.mean(), std, out=np.zeros(self.width), where=std > 0)
+
+    def ready(self, window=None):
+        src = self._source(window)
+        return src.full
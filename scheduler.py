@@ -0,0 +1,138 @@
+# MULTI-STRATEGY SCHEDULER
+# Runs tenders, stat-arb, ETF-arb and conversion-arb in one process on the
+# tick clock's shared snapshot. Critical strategies (tenders) run inline on
+# the clock thread; everything else runs on its own worker thread so a slow
+# book can only ever delay itself, never tender handling.
+
+from final_utils import *
+from concurrent.futures import ThreadPoolExecutor
+from tick_clock import LatencyStats
+
+DEFAULT_BUDGET_SECONDS = 0.5   # Wall-clock budget per strategy per tick
+OVERRUN_COOLDOWN_TICKS = 2     # Ticks a strategy sits out after blowing its budget
+DEADLINE_BUDGETS = 2.0         # API calls of a background strategy fail after this many budgets
+
+
+class ScheduledStrategy():
+    def __init__(self, name, fn, budget=DEFAULT_BUDGET_SECONDS, critical=False):
+        self.name = name
+        self.fn = fn                  # fn(tick, snapshot)
+        self.budget = budget
+        self.critical = critical
+        self.enabled = True
+
+        self.executor = None if critical else ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.future = None
+        self.cooldown_until = -1
+
+        self.latency = LatencyStats()
+        self.cpu_seconds = 0.0
+        self.runs = 0
+        self.overruns = 0
+        self.skipped_busy = 0
+        self.skipped_cooldown = 0
+        self.skipped_disabled = 0
+        self.skipped_degraded = 0
+
+
+class StrategyScheduler():
+    def __init__(self):
+        self.strategies = []
+        self.lock = threading.Lock()
+        self.health_check = None    # fn() -> False while the API is degraded
+        self.degraded_ticks = 0
+
+    def add(self, name, fn, budget=DEFAULT_BUDGET_SECONDS, critical=False):
+        strat = ScheduledStrategy(name, fn, budget, critical)
+        self.strategies.append(strat)
+        return strat
+
+    def set_enabled(self, name, enabled):
+        for strat in self.strategies:
+            if strat.name == name:
+                strat.enabled = enabled
+
+    def set_health_check(self, fn):
+        """While fn() is False only critical strategies run (degraded mode)."""
+        self.health_check = fn
+
+    def _run(self, strat, tick, snapshot):
+        c0 = time.thread_time()
+        w0 = time.perf_counter()
+        try:
+            if strat.critical:
+                strat.fn(tick, snapshot)
+            else:
+                # Background books fail fast instead of waiting on a slow API
+                # while deciding; trades they commit to run under no_deadline()
+                with deadline(strat.budget * DEADLINE_BUDGETS):
+                    strat.fn(tick, snapshot)
+        except Exception as e:
+            strat.latency.errors += 1
+            print(f"[ERROR] {strat.name} failed on tick {tick}: {e}")
+        finally:
+            elapsed = time.perf_counter() - w0
+            with self.lock:
+                strat.runs += 1
+                strat.cpu_seconds += time.thread_time() - c0
+                strat.latency.add(elapsed)
+                if elapsed > strat.budget and not strat.critical:
+                    strat.overruns += 1
+                    strat.cooldown_until = tick + OVERRUN_COOLDOWN_TICKS
+
+    def run_tick(self, tick, snapshot):
+        """Dispatch every strategy for this tick. Background books are
+        submitted first so they overlap with the inline critical ones."""
+        degraded = self.health_check is not None and not self.health_check()
+        if degraded:
+            self.degraded_ticks += 1
+        for strat in self.strategies:
+            if strat.critical:
+                continue
+            if not strat.enabled:
+                strat.skipped_disabled += 1
+            elif degraded:
+                strat.skipped_degraded += 1   # Keep the API for tenders
+            elif strat.future is not None and not strat.future.done():
+                strat.skipped_busy += 1   # Still working on an earlier tick
+            elif tick <= strat.cooldown_until:
+                strat.skipped_cooldown += 1
+            else:
+                strat.future = strat.executor.submit(self._run, strat, tick, snapshot)
+
+        for strat in self.strategies:
+            if strat.critical:
+                if strat.enabled:
+                    self._run(strat, tick, snapshot)
+                else:
+                    strat.skipped_disabled += 1
+
+    def accounting(self):
+        with self.lock:
+            return {
+                strat.name: dict(strat.latency.summary(),
+                                 critical=strat.critical,
+                                 enabled=strat.enabled,
+                                 cpu_ms=strat.cpu_seconds * 1000,
+                                 overruns=strat.overruns,
+                                 skipped_busy=strat.skipped_busy,
+                                 skipped_cooldown=strat.skipped_cooldown,
+                                 skipped_disabled=strat.skipped_disabled,
+                                 skipped_degraded=strat.skipped_degraded)
+                for strat in self.strategies
+            }
+
+    def print_report(self):
+        rows = []
+        for name, st in self.accounting().items():
+            rows.append([name, 'Y' if st['critical'] else '', st['count'], st['errors'],
+                         f"{st.get('mean_ms', 0):.1f}", f"{st.get('p95_ms', 0):.1f}",
+                         f"{st['cpu_ms']:.0f}", st['overruns'], st['skipped_busy'], st['skipped_cooldown'],
+                         st['skipped_degraded']])
+        print(tabulate(rows, headers=['strategy', 'crit', 'runs', 'errors', 'mean ms', 'p95 ms',
+                                      'cpu ms', 'overruns', 'busy', 'cooldown', 'degraded']))
+
+    def shutdown(self):
+        for strat in self.strategies:
+            if strat.executor is not None:
+                strat.executor.shutdown(wait=False)
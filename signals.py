@@ -0,0 +1,183 @@
+# SHORT-HORIZON BOOK SIGNALS
+# Depth imbalance, spread state and mid drift for all four tickers at once
+# (one array op per feature), folded into a "wait vs. trade now" score for
+# the unwind loop. Runs once per snapshot and can be replayed over the
+# recorded output/*.pkl snapshots with backtest().
+
+import copy
+import glob
+from final_utils import *
+from rolling_stats import Ewma
+
+SIGNAL_LEVELS = 3        # Levels per side in the depth imbalance
+DRIFT_SPAN = 10          # EWMA span (snapshots) of mid changes
+SPREAD_SPAN = 30         # EWMA span (snapshots) of the spread
+W_IMBALANCE = 0.5        # Score weights
+W_DRIFT = 0.35
+W_SPREAD = 0.15
+WAIT_BELOW = -0.2        # Scores under this mean "wait"
+SIGNAL_POLL_SECONDS = 0.1
+BURST_GAP_SECONDS = 2.0  # Recorded snapshots further apart start a new run
+
+TICKER_INDEX = {t: i for i, t in enumerate(SNAPSHOT_TICKERS)}
+
+
+def book_features(books, levels=SIGNAL_LEVELS):
+    """Touch and near depth of every ticker as arrays ordered like SNAPSHOT_TICKERS."""
+    n = len(SNAPSHOT_TICKERS)
+    bid, ask, bid_qty, ask_qty = np.zeros(n), np.zeros(n), np.zeros(n), np.zeros(n)
+    for i, ticker in enumerate(SNAPSHOT_TICKERS):
+        book = books[ticker.lower()]
+        bids = aggregate_levels(book['bids'], levels)
+        asks = aggregate_levels(book['asks'], levels)
+        if bids:
+            bid[i] = bids[0][0]
+            bid_qty[i] = sum(q for _, q in bids)
+        if asks:
+            ask[i] = asks[0][0]
+            ask_qty[i] = sum(q for _, q in asks)
+    return bid, ask, bid_qty, ask_qty
+
+
+class SignalEngine():
+    def __init__(self):
+        n = len(SNAPSHOT_TICKERS)
+        self.drift = Ewma(DRIFT_SPAN, n)        # Mid change per snapshot
+        self.spread_avg = Ewma(SPREAD_SPAN, n)
+        self.last_mid = None
+        self.imbalance = np.zeros(n)
+        self.spread_ratio = np.ones(n)
+        self.drift_norm = np.zeros(n)
+        self.valid = np.zeros(n, dtype=bool)
+        self.updates = 0
+
+    def update(self, books):
+        bid, ask, bid_qty, ask_qty = book_features(books)
+        valid = (bid > 0) & (ask > 0)
+        mid = np.where(valid, (bid + ask) / 2, 0.0)
+        spread = np.where(valid, ask - bid, 0.0)
+        depth = bid_qty + ask_qty
+
+        # +1: all near depth on the bid (buying pressure), -1: all on the ask
+        self.imbalance = np.divide(bid_qty - ask_qty, depth, out=np.zeros_like(depth), where=depth > 0)
+
+        self.spread_avg.update(spread)
+        avg = self.spread_avg.mean()
+        self.spread_ratio = np.divide(spread, avg, out=np.ones_like(spread), where=avg > 0)
+
+        if self.last_mid is not None:
+            both = valid & (self.last_mid > 0)
+            self.drift.update(np.where(both, mid - self.last_mid, 0.0))
+        self.last_mid = mid
+        # Drift in units of the typical spread, so tickers are comparable
+        self.drift_norm = np.divide(self.drift.mean(), avg, out=np.zeros_like(avg), where=avg > 0)
+        self.valid = valid
+        self.updates += 1
+
+    def update_snapshot(self, snapshot):
+        self.update({t.lower(): snapshot[t.lower()] for t in SNAPSHOT_TICKERS})
+
+    def on_tick(self, tick, snapshot):
+        """TickClock callback: one update per tick for all four tickers."""
+        self.update_snapshot(snapshot)
+
+    def refresh(self):
+        """Update from the current books (snapshot when fresh, else live)."""
+        books = {t.lower(): best_bid_ask_entire_depth(t) for t in SNAPSHOT_TICKERS}
+        self.update(books)
+
+    def preview(self, books):
+        """A copy of the engine advanced by `books`; this one is left as is."""
+        engine = copy.copy(self)
+        # Ewma.update rebinds its arrays, so shallow copies are enough
+        engine.drift = copy.copy(self.drift)
+        engine.spread_avg = copy.copy(self.spread_avg)
+        engine.update(books)
+        return engine
+
+    def peek(self):
+        """preview() on the current books: scores between ticks without
+        feeding the per-tick averages (only on_tick advances those)."""
+        return self.preview({t.lower(): best_bid_ask_entire_depth(t) for t in SNAPSHOT_TICKERS})
+
+    def scores(self):
+        """Trade-now score per ticker for buying; selling is the negative of the
+        directional part. > 0: price likely to move against a buyer if we wait."""
+        directional = W_IMBALANCE * self.imbalance + W_DRIFT * np.tanh(self.drift_norm)
+        spread_cost = W_SPREAD * np.tanh(self.spread_ratio - 1)   # Wide spread: better to wait
+        return np.where(self.valid, directional, 0.0), np.where(self.valid, spread_cost, 0.0)
+
+    def score(self, ticker, action):
+        directional, spread_cost = self.scores()
+        i = TICKER_INDEX[ticker]
+        sign = 1 if action == 'BUY' else -1
+        return float(sign * directional[i] - spread_cost[i])
+
+    def should_wait(self, ticker, action):
+        return self.score(ticker, action) < WAIT_BELOW
+
+
+# Process-wide engine; main registers it on the TickClock
+signals = SignalEngine()
+
+
+def wait_for_signal(tickers, action, max_wait, extra_wait=None):
+    """Poll until no ticker's score says wait (and extra_wait(), if given, is
+    false) or max_wait seconds pass. Returns seconds waited."""
+    st_time = time.time()
+    with live_books():   # Every poll sees new books, not the tick's snapshot
+        while time.time() - st_time < max_wait:
+            engine = signals.peek()
+            waiting = any(engine.should_wait(t, action) for t in tickers)
+            if extra_wait is not None:
+                waiting = waiting or extra_wait()
+            if not waiting:
+                break
+            time.sleep(SIGNAL_POLL_SECONDS)
+    return time.time() - st_time
+
+
+def backtest(pattern="output/*.pkl", horizon=1):
+    """Replay recorded snapshots: does the BUY score predict the mid move
+    `horizon` snapshots later? Returns per-ticker hit rate and correlation."""
+    snaps = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            with open(path, 'rb') as f:
+                snaps.append(pickle.load(f))
+        except Exception:
+            continue
+
+    engine = SignalEngine()
+    rows, last_ts = [], None
+    for snap in snaps:
+        ts = datetime.datetime.fromisoformat(snap['timestamp']).timestamp()
+        if last_ts is not None and ts - last_ts > BURST_GAP_SECONDS:
+            rows.append(None)            # Run boundary: no look-ahead across it
+            engine = SignalEngine()
+        last_ts = ts
+        engine.update_snapshot(snap)
+        directional, spread_cost = engine.scores()
+        rows.append((directional - spread_cost, engine.last_mid.copy()))
+
+    scores, moves = [], []
+    for i, row in enumerate(rows):
+        ahead = rows[i + horizon] if i + horizon < len(rows) else None
+        if row is None or ahead is None or any(r is None for r in rows[i:i + horizon + 1]):
+            continue
+        scores.append(row[0])
+        moves.append(ahead[1] - row[1])
+    if not scores:
+        return {}
+
+    scores, moves = np.array(scores), np.array(moves)
+    out = {}
+    for ticker, i in TICKER_INDEX.items():
+        s, m = scores[:, i], moves[:, i]
+        moved = m != 0
+        hit = float((np.sign(s[moved]) == np.sign(m[moved])).mean()) if moved.any() else float('nan')
+        corr = float(np.corrcoef(s, m)[0, 1]) if s.std() > 0 and m.std() > 0 else float('nan')
+        out[ticker] = {'n': len(s), 'moves': int(moved.sum()), 'hit_rate': hit, 'corr': corr}
+    print(tabulate([[t, r['n'], r['moves'], f"{r['hit_rate']:.2f}", f"{r['corr']:.2f}"] for t, r in out.items()],
+                   headers=['ticker', 'n', 'moves', 'hit rate', 'corr']))
+    return out
@@ -0,0 +1,112 @@
+# DEPTH-AWARE TRADE SIZING
+# Prices every candidate size against the full RITC / BULL / BEAR / USD
+# depth in one vectorized pass and picks the quantity with the largest total
+# net profit after fees, FX and converter cost, within position limits.
+
+from final_utils import *
+
+SIZE_STEP = 100          # Candidate grid spacing (shares)
+MIN_TRADE_SIZE = 100
+
+
+class BookSide():
+    """Cumulative depth of one aggregated book side, for vectorized sweeps."""
+    def __init__(self, orders):
+        levels = np.array(aggregate_levels(orders), dtype=float).reshape(-1, 2)
+        self.prices = levels[:, 0]
+        self.cum_qty = np.cumsum(levels[:, 1])
+        self.cum_value = np.cumsum(levels[:, 0] * levels[:, 1])
+
+    @property
+    def depth(self):
+        return self.cum_qty[-1] if len(self.cum_qty) else 0.0
+
+    def sweep(self, qty):
+        """Total value of sweeping each quantity in `qty` (inf beyond depth)."""
+        qty = np.asarray(qty, dtype=float)
+        if not len(self.prices):
+            return np.full(qty.shape, np.inf)
+        k = np.searchsorted(self.cum_qty, qty, side='left')
+        inside = k < len(self.prices)
+        k = np.minimum(k, len(self.prices) - 1)
+        prev_qty = np.where(k > 0, self.cum_qty[k - 1], 0.0)
+        prev_value = np.where(k > 0, self.cum_value[k - 1], 0.0)
+        value = prev_value + (qty - prev_qty) * self.prices[k]
+        return np.where(inside, value, np.inf)
+
+
+def current_books():
+    """All four books keyed like a snapshot (served from it when installed)."""
+    return {t.lower(): best_bid_ask_entire_depth(t) for t in SNAPSHOT_TICKERS}
+
+
+def candidate_sizes(max_qty, step=SIZE_STEP, min_qty=MIN_TRADE_SIZE):
+    if max_qty < min_qty:
+        return np.zeros(0)
+    return np.arange(min_qty, max_qty + 1, step, dtype=float)
+
+
+def limit_mask(q, positions, ritc_per_share, bull_per_share, bear_per_share):
+    """Which candidate sizes keep gross / net inside the case limits
+    (RITC counts double, as in within_limits)."""
+    if positions is None:
+        return np.ones(q.shape, dtype=bool)
+    ritc = positions.get(RITC, 0) + ritc_per_share * q
+    bull = positions.get(BULL, 0) + bull_per_share * q
+    bear = positions.get(BEAR, 0) + bear_per_share * q
+    gross = np.abs(bull) + np.abs(bear) + 2 * np.abs(ritc)
+    net = bull + bear + 2 * ritc
+    return (gross < MAX_GROSS) & (net > MAX_SHORT_NET) & (net < MAX_LONG_NET)
+
+
+def _best(q, profit):
+    profit = np.where(np.isfinite(profit), profit, -np.inf)
+    if not len(q) or not np.isfinite(profit.max()):
+        return {'quantity': 0, 'profit': 0.0, 'profit_per_share': 0.0, 'candidates': len(q)}
+    i = int(np.argmax(profit))
+    return {'quantity': int(q[i]), 'profit': float(profit[i]),
+            'profit_per_share': float(profit[i] / q[i]), 'candidates': len(q)}
+
+
+def size_etf_arbitrage(books, direction, positions=None, max_qty=MAX_SIZE_EQUITY, step=SIZE_STEP):
+    """Best size for the ETF-vs-basket trade.
+
+    BUY_RITC: buy RITC + the USD to pay for it, sell BULL + BEAR.
+    SELL_RITC: sell RITC + the USD received, buy BULL + BEAR."""
+    ritc_bids, ritc_asks = BookSide(books['ritc']['bids']), BookSide(books['ritc']['asks'])
+    usd_bids, usd_asks = BookSide(books['usd']['bids']), BookSide(books['usd']['asks'])
+    bull_bids, bull_asks = BookSide(books['bull']['bids']), BookSide(books['bull']['asks'])
+    bear_bids, bear_asks = BookSide(books['bear']['bids']), BookSide(books['bear']['asks'])
+
+    q = candidate_sizes(max_qty, step)
+    fees = 3 * FEE_MKT * q
+    if direction == 'BUY_RITC':
+        ritc_usd = ritc_asks.sweep(q)
+        profit = bull_bids.sweep(q) + bear_bids.sweep(q) - usd_asks.sweep(ritc_usd) - fees
+        mask = limit_mask(q, positions, 1, -1, -1)
+    else:
+        ritc_usd = ritc_bids.sweep(q)
+        profit = usd_bids.sweep(ritc_usd) - bull_asks.sweep(q) - bear_asks.sweep(q) - fees
+        mask = limit_mask(q, positions, -1, 1, 1)
+    return _best(q[mask], profit[mask])
+
+
+def size_conversion_arbitrage(books, direction, positions=None, max_qty=CONVERTER_BATCH, step=SIZE_STEP):
+    """Best size for converter arbitrage, net of conversion_cost().
+
+    CREATE: buy BULL + BEAR, convert to RITC, sell RITC and the USD.
+    REDEEM: buy USD + RITC, convert to BULL + BEAR, sell them."""
+    ritc_bids, ritc_asks = BookSide(books['ritc']['bids']), BookSide(books['ritc']['asks'])
+    usd_bids, usd_asks = BookSide(books['usd']['bids']), BookSide(books['usd']['asks'])
+    bull_bids, bull_asks = BookSide(books['bull']['bids']), BookSide(books['bull']['asks'])
+    bear_bids, bear_asks = BookSide(books['bear']['bids']), BookSide(books['bear']['asks'])
+
+    q = candidate_sizes(max_qty, step)
+    costs = 3 * FEE_MKT * q + conversion_cost(q)
+    if direction == 'CREATE':
+        profit = usd_bids.sweep(ritc_bids.sweep(q)) - bull_asks.sweep(q) - bear_asks.sweep(q) - costs
+        mask = limit_mask(q, positions, 0, 1, 1)     # Peak exposure: stocks held before conversion
+    else:
+        profit = bull_bids.sweep(q) + bear_bids.sweep(q) - usd_asks.sweep(ritc_asks.sweep(q)) - costs
+        mask = limit_mask(q, positions, 1, 0, 0)     # Peak exposure: RITC held before conversion
+    return _best(q[mask], profit[mask])
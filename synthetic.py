@@ -0,0 +1,268 @@
+# SYNTHETIC MARKET AND TENDER GENERATOR
+# Seeded snapshots in the output/*.pkl layout for load and stress testing.
+# - BULL / BEAR / USD follow correlated log random walks.
+# - RITC is quoted around NAV = (BULL + BEAR) / USD plus a mean-reverting
+#   mispricing with occasional jumps.
+# - Books are persistent per-order queues: flow fills the touch in
+#   (tick, order_id) order, orders cancel and new ones join, so order ids,
+#   quantity_filled and implied flow behave like the recordings.
+# - Tenders arrive at random with recorded-like sizes and a 6-tick expiry.
+# Modes scale tender rates and book depth beyond anything seen live. Feeds
+# rit_sim (make_feed sources 'generated', 'heavy_tenders', 'thin_book',
+# 'stress') at any SIM_TICK_SECONDS; write_session() dumps pickles that
+# replay.py and backtest_tenders.py read like a recording.
+
+import math
+from final_utils import *
+
+SYN_SEED = 7
+SYN_START = "2025-01-01T00:00:00"   # Timestamp of tick 1; ticks are SYN_TICK_SECONDS apart
+SYN_TICK_SECONDS = 1.0
+SYN_TICKS_PER_PERIOD = 300
+SYN_OUTPUT_DIR = "output/synthetic"
+
+SYN_DEFAULTS = {
+    'start': {BULL: 10.0, BEAR: 15.5, USD: 1.0},
+    'vol': {BULL: 0.0015, BEAR: 0.0015, USD: 0.0002},   # Log-return std per tick
+    'corr': ((1.0, -0.4, 0.1),                            # BULL, BEAR, USD
+             (-0.4, 1.0, 0.1),
+             (0.1, 0.1, 1.0)),
+    'mispricing_std': 0.10,       # Stationary std of RITC - NAV (USD)
+    'mispricing_half_life': 20,   # Ticks
+    'jump_prob': 0.02,            # Per tick chance of a mispricing jump
+    'jump_std': 0.15,
+    'orders_per_side': 20,        # Resting orders kept per side (recorded books show 20)
+    'order_qty': 9700,            # Median order size
+    'order_qty_sigma': 0.12,      # Lognormal spread of order sizes
+    'level_gap': 2.0,             # Mean ticks between consecutive queued orders
+    'half_spread': 1.5,           # Mean ticks from NAV-implied mid to the fair touch
+    'cancel_rate': 0.03,          # Per order per tick
+    'flow_qty': 4000,             # Mean aggressive volume per side per tick
+    'tender_rate': 1 / 30,        # Tender arrivals per tick
+    'tender_sizes': (50000, 100000),   # Uniform, in 1000s (recorded: 72000-97000)
+    'tender_expiry': 6,           # Ticks (as recorded)
+    'tender_edge': 0.06,          # Mean USD the tender price sits beyond the touch
+    'tender_edge_std': 0.08,
+    'auction_fraction': 0.0,      # Share of tenders that are auctions, not fixed bids
+    'max_tenders': 4,
+}
+MODES = {   # Overrides of SYN_DEFAULTS per mode
+    'generated': {},
+    'heavy_tenders': {'tender_rate': 0.5, 'tender_expiry': 6, 'auction_fraction': 0.2},
+    'thin_book': {'orders_per_side': 5, 'order_qty': 2000, 'level_gap': 4.0, 'flow_qty': 3000},
+    'stress': {'tender_rate': 0.5, 'auction_fraction': 0.2, 'orders_per_side': 5, 'order_qty': 2000,
+               'level_gap': 4.0, 'vol': {BULL: 0.004, BEAR: 0.004, USD: 0.0005}, 'jump_prob': 0.1},
+}
+PRICE_STEPS = {BULL: 0.01, BEAR: 0.01, RITC: 0.01, USD: 0.0001}
+USD_ORDER_QTY = 2147480000.0   # The recorded USD book: one huge order a side
+
+
+class SyntheticMarket():
+    """Iterator of synthetic snapshots; the same seed and mode give the same
+    sequence of books, tenders and timestamps."""
+    def __init__(self, seed=SYN_SEED, mode='generated', start=SYN_START, tick_seconds=SYN_TICK_SECONDS,
+                 ticks_per_period=SYN_TICKS_PER_PERIOD, **overrides):
+        if mode not in MODES:
+            raise ValueError(f"Unknown synthetic mode: {mode}")
+        self.cfg = dict(SYN_DEFAULTS, **MODES[mode], **overrides)
+        self.mode = mode
+        self.rng = np.random.default_rng(seed)
+        self.start = datetime.datetime.fromisoformat(start).timestamp()
+        self.tick_seconds = tick_seconds
+        self.ticks_per_period = ticks_per_period
+        self.chol = np.linalg.cholesky(np.array(self.cfg['corr']))
+        self.vol = np.array([self.cfg['vol'][t] for t in (BULL, BEAR, USD)])
+        self.log_px = np.log([self.cfg['start'][t] for t in (BULL, BEAR, USD)])
+        self.mispricing = 0.0
+        self.period, self.tick, self.n = 1, 0, 0
+        self.books = {t: {'bids': [], 'asks': []} for t in (BULL, BEAR, RITC)}
+        self.tenders = []
+        self.next_order_id = 1
+        self.next_tender_id = 1000
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.step()
+
+    # ---- prices ----
+    def mids(self):
+        bull, bear, usd = np.exp(self.log_px)
+        nav = (bull + bear) / usd
+        return {BULL: bull, BEAR: bear, USD: usd, RITC: nav + self.mispricing}
+
+    def _move(self):
+        self.log_px += self.vol * (self.chol @ self.rng.standard_normal(3))
+        hl = self.cfg['mispricing_half_life']
+        phi = 0.5 ** (1 / hl)
+        noise = self.cfg['mispricing_std'] * math.sqrt(1 - phi * phi)
+        self.mispricing = phi * self.mispricing + noise * self.rng.standard_normal()
+        if self.rng.random() < self.cfg['jump_prob']:
+            self.mispricing += self.cfg['jump_std'] * self.rng.standard_normal()
+
+    # ---- books ----
+    def _order(self, ticker, action, price, qty):
+        order = {'order_id': self.next_order_id, 'period': self.period, 'tick': self.tick, 'trader_id': 'ANON',
+                 'ticker': ticker, 'quantity': qty, 'price': price, 'type': 'LIMIT', 'action': action,
+                 'quantity_filled': 0.0, 'vwap': None, 'status': 'OPEN'}
+        self.next_order_id += 1
+        return order
+
+    def _qty(self):
+        q = self.cfg['order_qty'] * math.exp(self.cfg['order_qty_sigma'] * self.rng.standard_normal())
+        return float(max(100, int(round(q, -2))))
+
+    def _hit(self, orders, qty, fill_price_ok):
+        """Aggressive `qty` against resting `orders` (best first, FIFO within
+        a price) while fill_price_ok(price); returns the volume traded."""
+        traded = 0.0
+        for o in orders:
+            if qty <= 0 or not fill_price_ok(o['price']):
+                break
+            take = min(qty, o['quantity'] - o['quantity_filled'])
+            o['quantity_filled'] += take
+            o['vwap'] = o['price']
+            if o['quantity_filled'] >= o['quantity']:
+                o['status'] = 'TRANSACTED'
+            qty -= take
+            traded += take
+        return traded
+
+    def _update_book(self, ticker, mid):
+        step = PRICE_STEPS[ticker]
+        cfg = self.cfg
+        book = self.books[ticker]
+        half = max(1, int(round(self.rng.exponential(cfg['half_spread']))))
+        fair_bid = (math.floor(mid / step) - half + 1) * step
+        fair_ask = (math.ceil(mid / step) + half - 1) * step
+        for side in ('bids', 'asks'):
+            book[side] = [o for o in book[side] if o['status'] == 'OPEN']
+        # Stale quotes through the new fair touch are picked off, then
+        # random flow hits the touch on each side
+        flow = {
+            'SELL': self._hit(book['bids'], float('inf'), lambda p: p > fair_bid + 1e-9),
+            'BUY': self._hit(book['asks'], float('inf'), lambda p: p < fair_ask - 1e-9),
+        }
+        flow['SELL'] += self._hit(book['bids'], int(self.rng.exponential(cfg['flow_qty'])), lambda p: True)
+        flow['BUY'] += self._hit(book['asks'], int(self.rng.exponential(cfg['flow_qty'])), lambda p: True)
+        for side, anchor, sign, action in (('bids', fair_bid, -1, 'BUY'), ('asks', fair_ask, 1, 'SELL')):
+            orders = [o for o in book[side] if o['status'] == 'OPEN'
+                      and self.rng.random() >= cfg['cancel_rate']]
+            # Refill behind the fair touch: half the new orders join near it,
+            # the rest spread over about orders_per_side * level_gap ticks
+            depth = cfg['orders_per_side'] * cfg['level_gap'] / 2
+            while len(orders) < cfg['orders_per_side']:
+                scale = depth if self.rng.random() < 0.5 else cfg['level_gap'] / 2
+                price = round(anchor + sign * int(self.rng.exponential(scale)) * step, 4)
+                if price > 0:
+                    orders.append(self._order(ticker, action, price, self._qty()))
+            orders.sort(key=lambda o: (-o['price'] if side == 'bids' else o['price'], o['tick'], o['order_id']))
+            book[side] = orders
+        return flow
+
+    def _usd_book(self, mid):
+        step = PRICE_STEPS[USD]
+        bid = round((math.floor(mid / step) - 1) * step, 4)
+        return {'bids': [self._order(USD, 'BUY', bid, USD_ORDER_QTY)],
+                'asks': [self._order(USD, 'SELL', round(bid + 2 * step, 4), USD_ORDER_QTY)]}
+
+    # ---- tenders ----
+    def _update_tenders(self, books):
+        cfg = self.cfg
+        self.tenders = [t for t in self.tenders if t['expires'] > self.tick]
+        for _ in range(self.rng.poisson(cfg['tender_rate'])):
+            if len(self.tenders) >= cfg['max_tenders']:
+                break
+            action = 'BUY' if self.rng.random() < 0.5 else 'SELL'
+            edge = cfg['tender_edge'] + cfg['tender_edge_std'] * self.rng.standard_normal()
+            ritc = books[RITC]
+            # Institution sells to us below the bid / buys from us above the ask
+            touch = ritc['bids'][0]['price'] if action == 'BUY' else ritc['asks'][0]['price']
+            price = round(touch - edge if action == 'BUY' else touch + edge, 2)
+            lo, hi = cfg['tender_sizes']
+            self.tenders.append({
+                'tender_id': self.next_tender_id, 'period': self.period, 'tick': self.tick,
+                'expires': self.tick + cfg['tender_expiry'], 'caption': f"Synthetic {self.mode} tender",
+                'ticker': RITC, 'quantity': float(self.rng.integers(lo // 1000, hi // 1000 + 1) * 1000),
+                'action': action, 'is_fixed_bid': bool(self.rng.random() >= cfg['auction_fraction']),
+                'price': price})
+            self.next_tender_id += 1
+
+    # ---- snapshots ----
+    def step(self):
+        """Advance one tick and return its snapshot."""
+        self.tick += 1
+        if self.tick > self.ticks_per_period:   # New period: RIT starts from empty books
+            self.period, self.tick = self.period + 1, 1
+            self.books = {t: {'bids': [], 'asks': []} for t in self.books}
+            self.tenders = []
+        self._move()
+        mids = self.mids()
+        flow = {t: self._update_book(t, mids[t]) for t in (BULL, BEAR, RITC)}
+        flow[USD] = {'BUY': 0.0, 'SELL': 0.0}
+        books = {t: {side: [dict(o) for o in self.books[t][side]] for side in ('bids', 'asks')}
+                 for t in (BULL, BEAR, RITC)}
+        books[USD] = self._usd_book(mids[USD])
+        self._update_tenders(books)
+        ts = self.start + self.n * self.tick_seconds
+        self.n += 1
+        snap = {t.lower(): books[t] for t in SNAPSHOT_TICKERS}
+        snap.update({'timestamp': datetime.datetime.fromtimestamp(ts).isoformat(), 'flow': flow,
+                     'tenders': [dict(t) for t in self.tenders],
+                     'tender': dict(self.tenders[0]) if self.tenders else {}})
+        return snap
+
+    def snapshots(self, ticks):
+        return [self.step() for _ in range(ticks)]
+
+
+def synthetic_market(seed=SYN_SEED, mode='generated', ticks=None, **overrides):
+    """`ticks` snapshots (forever if None) of a SyntheticMarket."""
+    market = SyntheticMarket(seed, mode, **overrides)
+    n = 0
+    while ticks is None or n < ticks:
+        yield market.step()
+        n += 1
+
+
+def write_session(directory=SYN_OUTPUT_DIR, ticks=600, seed=SYN_SEED, mode='generated', **overrides):
+    """Pickle `ticks` snapshots as market_data_<timestamp>.pkl files, the
+    recorded layout, so replay / backtests can use '<directory>/*.pkl'."""
+    os.makedirs(directory, exist_ok=True)
+    for snap in synthetic_market(seed, mode, ticks, **overrides):
+        stamp = snap['timestamp'].replace(':', '-')
+        with open(os.path.join(directory, f"market_data_{stamp}.pkl"), 'wb') as f:
+            pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return os.path.join(directory, "*.pkl")
+
+
+def describe(snaps):
+    """Summary statistics of generated snapshots next to the recorded ones'."""
+    mis, spread, depth, sizes = [], [], [], []
+    tenders = {}
+    for snap in snaps:
+        bull, bear, usd, ritc = snap['bull'], snap['bear'], snap['usd'], snap['ritc']
+        if not (bull['bids'] and bear['bids'] and ritc['bids'] and ritc['asks']):
+            continue
+        nav = (bull['bids'][0]['price'] + bear['bids'][0]['price']) / usd['asks'][0]['price']
+        mis.append(ritc['bids'][0]['price'] - nav)
+        spread.append(ritc['asks'][0]['price'] - ritc['bids'][0]['price'])
+        depth.append(sum(o['quantity'] - o['quantity_filled'] for o in ritc['bids']))
+        sizes.extend(o['quantity'] for o in ritc['bids'])
+        for t in snap.get('tenders', []):
+            tenders[t['tender_id']] = t
+    return {'snapshots': len(snaps), 'mispricing_std': float(np.std(mis)) if mis else 0.0,
+            'ritc_spread': float(np.mean(spread)) if spread else 0.0,
+            'ritc_bid_depth': float(np.mean(depth)) if depth else 0.0,
+            'order_qty_median': float(np.median(sizes)) if sizes else 0.0,
+            'tenders': len(tenders),
+            'tender_qty_mean': float(np.mean([t['quantity'] for t in tenders.values()])) if tenders else 0.0}
+
+
+if __name__ == "__main__":
+    for mode in MODES:
+        t0 = time.perf_counter()
+        snaps = list(synthetic_market(mode=mode, ticks=600))
+        rate = len(snaps) / (time.perf_counter() - t0)
+        print(f"Synthetic {mode}: {rate:.0f} ticks/s, {describe(snaps)}")
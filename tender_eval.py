@@ -3,8 +3,21 @@ from final_utils import *
 import time
 from rich import print
 import numpy as np
-
-MIN_CHUNK = 5000
+from concurrent.futures import ThreadPoolExecutor
+from passive_exec import PassiveExecutor, ChildOrder
+from exec_algos import make_algo
+from replenishment import replenishment
+from signals import wait_for_signal
+
+MIN_CHUNK = 5000            # Fallback chunk until the replenishment model has data
+SIGNAL_MAX_WAIT = 5         # Seconds a slice may be held back by the book signals
+TENDER_EXEC_ALGO = 'TWAP'   # TWAP / POV / IS for large tenders; None = slice loop only
+ALGO_MIN_QTY = 20000        # Tenders at least this large are scheduled by the algo
+
+# Accepted tenders unwind here, one at a time, so the clock thread keeps
+# dispatching risk / recorder / signal callbacks while a schedule runs
+_unwind_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tender-unwind")
+_unwind = None
 
 class EvaluateTendersNew():
     def __init__(self, tender, converter):
@@ -21,8 +34,12 @@ class EvaluateTendersNew():
         self.MAX_DELAY_SECONDS = 8.0       # Delay when market is unfavorable
 
 
+        self.RISK_BUDGET_CAD = 500         # Adverse touch move (CAD) before a slice escalates
+
+
         self.total_orders = 0 
         self.num_limit_order = 0
+        self.passive = PassiveExecutor("TenderUnwind")
 
    
 
@@ -137,10 +154,12 @@ class EvaluateTendersNew():
             # return (conversion_fee_cad - stock_revenue_cad)/qty# Net cost
 
 
-    def unwind_tender(self):
+    def unwind_tender(self, algo=None):
         """
         Main controller for unwinding the tender position using an adaptive,
         passive-aggressive limit order strategy with correct cost analysis and hedging.
+        With algo ('TWAP' / 'POV' / 'IS') the RITC unwind follows that schedule
+        first and the slice loop only mops up what it left.
         """
         print(f"\n*********************** [STARTING ADAPTIVE UNWIND] ***********************")
         
@@ -148,6 +167,12 @@ class EvaluateTendersNew():
     
         side = "BUY" if self.action == 'SELL' else "SELL"
         
+        if algo is not None:
+            scheduled = make_algo(algo, RITC, side, remaining_qty, limit_price=self.price, executor=self.passive)
+            filled_qty, vwap = scheduled.run()
+            remaining_qty -= filled_qty
+            self.algo_report = scheduled.adherence()
+
 
         while remaining_qty > 0:
             
@@ -166,111 +191,57 @@ class EvaluateTendersNew():
         self.cleanup_fx_exposure()
 
         print(f"Perc of limit orders {self.num_limit_order} / {self.total_orders}")
+        print(f"Passive fill ratio {self.passive.passive_fill_ratio():.1%}, "
+              f"fees saved {self.passive.fee_savings():.2f} CAD")
         print(f"*********************** [UNWIND COMPLETE] ***********************")
         return True
 
 
     def _execute_direct(self, side, remaining_qty):
         """
-        Executes a single slice using the Patient Aggressor strategy.
-        MODIFIED: Now returns (quantity_filled, vwap) for hedging purposes.
+        Executes a single slice passively: rests at or inside the RITC touch
+        (never at a loss vs the tender price), repricing as the book moves,
+        and crosses only what is left once the patience window or risk budget
+        is used up. Returns (quantity_filled, vwap) for hedging purposes.
         """
         
         self.total_orders += 1
-        # Initial state
-        total_filled_qty = 0
-        total_filled_value = 0
-
-        # size of the top chunk.
-        usd_bid, usd_ask, _, _ = best_bid_ask(USD)
-        book, qty = get_top_level_price_and_qty(RITC, side)
-
-        # 1. Passive Attempt
-        _d = 0.1  # Amount to adjust price by (tune as needed)
-
-        DELTA = _d if side == 'SELL' else -_d
-        def check_loss(cost, buffer = 0):
-            if self.action == "SELL":
-                if cost >  self.price - buffer : # buying at loss
-                    return 1
-            else:
-                if abs(cost) < self.price + buffer:  # selling at loss.
-                    return 1 
-            return 0 
-        
-        st_time = time.time()
-        
-        buffer = 0
-        output = check_loss(book, buffer = buffer)
-        while output and time.time() - st_time < 5:
-            book, qty = get_top_level_price_and_qty(RITC, side)
-            output = check_loss(book, buffer = buffer)
-        
-        print('delayed for', time.time() - st_time)  
-
-        qty = max(qty, MIN_CHUNK)
-        qty = min(qty, remaining_qty, MAX_SIZE_EQUITY)
-
-        
-        target_price = book + DELTA
-        print(f"[LMT] @ {target_price:.2f}...", end = ' ')
-
-        limit_order = place_limit(RITC, side, qty, target_price)
-
-        if limit_order:
-            time.sleep(self.PATIENCE_WINDOW_SECONDS)
-            status = get_order_status(limit_order['order_id']).json()
-            
-            if status and status.get('quantity_filled', 0) > 0:
-                filled = status['quantity_filled']
-                vwap = status['vwap']
-                total_filled_qty += filled
-                total_filled_value += filled * vwap
-                qty -= filled
-                print(f"FILL: {filled} shares.")
-            
-            # Clean up the outstanding passive order regardless of fill
-            cancel_order(limit_order['order_id'])
 
+        # Hold off while imbalance / drift / spread say the price is coming to us
+        print('delayed for', wait_for_signal([RITC], side, SIGNAL_MAX_WAIT))
 
-        # 2. Aggressive Completion
-        self.num_limit_order += 1 
-        if qty > 0:
-            self.num_limit_order -= 1 
+        # Chunk = near-touch depth we can take without impact; rest for as
+        # long as the replenishment model says that depth takes to come back
+        book = best_bid_ask_entire_depth(RITC)
+        replenishment.observe(RITC, book, current_tick())
+        qty, wait = replenishment.chunk_and_wait(RITC, side, remaining_qty, book,
+                                                 fallback=(MIN_CHUNK, self.PATIENCE_WINDOW_SECONDS))
 
-            market_order = place_mkt(RITC, side, qty)
-            if market_order and market_order.get('quantity_filled', 0) > 0:
-                filled = market_order['quantity_filled']
-                vwap = market_order['vwap']
-                total_filled_qty += filled
-                total_filled_value += filled * vwap
+        # Resting price is capped at the tender price, so the passive order
+        # waits at breakeven instead of polling for a non-losing touch
+        child = self.passive.work_one(RITC, side, qty, wait,
+                                      limit_price=self.price, risk_budget=self.RISK_BUDGET_CAD)
 
-                print(f"[MKR] FILL: {filled} shares @ {vwap}")
-        
-        final_vwap = total_filled_value / total_filled_qty if total_filled_qty > 0 else 0
+        if child.aggressive_qty == 0:
+            self.num_limit_order += 1
+        if child.aggressive_qty > 0:
+            print(f"[MKR] FILL: {child.aggressive_qty} shares")
 
-        print(f"[FINAL] {total_filled_qty} @ price {final_vwap:.4f}")
+        print(f"[FINAL] {child.filled} @ price {child.vwap:.4f}")
 
-        return total_filled_qty, final_vwap
+        return child.filled, child.vwap
     
 
     
     def _execute_converted(self, side, remaining_qty):
         """
-        
+        Unwinds a slice through the converter: works BULL and BEAR passively
+        at once, hedges the USD and converts the filled quantity.
         """
         
         self.total_orders += 1
 
-        # size of the top chunk.
         usd_bid, usd_ask, _, _ = best_bid_ask(USD)
-        book_bull, qty_bl = get_top_level_price_and_qty(BULL, side)
-        book_bear, qty_br = get_top_level_price_and_qty(BEAR, side)
-
-        # 1. Passive Attempt
-        _d = 0.1  # Amount to adjust price by (tune as needed)
-        DELTA = _d if side == 'SELL' else -_d
-
 
         def check_loss(book_bull, book_bear, buffer = 0):
 
@@ -284,72 +255,37 @@ class EvaluateTendersNew():
             return 0 
         
         
-        st_time = time.time()
-
         buffer = 0
-        
-        output = check_loss(book_bull, book_bear, buffer=buffer)
-        while output and time.time() - st_time < 5:
-            book_bull, qty_bl = get_top_level_price_and_qty(BULL, side)
-            book_bear, qty_br = get_top_level_price_and_qty(BEAR, side)
-            output = check_loss(book_bull, book_bear, buffer = buffer)
-
-        print('delayed for', time.time() - st_time)     
-
-        qty = max(min(qty_bl, qty_br), MIN_CHUNK)
-        order_qty = min(qty, remaining_qty, MAX_SIZE_EQUITY)   
-
-
-        bull_target = book_bull + DELTA        
-        limit_order_bull = place_limit(BULL, side, order_qty,  bull_target)
-        print(f"[LMT] @ {bull_target:.2f}...", end = ' ')
-
-        bear_target = book_bear + DELTA        
-        limit_order_bear = place_limit(BEAR, side, order_qty, bear_target)
-        print(f"[LMT] @ {bear_target:.2f}...", end = ' ')
 
-
-        time.sleep(self.PATIENCE_WINDOW_SECONDS)
-
-        def sq_limit_order(ticker, limit_order, _qty):
-            total_filled_value, total_filled_qty = 0, 0
-
-            if limit_order and "order_id" in limit_order:
-                status = get_order_status(limit_order['order_id']).json()
-                
-                if status and status.get('quantity_filled', 0) > 0:
-                    filled = status['quantity_filled']
-                    vwap = status['vwap']
-                    total_filled_value += filled * vwap
-                    total_filled_qty += filled
-
-                    _qty -= filled
-                    print(f"FILL: {filled} shares.")
-                
-                # Clean up the outstanding passive order regardless of fill
-                cancel_order(limit_order['order_id'])
-
-            # 2. Aggressive Completion
-            self.num_limit_order += 1 
-            if _qty > 0:
-                self.num_limit_order -= 1 
-
-                market_order = place_mkt(ticker, side, _qty)
-                if market_order and market_order.get('quantity_filled', 0) > 0:
-                    filled = market_order['quantity_filled']
-                    vwap = market_order['vwap']
-                    total_filled_qty += filled
-                    total_filled_value += filled * vwap
-                    print(f"[MKR] FILL: {filled} shares @ {vwap}")
-        
-            final_vwap = total_filled_value / total_filled_qty if total_filled_qty > 0 else 0
-            print(f"[FINAL] {total_filled_qty} @ price {final_vwap:.4f}")
-            return total_filled_qty, final_vwap
-
-        bear_qty, _ = sq_limit_order(BEAR, limit_order_bear, order_qty)
-        bull_qty, _ = sq_limit_order(BULL, limit_order_bull, order_qty)
-
-        if bear_qty != bull_qty: 
+        def at_loss():
+            book_bull, _ = get_top_level_price_and_qty(BULL, side)
+            book_bear, _ = get_top_level_price_and_qty(BEAR, side)
+            return check_loss(book_bull, book_bear, buffer=buffer)
+
+        # Hold off while at a loss or while imbalance / drift / spread favour waiting
+        print('delayed for', wait_for_signal([BULL, BEAR], side, SIGNAL_MAX_WAIT, extra_wait=at_loss))
+
+        # Both legs sized / timed by the thinner, slower-refilling book
+        fallback = (MIN_CHUNK, self.PATIENCE_WINDOW_SECONDS)
+        sizes = []
+        tick = current_tick()
+        for ticker in (BULL, BEAR):
+            book = best_bid_ask_entire_depth(ticker)
+            replenishment.observe(ticker, book, tick)
+            sizes.append(replenishment.chunk_and_wait(ticker, side, remaining_qty, book, fallback))
+        order_qty = min(q for q, _ in sizes)
+        wait = max(w for _, w in sizes)
+
+
+        # Work both legs passively together; each rests at or inside its touch
+        # and only the remainder crosses when the patience window runs out
+        bull, bear = self.passive.work([ChildOrder(BULL, side, order_qty), ChildOrder(BEAR, side, order_qty)],
+                                       wait, risk_budget=self.RISK_BUDGET_CAD)
+        if bull.aggressive_qty == 0 and bear.aggressive_qty == 0:
+            self.num_limit_order += 1
+        print(f"[FINAL] BULL {bull.filled} @ {bull.vwap:.4f}, BEAR {bear.filled} @ {bear.vwap:.4f}")
+
+        if bear.filled != bull.filled: 
             print("[red] [WARNING] different bull / bear filled qty!")
         
         hedge_action = "BUY" if side == "SELL" else "SELL" # If we bought RITC (USD), we must buy USD to pay
@@ -364,7 +300,7 @@ class EvaluateTendersNew():
 
             fx_hedge("BUY", conversion_cost(order_qty))
                     
-        return order_qty, _
+        return order_qty, bull.vwap + bear.vwap
     
     def cleanup_fx_exposure(self):
         """Flattens the final USD position, effectively repatriating PnL."""
@@ -378,8 +314,23 @@ class EvaluateTendersNew():
             print(f"✓ Final FX Cleanup: {action} {abs(usd_position):.2f} USD.")
 
 
+def unwind_in_progress():
+    return _unwind is not None and not _unwind.done()
+
+
+def _run_unwind(T, algo):
+    try:
+        T.unwind_tender(algo)
+        print(f"[green] DONE")
+    except Exception as e:
+        print(f"[ERROR] Unwind of tender {T.tender['tender_id']} failed: {e}")
+
+
 def check_tender(converter):
     """Fixed tender checking with correct converter cost logic"""
+    global _unwind
+    if unwind_in_progress():
+        return   # One tender position at a time; new ones wait for the unwind
     tenders = get_tenders()
     if not tenders:
         return
@@ -395,6 +346,9 @@ def check_tender(converter):
         
         T = EvaluateTendersNew(tender, converter)
         eval_result = T.evaluate_tender_profit()
+        record_event('decision', {'strategy': 'tender', 'tender_id': tender['tender_id'], 'action': tender['action'],
+                                  'quantity': tender['quantity'], 'price': tender['price'],
+                                  'predicted': eval_result, 'accept': eval_result > 0})
 
         # print('estimated profit:', eval_result)
         
@@ -402,11 +356,12 @@ def check_tender(converter):
             print(f"[green] tender {tender['tender_id']}: profit {eval_result} CAD")
             success = accept_tender(tender)
             if success:
-                T.unwind_tender()
+                algo = TENDER_EXEC_ALGO if tender['quantity'] >= ALGO_MIN_QTY else None
+                _unwind = _unwind_pool.submit(_run_unwind, T, algo)
                 # ritc_depth = best_bid_ask_entire_depth(RITC)
                 # bull_depth = best_bid_ask_entire_depth(BULL)
                 # bear_depth = best_bid_ask_entire_depth(BEAR)
-                print(f"[green] DONE")
+                break   # Later tenders are evaluated once this one is unwound
 
             else:
                 print(f"⚠ Partially processed tender {tender['tender_id']}")
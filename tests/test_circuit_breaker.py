@@ -0,0 +1,87 @@
+import time
+import pytest
+import circuit_breaker as cb
+from circuit_breaker import CircuitBreaker, RetryBudget, CLOSED, OPEN, HALF_OPEN
+
+COOL_OFF = 0.05
+
+
+def tripped(threshold=3):
+    b = CircuitBreaker('GET /test', failure_threshold=threshold, reset_timeout=COOL_OFF)
+    for _ in range(threshold):
+        assert b.allow()
+        b.record_failure("HTTP 503")
+    return b
+
+
+def test_opens_after_consecutive_failures():
+    b = tripped()
+    assert b.state == OPEN and b.is_open()
+    assert not b.allow()
+    assert b.metrics()['short_circuited'] == 1
+
+
+def test_half_open_probe_closes_on_success():
+    b = tripped()
+    time.sleep(COOL_OFF * 1.5)
+    assert not b.is_open()            # Due a probe: no longer counts as open
+    assert b.allow()                  # The probe
+    assert b.state == HALF_OPEN
+    assert not b.allow()              # One probe at a time
+    b.record_success(0.01)
+    assert b.state == CLOSED and b.allow()
+
+
+def test_failed_probe_reopens():
+    b = tripped()
+    time.sleep(COOL_OFF * 1.5)
+    assert b.allow()
+    b.record_failure("HTTP 503")
+    assert b.state == OPEN and b.is_open()
+    assert b.times_opened == 2
+
+
+def test_open_breakers_lists_only_cooling_off(monkeypatch):
+    monkeypatch.setattr(cb, 'breakers', {})
+    b = cb.breaker_for('GET /securities')
+    b.reset_timeout = COOL_OFF
+    for _ in range(b.failure_threshold):
+        b.record_failure("timeout")
+    assert cb.open_breakers() == ['GET /securities']
+    time.sleep(COOL_OFF * 1.5)
+    assert cb.open_breakers() == []   # Degraded mode must not outlive the cool-off
+
+
+def test_retry_budget_refills_per_request():
+    budget = RetryBudget(ratio=0.5, burst=1)
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    budget.on_request()
+    budget.on_request()
+    assert budget.try_acquire()
+    assert (budget.granted, budget.denied) == (2, 1)
+
+
+def test_nested_deadlines_keep_the_earliest():
+    assert cb.time_remaining() is None
+    with cb.deadline(0.5):
+        with cb.deadline(10):
+            assert cb.time_remaining() <= 0.5
+            with cb.no_deadline():
+                assert cb.time_remaining() is None
+        assert cb.time_remaining() <= 0.5
+        assert not cb.retry_allowed(backoff=1.0)
+    assert cb.time_remaining() is None
+
+
+def test_guarded_session_short_circuits(monkeypatch):
+    monkeypatch.setattr(cb, 'breakers', {})
+    key = cb.endpoint_key('post', 'http://localhost:9999/v1/orders/123')
+    assert key == 'POST /orders/{id}'
+    b = cb.breaker_for(key)
+    for _ in range(b.failure_threshold):
+        b.record_failure("HTTP 500")
+    with pytest.raises(cb.CircuitOpenError):
+        cb.GuardedSession().post('http://localhost:9999/v1/orders/123')
+    with cb.deadline(-1), pytest.raises(cb.DeadlineExceeded):
+        cb.GuardedSession().get('http://localhost:9999/v1/case')
@@ -0,0 +1,54 @@
+import copy
+import pytest
+from delta_store import DeltaEncoder, DeltaDecoder, DeltaWriter, DeltaReader, KEY, DELTA
+from rit_sim import snapshot_tick
+from synthetic import synthetic_market
+
+
+@pytest.fixture(scope='module')
+def snaps():
+    """Synthetic snapshots in the recorded .pkl layout (no 'tick' field)."""
+    return [copy.deepcopy(s) for s in synthetic_market(3, 'generated', 60)]
+
+
+def test_encode_decode_round_trip(snaps):
+    enc, dec = DeltaEncoder(keyframe_every=25), DeltaDecoder()
+    kinds = []
+    for snap in snaps:
+        kind, payload = enc.encode(snap)
+        kinds.append(kind)
+        assert dec.decode(kind, payload) == snap
+    assert [i for i, k in enumerate(kinds) if k == KEY] == [0, 25, 50]
+
+
+def test_reset_forces_keyframe(snaps):
+    enc = DeltaEncoder()
+    enc.encode(snaps[0])
+    assert enc.encode(snaps[1])[0] == DELTA
+    enc.reset()
+    assert enc.encode(snaps[2])[0] == KEY
+
+
+def test_delta_before_keyframe_is_rejected(snaps):
+    enc = DeltaEncoder()
+    enc.encode(snaps[0])
+    kind, payload = enc.encode(snaps[1])
+    with pytest.raises(ValueError):
+        DeltaDecoder().decode(kind, payload)
+
+
+def test_file_random_access(snaps, tmp_path):
+    path = str(tmp_path / "session.delta")
+    writer = DeltaWriter(path, keyframe_every=10)
+    for snap in snaps:
+        writer.append(snap)
+    writer.close()
+    reader = DeltaReader(path)
+    assert len(reader) == len(snaps)
+    # Recorded snapshots are indexed at their case tick, not 0
+    assert list(reader.index['tick']) == [snapshot_tick(s) for s in snaps]
+    assert reader.index['tick'].max() > 0
+    for n in (37, 38, 5, 59, 0):   # Forward from the current position, then back via a keyframe
+        assert reader.snapshot(n) == snaps[n]
+    assert list(reader) == snaps
+    reader.close()
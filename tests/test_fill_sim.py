@@ -0,0 +1,57 @@
+from fill_sim import FillSimulator
+
+T = 'RITC'
+
+
+def o(order_id, price, qty, filled=0, tick=1):
+    return {'order_id': order_id, 'price': price, 'quantity': qty, 'quantity_filled': filled, 'tick': tick}
+
+
+def snap(tick, bids, asks):
+    return {'tick': tick, 'ritc': {'bids': bids, 'asks': asks}}
+
+
+ASKS = [o(20, 10.05, 300), o(21, 10.10, 1000)]
+
+
+def test_crossing_limit_takes_the_far_side_first():
+    sim = FillSimulator([snap(1, [o(1, 10.00, 500)], ASKS)])
+    order = sim.place(0, T, 'BUY', 500, 10.10)
+    assert order.aggressive_qty == 500 and order.passive_qty == 0
+    assert order.status()['vwap'] == (300 * 10.05 + 200 * 10.10) / 500
+    assert order.status()['status'] == 'TRANSACTED'
+
+
+def test_queue_ahead_shrinks_before_we_fill():
+    snaps = [snap(1, [o(1, 10.00, 500)], ASKS),
+             snap(2, [o(1, 10.00, 500, filled=200), o(2, 10.00, 100, tick=2)], ASKS),   # Fills ahead; 2 joins behind
+             snap(3, [o(1, 10.00, 500, filled=200), o(2, 10.00, 100, filled=50, tick=2)], ASKS)]
+    sim = FillSimulator(snaps)
+    order = sim.place(0, T, 'BUY', 400, 10.00)
+    assert order.queue_ahead == 500
+    sim.step(order)
+    assert order.queue_ahead == 300 and order.filled == 0
+    sim.step(order)   # An order that joined behind us trades: FIFO says we did too
+    assert order.filled == 50 and order.queue_ahead == 0
+
+
+def test_swept_level_fills_passively_at_our_price():
+    snaps = [snap(1, [o(1, 10.00, 500), o(2, 9.99, 500)], ASKS),
+             snap(2, [o(2, 9.99, 500)], ASKS)]
+    order = FillSimulator(snaps).simulate(0, T, 'BUY', 400, 10.00)
+    assert order.passive_qty == 400 and order.status()['vwap'] == 10.00
+
+
+def test_patience_then_cross():
+    snaps = [snap(t, [o(1, 10.00, 500)], ASKS) for t in (1, 2, 3, 4)]
+    sim = FillSimulator(snaps)
+    order = sim.simulate(0, T, 'BUY', 400, 10.00, patience_ticks=2)
+    assert order.n == 2 and order.state == 'OPEN' and order.filled == 0
+    order = sim.simulate(0, T, 'BUY', 400, 10.00, patience_ticks=2, cross=True)
+    assert order.aggressive_qty == 400 and order.state == 'TRANSACTED'
+
+
+def test_new_period_ends_the_wait():
+    snaps = [snap(9, [o(1, 10.00, 500)], ASKS), snap(1, [], [])]
+    order = FillSimulator(snaps).simulate(0, T, 'SELL', 100, 10.20, patience_ticks=5)
+    assert order.n == 0 and order.filled == 0
@@ -0,0 +1,74 @@
+import copy
+import pytest
+from final_utils import RITC
+from market_query import MarketQuery
+from rit_sim import snapshot_tick
+from synthetic import synthetic_market
+from tick_store import TickStoreWriter
+
+TICKS = 10   # Ticks per period of the test session
+
+
+@pytest.fixture(scope='module')
+def session(tmp_path_factory):
+    """Three periods of ticks 1..10 with ticks 1-3 of period 3 missing,
+    written across several segments."""
+    snaps = [copy.deepcopy(s) for s in synthetic_market(5, 'heavy_tenders', 30, ticks_per_period=TICKS)]
+    snaps = snaps[:20] + snaps[23:]
+    path = str(tmp_path_factory.mktemp("store"))
+    writer = TickStoreWriter(path, segment_snapshots=8)
+    for snap in snaps:
+        writer.append(snap)
+    writer.close()
+    return snaps, MarketQuery(path, ticks_per_period=TICKS)
+
+
+def test_periods_from_tick_resets(session):
+    snaps, q = session
+    assert len(q) == len(snaps)
+    assert q.periods == 3
+    assert [q.snapshot(n)['tick'] for n in q.period_range(3)] == list(range(4, 11))
+
+
+def test_at_tick_across_periods(session):
+    snaps, q = session
+    assert q.at_tick(5, period=1) == 4
+    assert q.at_tick(5, period=2) == 14
+    assert q.at_tick(10, period=2) == 19
+    assert q.at_tick(5) == 21          # Default: the last period
+    assert q.at_tick(10, period=1) == 9
+    # Nothing yet in period 3 at tick 2: never fall back to period 2's snapshot
+    assert q.at_tick(2, period=3) is None
+    assert q.book_at_tick(RITC, 2, period=3) is None
+
+
+def test_books_match_the_recording(session):
+    snaps, q = session
+    for n in (0, 13, len(snaps) - 1):
+        book = q.book(n, RITC)
+        best_bid = max(o['price'] for o in snaps[n]['ritc']['bids'])
+        assert book['bids'][0][0] == pytest.approx(best_bid)
+        assert q.snapshot(n)['tick'] == snapshot_tick(snaps[n])
+
+
+def test_time_lookup_and_ranges(session):
+    snaps, q = session
+    assert q.at_time(q.ts[0] - 1) is None
+    assert q.at_time(q.ts[12] + 0.5) == 12
+    assert list(q.tick_range(3, 6, period=2)) == [12, 13, 14]
+    assert list(q.tick_range(3, 6, period=0)) == [2, 3, 4, 12, 13, 14, 20, 21]
+    assert list(q.time_range(q.ts[5], q.ts[8])) == [5, 6, 7]
+
+
+def test_tenders_index(session):
+    snaps, q = session
+    seen = {}
+    for n, snap in enumerate(snaps):
+        for t in snap['tenders']:
+            seen.setdefault(t['tender_id'], []).append(n)
+    assert [t['tender_id'] for t in q.tenders()] == list(seen)
+    tender_id, sightings = next(iter(seen.items()))
+    tender = q.tender(tender_id)
+    assert (tender['first_seen'], tender['last_seen']) == (sightings[0], sightings[-1])
+    assert list(q.tender_sightings(tender_id)) == sightings
+    assert q.tender(-1) is None
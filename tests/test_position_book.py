@@ -0,0 +1,56 @@
+import numpy as np
+from position_book import PositionBook, LONG_RITC, SHORT_RITC, FEES_PER_SHARE
+
+SIZE = 1000
+STOP = 0.002   # 0.2% of notional: ~0.05/share, less than the ~0.12/share it costs to close
+
+
+def touch(ritc=(25.00, 25.02), usd=(1.0, 1.0), bull=(12.40, 12.42), bear=(12.50, 12.52)):
+    prices = {}
+    for name, (bid, ask) in (('ritc', ritc), ('usd', usd), ('bull', bull), ('bear', bear)):
+        prices[f"{name}_bid"], prices[f"{name}_ask"] = bid, ask
+    return prices
+
+
+def long_ritc_book():
+    """A long RITC position filled at the touch: RITC/USD at the ask, the basket at the bid."""
+    book = PositionBook(capacity=1)
+    trades = {'ritc': {'vwap': 25.02}, 'usd': {'vwap': 1.0}, 'bull': {'vwap': 12.40}, 'bear': {'vwap': 12.50}}
+    book.add(LONG_RITC, SIZE, trades, entry_time=0.0)
+    return book
+
+
+def test_mark_with_exit_costs_is_the_closing_cost():
+    book = long_ritc_book()
+    # Sell RITC at the bid (-0.02), buy BULL and BEAR back at the ask (-0.04), plus fees
+    assert np.isclose(book.mark(touch())[0], -(0.06 + FEES_PER_SHARE) * SIZE)
+
+
+def test_fresh_position_is_not_stopped_out_by_its_closing_cost():
+    book = long_ritc_book()
+    slots, _ = book.exit_signals(book.mark(touch(), exit_costs=False), now=1.0, stop_loss_pct=STOP)
+    assert len(slots) == 0
+    # Judged on exit-cost marks the same stop fires before the market moves
+    slots, _ = book.exit_signals(book.mark(touch()), now=1.0, stop_loss_pct=STOP)
+    assert len(slots) == 1
+
+
+def test_adverse_move_stops_out():
+    book = long_ritc_book()
+    marks = book.mark(touch(ritc=(24.80, 24.82)), exit_costs=False)
+    slots, reasons = book.exit_signals(marks, now=1.0, stop_loss_pct=STOP)
+    assert list(slots) == [0] and list(reasons) == ['stop_loss']
+
+
+def test_exit_priority_and_closed_slots():
+    book = PositionBook(capacity=1)
+    trades = {'ritc': {'vwap': 25.0}, 'usd': {'vwap': 1.0}, 'bull': {'vwap': 12.5}, 'bear': {'vwap': 12.5}}
+    a = book.add(SHORT_RITC, SIZE, trades, entry_time=0.0)
+    b = book.add(SHORT_RITC, SIZE, trades, entry_time=100.0)   # Grows the book
+    assert len(book) == 2
+    marks = np.array([-1e6, -1e6])
+    slots, reasons = book.exit_signals(marks, now=110.0, stop_loss_pct=STOP, max_hold_time=60)
+    assert dict(zip(slots, reasons)) == {a: 'time', b: 'stop_loss'}
+    book.close(a)
+    assert book.mark(touch())[a] == 0.0
+    assert list(book.open_slots()) == [b]
@@ -0,0 +1,48 @@
+import numpy as np
+from rolling_stats import RollingWindow, RollingStats, RESYNC_EVERY
+
+
+def test_window_matches_numpy():
+    rng = np.random.default_rng(0)
+    xs = rng.normal(size=(200, 2))
+    win = RollingWindow(30, width=2)
+    for i, x in enumerate(xs):
+        win.update(x)
+        tail = xs[max(0, i - 29):i + 1]
+        assert np.allclose(win.mean(), tail.mean(axis=0))
+        assert np.allclose(win.std(), tail.std(axis=0))
+    assert win.full
+    assert np.array_equal(win.values(), xs[-30:])
+
+
+def test_window_resyncs_after_drift():
+    win = RollingWindow(4)
+    for x in [1e9, 1.0, 2.0, 3.0] + [5.0] * (RESYNC_EVERY * 4):
+        win.update([x])
+    assert win.mean()[0] == 5.0
+    assert win.var()[0] == 0.0
+
+
+def test_ewma_matches_direct_weights():
+    """pandas ewm(span, adjust=False): weights alpha * (1 - alpha)^k, the
+    first observation carrying the remaining (1 - alpha)^(n-1)."""
+    xs = np.random.default_rng(1).normal(size=100)
+    stats = RollingStats(windows=(10,), spans=(20,))
+    for x in xs:
+        stats.update([x])
+    alpha = 2 / 21
+    w = alpha * (1 - alpha) ** np.arange(len(xs))[::-1]
+    w[0] = (1 - alpha) ** (len(xs) - 1)
+    mean = (w * xs).sum()
+    assert np.isclose(stats.mean(span=20)[0], mean)
+    assert np.isclose(stats.std(span=20)[0] ** 2, (w * (xs - mean) ** 2).sum())
+
+
+def test_zscore_zero_until_spread_moves():
+    stats = RollingStats(windows=(5,))
+    for _ in range(5):
+        stats.update([2.0])
+    assert stats.ready()
+    assert stats.zscore()[0] == 0.0
+    stats.update([4.0])
+    assert stats.zscore()[0] > 0
@@ -0,0 +1,144 @@
+# TICK CLOCK
+# Detects RIT tick transitions with adaptive polling and dispatches every
+# registered strategy exactly once per observed tick with one shared snapshot.
+
+from final_utils import *
+from collections import deque
+
+# Polling cadence
+TICK_SECONDS = 1.0        # Initial guess for the case tick length
+FAST_POLL_SECONDS = 0.02  # Poll interval once we are near the expected boundary
+IDLE_POLL_SECONDS = 0.5   # Poll interval while the case is not ACTIVE
+BOUNDARY_GUARD = 0.08     # Start fast polling this long before the boundary
+LATENCY_WINDOW = 500      # Samples kept per latency series
+
+
+class LatencyStats():
+    """Rolling latency samples (seconds) with summary percentiles."""
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return {'count': self.count, 'errors': self.errors}
+        arr = np.fromiter(self.samples, dtype=float)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': arr.mean() * 1000,
+            'p50_ms': np.percentile(arr, 50) * 1000,
+            'p95_ms': np.percentile(arr, 95) * 1000,
+            'max_ms': arr.max() * 1000,
+        }
+
+
+class TickClock():
+    def __init__(self, tick_seconds=TICK_SECONDS):
+        self.callbacks = []           # [(name, fn(tick, snapshot))]
+        self.tick_seconds = tick_seconds
+        self.last_tick = None
+        self.last_change = None       # time.time() the last transition was seen
+        self.status = None
+
+        self.polls = 0
+        self.ticks_dispatched = 0
+        self.ticks_missed = 0
+        self.snapshot_latency = LatencyStats()
+        self.decision_latency = LatencyStats()   # transition seen -> all callbacks done
+        self.callback_latency = {}
+
+    def register(self, name, fn):
+        """Register fn(tick, snapshot) to run once per tick."""
+        self.callbacks.append((name, fn))
+        self.callback_latency[name] = LatencyStats()
+
+    def _poll(self):
+        self.polls += 1
+        tick, status = get_tick_status()
+        self.status = status
+        return tick, status
+
+    def _next_poll_delay(self):
+        if self.status != 'ACTIVE' or self.last_change is None:
+            return IDLE_POLL_SECONDS if self.status != 'ACTIVE' else FAST_POLL_SECONDS
+        until_boundary = self.last_change + self.tick_seconds - time.time()
+        if until_boundary > BOUNDARY_GUARD:
+            return until_boundary - BOUNDARY_GUARD
+        return FAST_POLL_SECONDS
+
+    def _observe_transition(self, tick, now):
+        # EWMA of observed seconds-per-tick (multi-tick jumps are averaged)
+        if self.last_tick is not None and self.last_change is not None and tick > self.last_tick:
+            observed = (now - self.last_change) / (tick - self.last_tick)
+            if 0.1 * self.tick_seconds < observed < 5 * self.tick_seconds:
+                self.tick_seconds = 0.7 * self.tick_seconds + 0.3 * observed
+        if self.last_tick is not None and tick > self.last_tick + 1:
+            self.ticks_missed += tick - self.last_tick - 1
+        self.last_tick = tick
+        self.last_change = now
+
+    def wait_for_tick(self):
+        """Block until a new ACTIVE tick is observed; returns (tick, status)."""
+        while True:
+            tick, status = self._poll()
+            if status == 'ACTIVE' and tick != self.last_tick:
+                self._observe_transition(tick, time.time())
+                return tick, status
+            if status != 'ACTIVE':
+                self.last_tick = None
+                self.last_change = None
+            sleep(self._next_poll_delay())
+
+    def dispatch(self, tick, before_callbacks=None):
+        seen_at = self.last_change or time.time()
+        t0 = time.perf_counter()
+        snapshot = get_market_snapshot(tick)
+        self.snapshot_latency.add(time.perf_counter() - t0)
+        if before_callbacks is not None:
+            before_callbacks(snapshot)   # e.g. publish to shared memory first
+        # Left installed after dispatch so background strategies still share
+        # it; SNAPSHOT_MAX_AGE retires it and the next tick replaces it.
+        set_snapshot(snapshot)
+        for name, fn in self.callbacks:
+            c0 = time.perf_counter()
+            try:
+                fn(tick, snapshot)
+            except Exception as e:
+                self.callback_latency[name].errors += 1
+                print(f"[ERROR] {name} failed on tick {tick}: {e}")
+            self.callback_latency[name].add(time.perf_counter() - c0)
+        self.decision_latency.add(time.time() - seen_at)
+        self.ticks_dispatched += 1
+
+    def run(self, max_ticks=None):
+        while max_ticks is None or self.ticks_dispatched < max_ticks:
+            tick, _ = self.wait_for_tick()
+            self.dispatch(tick)
+
+    def latency_report(self):
+        return {
+            'tick_seconds': self.tick_seconds,
+            'polls': self.polls,
+            'polls_per_tick': self.polls / max(1, self.ticks_dispatched),
+            'ticks_dispatched': self.ticks_dispatched,
+            'ticks_missed': self.ticks_missed,
+            'snapshot': self.snapshot_latency.summary(),
+            'decision': self.decision_latency.summary(),
+            'callbacks': {name: st.summary() for name, st in self.callback_latency.items()},
+        }
+
+    def print_report(self):
+        report = self.latency_report()
+        rows = [[name, st.get('count', 0), st.get('errors', 0),
+                 f"{st.get('mean_ms', 0):.1f}", f"{st.get('p95_ms', 0):.1f}", f"{st.get('max_ms', 0):.1f}"]
+                for name, st in [('snapshot', report['snapshot']), ('decision', report['decision'])]
+                + list(report['callbacks'].items())]
+        print(f"Ticks: {report['ticks_dispatched']} dispatched, {report['ticks_missed']} missed, "
+              f"{report['polls_per_tick']:.1f} polls/tick, tick={report['tick_seconds']:.3f}s")
+        print(tabulate(rows, headers=['series', 'count', 'errors', 'mean ms', 'p95 ms', 'max ms']))
@@ -0,0 +1,265 @@
+# COLUMNAR TICK STORE
+# Aggregated book levels of every snapshot as fixed-dtype columns (tick,
+# timestamp, ticker, side, level, price, qty) in memory-mapped .npy segment
+# files, plus a per-segment snapshot index and tender table and a small
+# index.json. Opening a session maps the files instead of unpickling one
+# nested dict per snapshot. convert_pickles() migrates the old output/*.pkl
+# recordings.
+
+import glob
+import json
+import shutil
+from final_utils import *
+from rit_sim import snapshot_tick
+
+STORE_DIR = "output/tick_store"
+SEGMENT_SNAPSHOTS = 5000     # Snapshots per segment file set
+PRICE_SCALE = 10000          # Prices stored as integer 1/10000ths (USD quotes to 4 dp)
+QTY_MAX = np.iinfo(np.int32).max   # USD depth (2,147,480,000 per order) is clipped here
+STORE_VERSION = 1
+
+ROW_COLUMNS = {
+    'tick': np.int16,
+    'timestamp': np.float32,   # Seconds after the segment's base_ts
+    'ticker': np.int8,         # Index into SNAPSHOT_TICKERS
+    'side': np.int8,           # 0 bids, 1 asks
+    'level': np.int8,          # 0 = touch
+    'price': np.int32,         # x PRICE_SCALE
+    'qty': np.int32,
+}
+SNAP_DTYPE = np.dtype([('tick', np.int32), ('ts', np.float64), ('row_start', np.int64), ('row_end', np.int64)])
+TENDER_DTYPE = np.dtype([('snap', np.int32), ('tender_id', np.int64), ('tick', np.int32), ('expires', np.int32),
+                         ('quantity', np.float64), ('price', np.float64), ('action', np.int8),
+                         ('is_fixed_bid', np.bool_)])
+SIDES = ('bids', 'asks')
+TICKER_CODES = {t: i for i, t in enumerate(SNAPSHOT_TICKERS)}
+
+
+def snapshot_time(snap):
+    return snap['ts'] if 'ts' in snap else datetime.datetime.fromisoformat(snap['timestamp']).timestamp()
+
+
+class TickStoreWriter():
+    """Appends snapshots and writes a segment every `segment_snapshots`.
+    A segment directory is renamed into place only once complete."""
+    def __init__(self, path=STORE_DIR, segment_snapshots=SEGMENT_SNAPSHOTS):
+        self.path = path
+        self.segment_snapshots = segment_snapshots
+        os.makedirs(path, exist_ok=True)
+        self.index = _read_index(path)
+        self._reset()
+
+    def _reset(self):
+        self.rows = {name: [] for name in ROW_COLUMNS}
+        self.snaps = []
+        self.tenders = []
+        self.sources = []
+        self.nrows = 0
+
+    def append(self, snap, source=None):
+        """Add one snapshot; `source` (a file name) is kept in index.json
+        with the segment it lands in."""
+        if source is not None:
+            self.sources.append(source)
+        tick = snap.get('tick') or snapshot_tick(snap)
+        ts = snapshot_time(snap)
+        start = self.nrows
+        for ticker in SNAPSHOT_TICKERS:
+            for side_code, side in enumerate(SIDES):
+                levels = aggregate_levels(snap[ticker.lower()][side])
+                n = len(levels)
+                if not n:
+                    continue
+                prices, qtys = zip(*levels)
+                self.rows['tick'].append(np.full(n, tick))
+                self.rows['timestamp'].append(np.full(n, ts))
+                self.rows['ticker'].append(np.full(n, TICKER_CODES[ticker]))
+                self.rows['side'].append(np.full(n, side_code))
+                self.rows['level'].append(np.arange(n))
+                self.rows['price'].append(np.rint(np.array(prices) * PRICE_SCALE))
+                self.rows['qty'].append(np.minimum(qtys, QTY_MAX))
+                self.nrows += n
+        self.snaps.append((tick, ts, start, self.nrows))
+        tenders = snap.get('tenders') or ([snap['tender']] if snap.get('tender') else [])
+        for t in tenders:
+            self.tenders.append((len(self.snaps) - 1, t['tender_id'], t.get('tick', tick), t.get('expires', tick),
+                                 t['quantity'], t['price'], 1 if t['action'] == 'BUY' else -1, t['is_fixed_bid']))
+        if len(self.snaps) >= self.segment_snapshots:
+            self.flush()
+
+    def flush(self):
+        if not self.snaps:
+            return None
+        name = f"seg_{len(self.index['segments']):06d}"
+        final = os.path.join(self.path, name)
+        tmp = final + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        snaps = np.array(self.snaps, dtype=SNAP_DTYPE)
+        base_ts = float(snaps['ts'][0])
+        for col, dtype in ROW_COLUMNS.items():
+            parts = self.rows[col]
+            arr = np.concatenate(parts) if parts else np.empty(0)
+            if col == 'timestamp':
+                arr = arr - base_ts
+            np.save(os.path.join(tmp, f"{col}.npy"), arr.astype(dtype))
+        np.save(os.path.join(tmp, "snaps.npy"), snaps)
+        np.save(os.path.join(tmp, "tenders.npy"), np.array(self.tenders, dtype=TENDER_DTYPE))
+        os.replace(tmp, final)
+
+        self.index['segments'].append({
+            'name': name, 'snapshots': len(snaps), 'rows': self.nrows, 'base_ts': base_ts,
+            'tick_min': int(snaps['tick'].min()), 'tick_max': int(snaps['tick'].max()),
+            'ts_min': base_ts, 'ts_max': float(snaps['ts'][-1]), 'sources': self.sources})
+        _write_index(self.path, self.index)
+        self._reset()
+        return final
+
+    def close(self):
+        self.flush()
+
+    def converted_sources(self):
+        return {src for seg in self.index['segments'] for src in seg.get('sources', ())}
+
+
+def _read_index(path):
+    try:
+        with open(os.path.join(path, "index.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': STORE_VERSION, 'price_scale': PRICE_SCALE, 'tickers': list(SNAPSHOT_TICKERS),
+                'segments': []}
+
+
+def _write_index(path, index):
+    tmp = os.path.join(path, "index.json.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, os.path.join(path, "index.json"))
+
+
+class Segment():
+    """One segment's columns, memory-mapped read-only (nothing is read
+    until a slice is touched)."""
+    def __init__(self, path, meta):
+        self.meta = meta
+        self.base_ts = meta['base_ts']
+        self.columns = {col: np.load(os.path.join(path, f"{col}.npy"), mmap_mode='r') for col in ROW_COLUMNS}
+        self.snaps = np.load(os.path.join(path, "snaps.npy"), mmap_mode='r')
+        self.tenders = np.load(os.path.join(path, "tenders.npy"))
+
+    def __len__(self):
+        return len(self.snaps)
+
+    def rows(self, i):
+        """Row slice of local snapshot i (views, no copy)."""
+        start, end = int(self.snaps['row_start'][i]), int(self.snaps['row_end'][i])
+        return {col: arr[start:end] for col, arr in self.columns.items()}
+
+    def book(self, i, ticker, side):
+        """(prices, qtys) of one side of local snapshot i, touch first."""
+        r = self.rows(i)
+        mask = (r['ticker'] == TICKER_CODES[ticker]) & (r['side'] == SIDES.index(side))
+        return r['price'][mask] / PRICE_SCALE, r['qty'][mask]
+
+
+class TickStore():
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        self.index = _read_index(path)
+        self.segments = [Segment(os.path.join(path, m['name']), m) for m in self.index['segments']]
+        self.offsets = np.cumsum([0] + [len(seg) for seg in self.segments])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def locate(self, n):
+        """Global snapshot number -> (segment, local index)."""
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        k = int(np.searchsorted(self.offsets, n, side='right')) - 1
+        return self.segments[k], n - int(self.offsets[k])
+
+    def book(self, n, ticker, side):
+        seg, i = self.locate(n)
+        return seg.book(i, ticker, side)
+
+    def snapshot(self, n):
+        """Snapshot n in the aggregated-book layout (price / quantity per
+        level, no order ids) that the strategies and signals accept."""
+        seg, i = self.locate(n)
+        r = seg.rows(i)
+        meta = seg.snaps[i]
+        snap = {'tick': int(meta['tick']), 'ts': float(meta['ts']),
+                'timestamp': datetime.datetime.fromtimestamp(float(meta['ts'])).isoformat()}
+        for ticker, code in TICKER_CODES.items():
+            book = {}
+            for side_code, side in enumerate(SIDES):
+                mask = (r['ticker'] == code) & (r['side'] == side_code)
+                book[side] = [{'price': float(p) / PRICE_SCALE, 'quantity': float(q)}
+                              for p, q in zip(r['price'][mask], r['qty'][mask])]
+            snap[ticker.lower()] = book
+        tenders = seg.tenders[seg.tenders['snap'] == i]
+        snap['tenders'] = [{'tender_id': int(t['tender_id']), 'tick': int(t['tick']), 'expires': int(t['expires']),
+                            'ticker': RITC, 'quantity': float(t['quantity']), 'price': float(t['price']),
+                            'action': 'BUY' if t['action'] > 0 else 'SELL', 'is_fixed_bid': bool(t['is_fixed_bid'])}
+                           for t in tenders]
+        snap['tender'] = snap['tenders'][0] if snap['tenders'] else {}
+        return snap
+
+    def iter_snapshots(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for n in range(start, stop):
+            yield self.snapshot(n)
+
+    def column(self, name):
+        """A whole column across segments (copies if there is more than one)."""
+        parts = [seg.columns[name] for seg in self.segments]
+        if name == 'timestamp':
+            return np.concatenate([seg.base_ts + p.astype(np.float64) for seg, p in zip(self.segments, parts)])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def snapshot_index(self):
+        """tick / ts of every snapshot in order (copies)."""
+        return np.concatenate([np.asarray(seg.snaps) for seg in self.segments]) if self.segments else np.empty(0, SNAP_DTYPE)
+
+    def disk_bytes(self):
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.path, "**", "*"), recursive=True)
+                   if os.path.isfile(p))
+
+
+def convert_pickles(pattern="output/*.pkl", path=STORE_DIR, segment_snapshots=SEGMENT_SNAPSHOTS):
+    """Append every readable recorded pickle (in file order) to the store at
+    `path`, skipping files already in it, so a rerun only adds new
+    recordings; prints the size change and the time to reopen the store."""
+    writer = TickStoreWriter(path, segment_snapshots)
+    done = writer.converted_sources()
+    pkl_bytes, converted, skipped = 0, 0, 0
+    for file in sorted(glob.glob(pattern)):
+        name = os.path.basename(file)
+        if name in done:
+            skipped += 1
+            continue
+        try:
+            with open(file, 'rb') as f:
+                snap = pickle.load(f)
+        except Exception:
+            continue
+        writer.append(snap, source=name)
+        pkl_bytes += os.path.getsize(file)
+        converted += 1
+    writer.close()
+
+    t0 = time.perf_counter()
+    store = TickStore(path)
+    store.column('price').sum()   # Touch every page of one column
+    load_ms = (time.perf_counter() - t0) * 1000
+    store_bytes = store.disk_bytes()
+    print(f"Tick store: {converted} snapshots added ({skipped} already converted), {pkl_bytes / 1e3:.0f} KB of pickles -> "
+          f"{store_bytes / 1e3:.0f} KB ({pkl_bytes / max(store_bytes, 1):.1f}x smaller), opened in {load_ms:.1f} ms")
+    return store
+
+
+if __name__ == "__main__":
+    convert_pickles()